@@ -0,0 +1,214 @@
+# bench_carver.py
+
+"""
+Throughput and accuracy benchmark for FILE_CARVER on a synthetic disk image.
+
+Generates a deterministic image with synthetic_image.generate_image (or reuses
+one given with --image) and measures:
+  - scan_drive in each requested mode (mmap, streaming, parallel, skip_empty):
+    MB/s and precision/recall of the found files against the planted ground truth,
+  - find_all_occurrences for the JPEG/PNG/ZIP/PDF headers and footers, through
+    the pure Python search and every backend of lib/search_backends usable here,
+  - find_signature_occurrences for every default signature (the multi-pattern
+    matcher) against a bytes.find loop over the same patterns,
+  - get_fragments on pre-located headers/footers (assembly cost only),
+  - compute_entropy over the whole image in STREAM_CHUNK_SIZE blocks.
+Peak RSS is the process high-water mark after each stage, so it only grows.
+
+Run from the repository root:
+    python -m benchmarks.bench_carver --size 256 --json bench.json
+"""
+
+import argparse
+import json
+import mmap
+import os
+import sys
+import tempfile
+import time
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from file_carver import FILE_CARVER
+from lib import search_backends
+from lib.signature_set import SignatureSet
+from benchmarks.synthetic_image import BUILDERS, generate_image
+
+MB = 1024 * 1024
+
+
+def peak_rss_mb():
+    """Returns the peak resident set size of this process in MiB, or None where unsupported."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in KiB everywhere else.
+    return peak / MB if sys.platform == "darwin" else peak / 1024
+
+
+def accuracy(found_files, truth):
+    """
+    Returns precision and recall of found_files against the intact planted files.
+    A found file only counts if its extension, offset and size all match exactly.
+    Fragmented and truncated files are not expected to be recovered whole.
+    """
+    expected = {(t["extension"], t["offset"], t["size"]) for t in truth if t["kind"] == "intact"}
+    found = {(f["extension"], f["offset"], f["size"]) for f in found_files}
+    hits = len(expected & found)
+    return {
+        "found": len(found),
+        "expected": len(expected),
+        "true_positives": hits,
+        "precision": hits / len(found) if found else 0.0,
+        "recall": hits / len(expected) if expected else 0.0,
+    }
+
+
+def timed(function, *args, **kwargs):
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def stage(name, seconds, size, **extra):
+    return {"stage": name, "seconds": seconds, "mb_per_s": size / MB / seconds if seconds else None, "peak_rss_mb": peak_rss_mb(), **extra}
+
+
+def bench_scan(carver, image_path, image_size, truth, signatures, modes, workers):
+    results = []
+    for mode in modes:
+        if mode == "mmap":
+            found, seconds = timed(carver.scan_drive, image_path, signatures)
+        elif mode == "streaming":
+            found, seconds = timed(carver.scan_drive, image_path, signatures, streaming=True)
+        elif mode == "parallel":
+            found, seconds = timed(carver.scan_drive, image_path, signatures, workers=workers)
+        elif mode == "skip_empty":
+            found, seconds = timed(carver.scan_drive, image_path, signatures, skip_empty=True)
+        else:
+            raise ValueError(f"Unknown scan mode {mode!r}")
+        results.append(stage(f"scan_drive[{mode}]", seconds, image_size, **accuracy(found, truth)))
+    return results
+
+
+def bench_search(carver, mm, signatures):
+    needles = []
+    for sig in signatures:
+        for pattern in (sig["header"], sig["footer"]):
+            if pattern and pattern not in needles:
+                needles.append(pattern)
+    results = []
+    python_offsets, seconds = timed(lambda: [carver.find_all_python(mm, needle) for needle in needles])
+    results.append(stage("find_all_occurrences[python]", seconds, len(mm) * len(needles), hits=sum(map(len, python_offsets))))
+    selected, _ = search_backends.select_backend(mm, needles)
+    for name, backend in search_backends.available_backends().items():
+        offsets, seconds = timed(lambda: [backend(mm, needle) for needle in needles])
+        results.append(stage(f"find_all_occurrences[{name}]", seconds, len(mm) * len(needles), hits=sum(map(len, offsets)), matches_python=[list(o) for o in offsets] == python_offsets, selected=name == selected))
+    return results
+
+
+def bench_multi_search(carver, mm):
+    signatures = SignatureSet.default()
+    occurrences, seconds = timed(carver.find_signature_occurrences, mm, signatures)
+    results = [stage("find_signature_occurrences[multi_pattern]", seconds, len(mm), patterns=len(occurrences), hits=sum(map(len, occurrences.values())))]
+    per_pattern, seconds = timed(lambda: {pattern: list(search_backends.find_all_find(mm, pattern)) for pattern in occurrences})
+    results.append(stage("find_signature_occurrences[per_pattern]", seconds, len(mm), patterns=len(per_pattern), hits=sum(map(len, per_pattern.values())), matches_multi_pattern=per_pattern == occurrences))
+    return results
+
+
+def bench_fragments(carver, mm, signatures, gap_threshold):
+    occurrences = carver.find_signature_occurrences(mm, signatures)
+    start = time.perf_counter()
+    candidates = 0
+    for sig in signatures:
+        candidates += len(carver.get_fragments(
+            mm, sig["header"], sig["footer"], gap_threshold,
+            headers=occurrences[sig["header"]],
+            footers=occurrences[sig["footer"]] if sig["footer"] else None,
+            image_size=len(mm),
+            max_length=carver.max_carve_length(sig),
+            size_parser=carver.get_size_parser(sig),
+        ))
+    seconds = time.perf_counter() - start
+    return [stage("get_fragments", seconds, len(mm), candidates=candidates)]
+
+
+def bench_entropy(carver, mm):
+    view = memoryview(mm)
+    start = time.perf_counter()
+    for offset in range(0, len(mm), carver.STREAM_CHUNK_SIZE):
+        carver.compute_entropy(view[offset:offset + carver.STREAM_CHUNK_SIZE])
+    seconds = time.perf_counter() - start
+    view.release()
+    return [stage("compute_entropy", seconds, len(mm))]
+
+
+def print_report(report):
+    print(f"image: {report['image']} ({report['image_size'] / MB:.1f} MiB, seed {report['seed']}, {len(report['truth'])} planted files)")
+    print(f"{'stage':<32} {'seconds':>9} {'MB/s':>9} {'peak RSS':>10}  details")
+    for result in report["stages"]:
+        rss = f"{result['peak_rss_mb']:.0f} MiB" if result["peak_rss_mb"] is not None else "-"
+        mb_per_s = f"{result['mb_per_s']:.1f}" if result["mb_per_s"] is not None else "-"
+        details = ", ".join(f"{key}={value:.3f}" if isinstance(value, float) else f"{key}={value}" for key, value in result.items() if key not in ("stage", "seconds", "mb_per_s", "peak_rss_mb"))
+        print(f"{result['stage']:<32} {result['seconds']:>9.3f} {mb_per_s:>9} {rss:>10}  {details}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark FILE_CARVER on a synthetic disk image.")
+    parser.add_argument("--size", type=int, default=64, help="image size in MiB (default 64)")
+    parser.add_argument("--seed", type=int, default=0, help="random seed of the generated image")
+    parser.add_argument("--noise", type=float, default=0.1, help="fraction of random-noise clusters")
+    parser.add_argument("--image", help="image path; generated there if missing and kept afterwards")
+    parser.add_argument("--modes", default="mmap,streaming,parallel", help="comma-separated scan_drive modes (mmap, streaming, parallel, skip_empty)")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes for the parallel mode (default: CPU count)")
+    parser.add_argument("--gap-threshold", type=int, default=1024 * 1024, help="orphan merge threshold in bytes")
+    parser.add_argument("--json", help="also write the report to this JSON file")
+    args = parser.parse_args(argv)
+
+    carver = FILE_CARVER()
+    signatures = SignatureSet.default().select(extensions=BUILDERS)
+    image_path = args.image
+    temporary = image_path is None
+    if temporary:
+        handle, image_path = tempfile.mkstemp(suffix=".img")
+        os.close(handle)
+    try:
+        truth_path = image_path + ".truth.json"
+        if temporary or not os.path.exists(image_path):
+            truth, seconds = timed(generate_image, image_path, args.size * MB, args.seed, args.noise)
+            if not temporary:
+                with open(truth_path, "w") as f:
+                    json.dump(truth, f)
+        else:
+            with open(truth_path, "r") as f:
+                truth = json.load(f)
+        image_size = os.path.getsize(image_path)
+
+        stages = bench_scan(carver, image_path, image_size, truth, signatures, [mode for mode in args.modes.split(",") if mode], args.workers)
+        with open(image_path, "rb") as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            stages += bench_search(carver, mm, signatures)
+            stages += bench_multi_search(carver, mm)
+            stages += bench_fragments(carver, mm, signatures, args.gap_threshold)
+            stages += bench_entropy(carver, mm)
+        finally:
+            mm.close()
+    finally:
+        if temporary:
+            os.remove(image_path)
+
+    report = {"image": args.image or "(temporary)", "image_size": image_size, "seed": args.seed, "noise": args.noise, "truth": truth, "stages": stages}
+    print_report(report)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=4)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+# synthetic_image.py
+
+"""
+Deterministic synthetic disk-image generator for benchmarking the carver.
+
+The image is built cluster by cluster from a seeded random generator, so the
+same (size, seed, noise) always produces the same bytes. It contains:
+  - zeroed regions (never-written space),
+  - random noise regions (encrypted/compressed data, which produces the same
+    kind of accidental signature hits as real disks),
+  - planted JPEG, PNG, ZIP and PDF files at cluster-aligned offsets,
+  - fragmented JPEGs (split in two with a noise gap between the halves),
+  - truncated PNGs (cut off before IEND).
+
+generate_image returns the ground truth as a list of dictionaries with the
+extension, offset, size and kind ("intact", "fragmented" or "truncated") of
+every planted file.
+"""
+
+import io
+import random
+import struct
+import zipfile
+import zlib
+
+CLUSTER_SIZE = 4096
+
+
+def _random_bytes(rng, size):
+    # Same bytes as rng.randbytes(size), which needs Python 3.9 (getrandbits(0) fails before 3.9).
+    return rng.getrandbits(8 * size).to_bytes(size, "little") if size else b""
+
+
+def _no_ff(rng, size):
+    # JPEG entropy-coded data never contains a bare 0xFF, so markers cannot appear by accident.
+    return _random_bytes(rng, size).replace(b"\xff", b"\xfe")
+
+
+def make_jpeg(rng, size):
+    """A JFIF-style JPEG of exactly size bytes with a high-entropy body."""
+    head = b"\xff\xd8\xff\xe0" + struct.pack(">H", 16) + b"JFIF\x00\x01\x01\x00\x00\x01\x00\x01\x00\x00"
+    # Start of scan (one component, baseline) so the body is entropy-coded data to a marker walk.
+    head += b"\xff\xda" + struct.pack(">H", 8) + b"\x01\x01\x00\x00\x3f\x00"
+    return head + _no_ff(rng, size - len(head) - 2) + b"\xff\xd9"
+
+
+def _png_chunk(chunk_type, data):
+    return struct.pack(">I", len(data)) + chunk_type + data + struct.pack(">I", zlib.crc32(chunk_type + data))
+
+
+def make_png(rng, size):
+    """A PNG with valid chunk structure and CRCs whose IDAT pads it to exactly size bytes."""
+    head = b"\x89PNG\r\n\x1a\n" + _png_chunk(b"IHDR", struct.pack(">IIBBBBB", 256, 256, 8, 2, 0, 0, 0))
+    tail = _png_chunk(b"IEND", b"")
+    return head + _png_chunk(b"IDAT", _random_bytes(rng, size - len(head) - len(tail) - 12)) + tail
+
+
+def make_zip(rng, size):
+    """A stored (uncompressed) ZIP archive of roughly size bytes with random members."""
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_STORED) as archive:
+        remaining = size
+        member = 0
+        while remaining > 512:
+            length = min(remaining - 256, rng.randint(1024, 64 * 1024))
+            # A fixed timestamp keeps the archive (and the image) identical for the same seed.
+            archive.writestr(zipfile.ZipInfo(f"member_{member}.bin", date_time=(1980, 1, 1, 0, 0, 0)), _random_bytes(rng, length))
+            remaining -= length + 128
+            member += 1
+    return buffer.getvalue()
+
+
+# Maps every byte value onto printable PDF content-stream characters (about 5.5 bits/byte of entropy).
+_PDF_ALPHABET = b"abcdefghijklmnopqrstuvwxyz0123456789 \n()/<>[]"
+_PDF_TEXT = bytes(_PDF_ALPHABET[i % len(_PDF_ALPHABET)] for i in range(256))
+
+
+def make_pdf(rng, size):
+    """A minimal PDF whose content stream pads it to exactly size bytes and that ends with %%EOF."""
+    head = b"%PDF-1.4\n1 0 obj\n<< /Length 0 >>\nstream\n"
+    tail = b"\nendstream\nendobj\ntrailer\n<< /Root 1 0 R >>\n%%EOF"
+    body = _random_bytes(rng, size - len(head) - len(tail)).translate(_PDF_TEXT)
+    return head + body + tail
+
+
+BUILDERS = {"jpg": make_jpeg, "png": make_png, "zip": make_zip, "pdf": make_pdf}
+
+
+def generate_image(path, size, seed=0, noise=0.1, file_density=0.3):
+    """
+    Writes a synthetic image of size bytes to path and returns its ground truth.
+    noise is the fraction of clusters filled with random data, file_density the
+    fraction of clusters that start a planted file; the rest are zeroed.
+    """
+    rng = random.Random(seed)
+    truth = []
+    zero_cluster = bytes(CLUSTER_SIZE)
+    with open(path, "wb") as f:
+        position = 0
+        while position < size:
+            roll = rng.random()
+            if roll < file_density:
+                ext = rng.choice(sorted(BUILDERS))
+                data = BUILDERS[ext](rng, rng.randint(4 * 1024, 256 * 1024))
+                kind = "intact"
+                if ext == "jpg" and rng.random() < 0.2:
+                    # Fragmented: second half stored after a gap of noise clusters.
+                    half = (len(data) // 2 + CLUSTER_SIZE - 1) // CLUSTER_SIZE * CLUSTER_SIZE
+                    gap = rng.randint(1, 8) * CLUSTER_SIZE
+                    data = data[:half] + _random_bytes(rng, gap) + data[half:]
+                    kind = "fragmented"
+                elif ext == "png" and rng.random() < 0.2:
+                    data = data[:len(data) // 2]
+                    kind = "truncated"
+                if position + len(data) > size:
+                    data = b""
+                else:
+                    truth.append({"extension": ext, "offset": position, "size": len(data), "kind": kind})
+            elif roll < file_density + noise:
+                data = _random_bytes(rng, rng.randint(1, 16) * CLUSTER_SIZE)
+            else:
+                data = zero_cluster * rng.randint(1, 64)
+            data = data[:size - position]
+            # Pad to the next cluster boundary so every file starts cluster-aligned.
+            padding = -len(data) % CLUSTER_SIZE
+            data += bytes(min(padding, size - position - len(data)))
+            if not data:
+                data = zero_cluster[:min(CLUSTER_SIZE, size - position)]
+            f.write(data)
+            position += len(data)
+    return truth
@@ -0,0 +1,167 @@
+# cli.py
+
+"""
+Headless command-line front end for FILE_CARVER, for scripts and servers
+without a display. It never imports tkinter.
+
+The image is carved with FILE_CARVER.carve_pipeline (search, fragment
+assembly, verification and writing overlap as a pipeline). Found files go to
+stdout, either one line each (--format text) or as JSON lines
+(--format jsonl): one {"event": "found", ...} object per file, then one
+{"event": "summary", ...} object. Progress (MB/s, hits/s, ETA) goes to stderr,
+as JSON lines {"event": "progress", ...} in jsonl mode.
+
+Examples, from the repository root:
+    python cli.py disk.img --output recovered --categories image,archive
+    python cli.py /dev/sdb --unallocated-only --skip-empty --format jsonl --db scan.db
+    python cli.py disk.img --output recovered --dedup link
+    python cli.py disk.img --output recovered --extensions jpg,png,zip --bifragment
+"""
+
+import argparse
+import json
+import os
+import sys
+
+from file_carver import FILE_CARVER
+from lib.scan_db import ScanDatabase
+from lib.scan_stats import ScanStats
+from lib.signature_set import SignatureSet
+
+MB = 1024 * 1024
+
+
+def format_duration(seconds):
+    if seconds is None:
+        return "--:--"
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}" if hours else f"{minutes:02d}:{seconds:02d}"
+
+
+class ProgressPrinter:
+    """Writes carve_pipeline progress snapshots to a stream, in place on a terminal."""
+
+    def __init__(self, stream, as_json=False):
+        self.stream = stream
+        self.as_json = as_json
+        self.in_place = not as_json and stream.isatty()
+
+    def __call__(self, snapshot):
+        if self.as_json:
+            self.stream.write(json.dumps({"event": "progress", **snapshot}) + "\n")
+        else:
+            percent = 100 * snapshot["bytes_searched"] / snapshot["bytes_total"] if snapshot["bytes_total"] else 100.0
+            line = (f"searched {snapshot['bytes_searched'] / MB:.0f}/{snapshot['bytes_total'] / MB:.0f} MiB ({percent:.1f}%), "
+                    f"{snapshot['bytes_per_second'] / MB:.1f} MB/s, {snapshot['hits_per_second']:.0f} hits/s, "
+                    f"{snapshot['verified']}/{snapshot['candidates']} verified, {snapshot['found']} found, "
+                    f"ETA {format_duration(snapshot['eta'])}")
+            if self.in_place:
+                line = "\r" + line + ("\n" if snapshot["done"] else "")
+            else:
+                line += "\n"
+            self.stream.write(line)
+        self.stream.flush()
+
+
+def parse_list(value):
+    return [item.strip() for item in value.split(",") if item.strip()] if value else None
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Carve deleted files from a disk image or block device without the GUI.")
+    parser.add_argument("image", help="disk image file or block device to scan")
+    parser.add_argument("-o", "--output", help="directory to recover found files into (default: scan only)")
+    parser.add_argument("-w", "--workers", type=int, default=None, help="processes per search/verification pool (default: CPU count)")
+    parser.add_argument("--categories", help="comma-separated signature categories, e.g. image,archive")
+    parser.add_argument("--extensions", help="comma-separated extensions, e.g. jpg,png,zip")
+    parser.add_argument("--unallocated-only", action="store_true", help="only search space no file system allocates")
+    parser.add_argument("--skip-empty", action="store_true", help="skip long runs of zeroed/uniform blocks")
+    parser.add_argument("--bifragment", action="store_true", help="also recover JPEG/PNG/ZIP files split in two fragments (gap carving)")
+    parser.add_argument("--alignment", type=int, default=None, help="only match headers at multiples of this many bytes")
+    parser.add_argument("--gap-threshold", type=int, default=1024 * 1024, help="orphan fragment merge threshold in bytes")
+    parser.add_argument("--dedup", choices=("skip", "link"), help="do not write files identical to one already found: skip them or hardlink them")
+    parser.add_argument("--format", choices=("text", "jsonl"), default="text", help="output format of found files (default: text)")
+    parser.add_argument("--db", help="also save the results to this scan database (.db, or .json for the JSON format)")
+    parser.add_argument("--stats", action="store_true", help="record per-stage statistics and report them at the end")
+    parser.add_argument("--trace", help="write a JSON-lines statistics trace to this file (implies --stats)")
+    parser.add_argument("--progress-interval", type=float, default=1.0, help="seconds between progress reports")
+    parser.add_argument("-q", "--quiet", action="store_true", help="no progress reports")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    carver = FILE_CARVER()
+    as_json = args.format == "jsonl"
+
+    signatures = SignatureSet.default()
+    categories = parse_list(args.categories)
+    extensions = parse_list(args.extensions)
+    if categories or extensions:
+        try:
+            signatures = signatures.select(categories, extensions)
+        except ValueError as e:
+            print(f"error: {e}", file=sys.stderr)
+            return 2
+        if not len(signatures):
+            print("error: no signatures selected", file=sys.stderr)
+            return 2
+    if args.stats or args.trace:
+        carver.stats = ScanStats(trace_path=args.trace)
+    if args.output:
+        os.makedirs(args.output, exist_ok=True)
+    db = ScanDatabase()
+
+    def on_found(file_info):
+        db.add(file_info)
+        if as_json:
+            print(json.dumps({"event": "found", **file_info}), flush=True)
+        else:
+            print(f"{file_info['id']:>8}  {file_info['extension']:<6} offset {file_info['offset']:>14}  size {file_info['size']:>12}  entropy {file_info['entropy']:.2f}"
+                  + (f"  fragments {' '.join(f'{start}-{end}' for start, end in file_info['fragments'])}" if "fragments" in file_info else "")
+                  + (f"  duplicate of {file_info['duplicate_of']}" if "duplicate_of" in file_info else "")
+                  + (f"  {file_info['path']}" if "path" in file_info else ""), flush=True)
+
+    summary = {}
+
+    def progress(snapshot):
+        summary.update(snapshot)
+        if not args.quiet:
+            printer(snapshot)
+
+    printer = ProgressPrinter(sys.stderr, as_json)
+    try:
+        carver.carve_pipeline(
+            args.image, args.output, signatures, args.gap_threshold, args.workers, args.alignment,
+            unallocated_only=args.unallocated_only, skip_empty=args.skip_empty,
+            on_found=on_found, progress=progress, progress_interval=args.progress_interval, dedup=args.dedup,
+            bifragment=args.bifragment,
+        )
+    except KeyboardInterrupt:
+        print("interrupted", file=sys.stderr)
+        return 130
+    except OSError as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 1
+    finally:
+        carver.stats.close()
+
+    if args.db:
+        if args.db.lower().endswith(".json"):
+            db.export_json(args.db)
+        else:
+            db.save(args.db)
+    db.close()
+    if as_json:
+        summary_event = {"event": "summary", **summary}
+        if carver.stats.enabled:
+            summary_event["stats"] = carver.stats.as_dict()
+        print(json.dumps(summary_event))
+    elif carver.stats.enabled:
+        print(carver.stats.report(), file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
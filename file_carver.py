@@ -1,93 +1,1038 @@
+import bisect
 import sys
 import os
 import mmap
-import ctypes
-import platform
-import math
-from collections import Counter
-from lib import file_signatures
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from lib import bifragment, block_map, file_signatures, fs_allocation, search_backends
+from lib.dedup import DEDUP_MODES, ContentIndex
+from lib.fragment_assembler import FragmentAssembler
+from lib.entropy import EntropyEngine, add_histograms, byte_histogram, shannon_entropy
+from lib.scan_journal import ScanJournal, image_fingerprint
+from lib.size_parsers import SIZE_PARSERS, STRUCTURE_FORMATS
+from lib.structure_validators import MIN_TAIL, STRUCTURE_VALIDATORS
+from lib.scan_stats import NULL_STATS, ScanStats
+from lib.signature_set import SignatureSet
 
 
 class FILE_CARVER:
 
+    # Read size used by the streaming scan engine (a multiple of common sector/cluster sizes).
+    STREAM_CHUNK_SIZE = 4 * 1024 * 1024
+    # Smallest byte range handed to a single worker by the parallel scan engine.
+    MIN_SHARD_SIZE = 16 * 1024 * 1024
+    # Longest fragment carved for a signature without its own "max_size".
+    MAX_CARVE_LENGTH = 512 * 1024 * 1024
+    # Image bytes searched between two journal checkpoints, and candidates verified between two.
+    CHECKPOINT_INTERVAL = 256 * 1024 * 1024
+    CHECKPOINT_CANDIDATES = 1000
+    # Output files written concurrently by recover_fragments.
+    RECOVERY_WORKERS = 4
+    # Items (searched shards, candidate batches, accepted files) a carve_pipeline stage may run ahead
+    # of the next one, and candidates verified per worker task.
+    PIPELINE_DEPTH = 8
+    PIPELINE_BATCH = 64
+    # Integrity score weights and acceptance threshold used by verify_range.
+    HEADER_WEIGHT = 0.4
+    FOOTER_WEIGHT = 0.4
+    ENTROPY_WEIGHT = 0.2
+    SCORE_THRESHOLD = 0.7
+    # Sampled entropy: number and size of blocks, and how far from a threshold a sample must be to be trusted.
+    ENTROPY_SAMPLE_BLOCKS = 8
+    ENTROPY_SAMPLE_SIZE = 4096
+    ENTROPY_SAMPLE_MARGIN = 0.25
+    # Runs of zero/uniform blocks at least this long are skipped by skip_empty scans and end orphan fragments.
+    EMPTY_RUN_LENGTH = 64 * 1024
+    # Bifragment gap carving: cluster size, longest gap between the two fragments, how far before the
+    # structure check's failure point the first fragment may end, the candidates tried per header,
+    # and the candidates validated per worker task.
+    BIFRAGMENT_CLUSTER_SIZE = 4096
+    BIFRAGMENT_MAX_GAP = 4 * 1024 * 1024
+    BIFRAGMENT_SPLIT_WINDOW = 256 * 1024
+    BIFRAGMENT_MAX_CANDIDATES = 100000
+    BIFRAGMENT_BATCH = 256
+    # Instrumentation sink; assign a lib.scan_stats.ScanStats to record stage timings, hits and rejections.
+    stats = NULL_STATS
+
     # --- Low-Level Access Functions ---
-    def get_libc():
-        """Load the C library depending on the operating system."""
-        if platform.system() == "Windows":
-            return ctypes.cdll.msvcrt
-        else:
-            return ctypes.CDLL("libc.so.6")
+    # The C library with memmem's prototype declared, or None where it is unavailable (see lib/search_backends).
+    libc = search_backends.LIBC
 
 
-    libc = get_libc()
-    try:
-        libc.memmem.restype = ctypes.c_void_p
-    except AttributeError:
-        libc.memmem = None
+    def recover_fragment(self, image_path, fragment, destination_folder):
+        """
+        Recovers a single file fragment from the drive/image.
+        Given the fragment info (offset, size, extension), it copies the data out without buffering it whole.
+        """
+        return self.recover_fragments(image_path, [fragment], destination_folder, workers=1)[0]
 
 
-    def recover_fragment(image_path, fragment, destination_folder):
+    def recover_fragments(self, image_path, fragments, destination_folder, workers=RECOVERY_WORKERS, progress=None, dedup=None):
         """
-        Recovers a single file fragment from the drive/image.
-        Given the fragment info (offset, size, extension), it reads the data and writes it out.
+        Recovers many file fragments from the drive/image in one batch.
+        The image is opened once and fragments are processed in offset order so reads stay sequential;
+        each one is copied with copy_range (kernel-side where possible, bounded chunks otherwise) and
+        up to workers output files are written concurrently. Files carved in two fragments (with
+        "fragments", see carve_bifragments) are copied range by range.
+        With dedup="skip" or "link", fragments whose content is identical to a fragment at a lower offset
+        (see lib/dedup) are not copied: "skip" returns the first copy's path for them, "link" hardlinks
+        them to it (or skips where hardlinks are unsupported). Their dictionaries get "duplicate_of"
+        set to the id of the first copy.
+        If given, progress is called from the worker threads after each file as
+        progress(files_done, files_total, bytes_done, bytes_total, bytes_per_second).
+        Returns the recovered file paths in the order of fragments.
         """
-        ext = fragment["extension"]
-        offset = fragment["offset"]
-        size = fragment["size"]
+        self.check_dedup_mode(dedup)
+        paths = [None] * len(fragments)
+        order = sorted(range(len(fragments)), key=lambda index: fragments[index]["offset"])
+        state = {"files": 0, "bytes": 0}
+        lock = threading.Lock()
+        started = time.monotonic()
+
         with open(image_path, "rb") as f:
-            f.seek(offset)
-            data = f.read(size)
-        file_name = f"recovered_{fragment['id']}.{ext}"
-        dest_path = os.path.join(destination_folder, file_name)
-        with open(dest_path, "wb") as out:
-            out.write(data)
-        return dest_path
+            src_fd = f.fileno()
+            # Fragment index -> index of the fragment holding the first copy of the same content.
+            duplicates = {}
+            if dedup:
+                content_index = ContentIndex(self.file_reader(f))
+                with self.stats.stage("dedup"):
+                    for index in order:
+                        original = self.add_content(content_index, index, fragments[index])
+                        if original is not None:
+                            duplicates[index] = original
+                            fragments[index]["duplicate_of"] = fragments[original]["id"]
+                order = [index for index in order if index not in duplicates]
+            bytes_total = sum(fragments[index]["size"] for index in order)
+
+            def recovered(copied):
+                with lock:
+                    state["files"] += 1
+                    state["bytes"] += copied
+                    if progress:
+                        elapsed = time.monotonic() - started
+                        progress(state["files"], len(fragments), state["bytes"], bytes_total, state["bytes"] / elapsed if elapsed else 0.0)
+
+            def recover(index):
+                fragment = fragments[index]
+                dest_path = self.recovered_path(destination_folder, fragment)
+                with open(dest_path, "wb") as out, self.stats.stage("write", fragment["size"]):
+                    copied = sum(self.copy_range(src_fd, start, end - start, out.fileno()) for start, end in self.fragment_ranges(fragment))
+                paths[index] = dest_path
+                recovered(copied)
+
+            # Concurrent copies need positional reads; without os.pread the shared fd offset would race.
+            if workers <= 1 or not hasattr(os, "pread"):
+                for index in order:
+                    recover(index)
+            else:
+                with ThreadPoolExecutor(max_workers=workers) as executor:
+                    for _ in executor.map(recover, order):
+                        pass
+            for index, original in duplicates.items():
+                paths[index] = self.place_duplicate(dedup, paths[original], self.recovered_path(destination_folder, fragments[index]))
+                recovered(0)
+        return paths
+
+
+    def recovered_path(self, destination_folder, fragment):
+        """Returns the output path of a recovered fragment."""
+        return os.path.join(destination_folder, f"recovered_{fragment['id']}.{fragment['extension']}")
+
 
+    def check_dedup_mode(self, dedup):
+        if dedup is not None and dedup not in DEDUP_MODES:
+            raise ValueError(f"Unknown dedup mode {dedup!r} (expected one of {', '.join(DEDUP_MODES)})")
 
-    def scan_drive(self, image_path, signatures=file_signatures, gap_threshold=1024 * 1024):
+
+    def place_duplicate(self, dedup, original_path, dest_path):
+        """
+        Handles an output file whose content was already written to original_path: with dedup="link"
+        dest_path becomes a hardlink to it. Returns the path holding the content (dest_path when
+        linked, original_path when skipped or when the file system cannot hardlink).
+        """
+        if dedup == "link":
+            try:
+                if os.path.lexists(dest_path):
+                    os.remove(dest_path)
+                os.link(original_path, dest_path)
+                return dest_path
+            except (OSError, AttributeError):
+                pass
+        return original_path
+
+
+    def scan_drive(self, image_path, signatures=None, gap_threshold=1024 * 1024, streaming=False, chunk_size=STREAM_CHUNK_SIZE, workers=1, alignment=None, journal_path=None, on_found=None, extents=None, unallocated_only=False, skip_empty=False, bifragment=False):
         """
         Scans the given drive/image using the carving functions from file_carver.
         Instead of immediately writing recovered files, it collects file information.
+        All headers and footers are located in a single pass over the image before fragment assembly.
+        With streaming=True (or when the image cannot be memory-mapped, e.g. some block devices)
+        the image is read in chunks of chunk_size bytes instead of being mapped as a whole.
+        With workers > 1 the scan is sharded across that many processes (see scan_drive_parallel).
+        With alignment set (e.g. 512, 4096 or the cluster size), headers are only searched for at
+        offsets that are a multiple of it; footers are still matched at every byte.
+        With journal_path set, progress is checkpointed there and an interrupted scan of the
+        same image is resumed (see scan_drive_journaled).
+        If given, on_found is called with each found file's dictionary as soon as it is verified,
+        e.g. to stream results into a ScanDatabase.
+        signatures is a list of signature dictionaries or a compiled SignatureSet (e.g. a
+        SignatureSet.default().select(...) subset); the default is every known signature.
+        With extents (a list of (start, end) byte ranges) only headers and footers starting inside
+        them are searched for; with unallocated_only=True the search is restricted to the space no
+        file system allocates (see unallocated_extents), intersected with extents if both are given.
+        With skip_empty=True the image is first classified block by block (see classify_blocks):
+        runs of at least EMPTY_RUN_LENGTH bytes of zero/uniform blocks are left out of the search,
+        and orphan fragments end (and are never merged) across them.
+        With bifragment=True, JPEG, PNG and ZIP files split in two fragments are then recovered by
+        gap carving (see carve_bifragments); each replaces the (corrupt) contiguous carve at its offset,
+        if any, and on_found is only called once both passes are done.
         Returns a list of dictionaries with details about each found file.
         """
+        signatures = self.signature_set(signatures)
+        extents, empty_starts = self.scan_scope(image_path, signatures, extents, unallocated_only, skip_empty)
+        report = None if bifragment else on_found
+        if journal_path:
+            found_files = self.scan_drive_journaled(image_path, journal_path, signatures, gap_threshold, alignment, on_found=report, extents=extents, empty_starts=empty_starts)
+        elif streaming:
+            found_files = self.scan_drive_streaming(image_path, signatures, gap_threshold, chunk_size, alignment, report, extents, empty_starts)
+        elif workers is None or workers > 1:
+            found_files = self.scan_drive_parallel(image_path, signatures, gap_threshold, workers, alignment=alignment, on_found=report, extents=extents, empty_starts=empty_starts)
+        else:
+            found_files = self.scan_drive_mmap(image_path, signatures, gap_threshold, chunk_size, alignment, report, extents, empty_starts)
+        if bifragment:
+            bifragments = self.carve_bifragments(image_path, signatures, workers if workers is not None else os.cpu_count() or 1, extents=extents)
+            with open(image_path, "rb") as f:
+                found_files = self.merge_bifragments(self.file_reader(f), found_files, bifragments)
+            if on_found:
+                for file_info in found_files:
+                    on_found(file_info)
+        return found_files
+
+
+    def scan_drive_mmap(self, image_path, signatures=None, gap_threshold=1024 * 1024, chunk_size=STREAM_CHUNK_SIZE, alignment=None, on_found=None, extents=None, empty_starts=None):
+        """
+        Memory-mapped scan engine behind scan_drive (falls back to scan_drive_streaming when the
+        image cannot be mapped). Returns the same list of dictionaries as scan_drive.
+        """
+        signatures = self.signature_set(signatures)
         found_files = []
         with open(image_path, "rb") as f:
-            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except (ValueError, OSError):
+                mm = None
+            if mm is None:
+                return self.scan_drive_streaming(image_path, signatures, gap_threshold, chunk_size, alignment, on_found, extents, empty_starts)
+            if extents is None:
+                occurrences = self.find_signature_occurrences(mm, signatures, alignment=alignment)
+            else:
+                occurrences = self.find_extent_occurrences(mm, signatures, extents, alignment=alignment)
+            self.stats.count_hits(signatures, occurrences)
+            view = memoryview(mm)
+            read = lambda position, length: view[position:position + length]
+            entropy_engine = EntropyEngine(mm)
             file_counter = 0
             for sig in signatures:
                 ext = sig["extension"]
                 header = sig["header"]
                 footer = sig["footer"]
                 # Use the provided get_fragments function.
-                fragments = self.get_fragments(mm, header, footer, gap_threshold)
+                footers = occurrences[footer] if footer else None
+                fragments = self.get_fragments(mm, header, footer, gap_threshold, headers=occurrences[header], footers=footers, max_length=self.max_carve_length(sig), size_parser=self.get_size_parser(sig), empty_starts=empty_starts)
                 for frag in fragments:
                     start, end = frag
-                    carved_data = mm[start:end]
-                    if self.verify_file_integrity(carved_data, ext, header, footer):
+                    if self.verify_range(read, ext, header, footer, start, end):
+                        # Entropy is only needed for the report once a fragment is accepted.
+                        with self.stats.stage("entropy", end - start):
+                            entropy = entropy_engine.entropy(start, end)
                         file_counter += 1
-                        found_files.append({"id": file_counter, "extension": ext, "offset": start, "size": end - start, "entropy": self..compute_entropy(carved_data)})
+                        found_files.append({"id": file_counter, "extension": ext, "offset": start, "size": end - start, "entropy": entropy})
+                        if on_found:
+                            on_found(found_files[-1])
+            entropy_engine.close()
+            view.release()
             mm.close()
         return found_files
 
 
+    # --- Streaming Scan Engine ---
+    def scan_drive_streaming(self, image_path, signatures=None, gap_threshold=1024 * 1024, chunk_size=STREAM_CHUNK_SIZE, alignment=None, on_found=None, extents=None, empty_starts=None):
+        """
+        Streaming counterpart of scan_drive for raw block devices and images larger than the address space.
+        The image is read sequentially in fixed-size chunks into one reusable buffer, and each candidate
+        fragment is verified by reading it back in chunks, so memory use is bounded by chunk_size.
+        Returns the same list of dictionaries as scan_drive.
+        """
+        signatures = self.signature_set(signatures)
+        found_files = []
+        with open(image_path, "rb", buffering=0) as f:
+            occurrences, image_size = self.stream_signature_occurrences(f, signatures, chunk_size=chunk_size, alignment=alignment, extents=extents)
+            self.stats.count_hits(signatures, occurrences)
+            read = self.file_reader(f)
+            file_counter = 0
+            for sig in signatures:
+                ext = sig["extension"]
+                header = sig["header"]
+                footer = sig["footer"]
+                footers = occurrences[footer] if footer else None
+                fragments = self.get_fragments(None, header, footer, gap_threshold, headers=occurrences[header], footers=footers, image_size=image_size, max_length=self.max_carve_length(sig), size_parser=self.get_size_parser(sig), read=read, empty_starts=empty_starts)
+                for start, end in fragments:
+                    if self.verify_range(read, ext, header, footer, start, end):
+                        entropy = self.range_entropy(read, start, end, chunk_size)
+                        file_counter += 1
+                        found_files.append({"id": file_counter, "extension": ext, "offset": start, "size": end - start, "entropy": entropy})
+                        if on_found:
+                            on_found(found_files[-1])
+        return found_files
+
+
+    def stream_signature_occurrences(self, f, signatures, matcher=None, chunk_size=STREAM_CHUNK_SIZE, alignment=None, extents=None):
+        """
+        Feeds the open file f to the multi-signature matcher chunk by chunk using readinto.
+        Consecutive chunks overlap by the longest header/footer minus one byte so that no match
+        straddling a chunk boundary is lost or reported twice.
+        With extents (sorted (start, end) ranges), only those ranges are read (plus the overlap
+        past each end) and only matches starting inside them are reported.
+        Returns (occurrences, image_size), where occurrences has the same layout as find_signature_occurrences.
+        """
+        if matcher is None:
+            matcher = self.build_matcher(signatures, alignment)
+        occurrences = {pattern: [] for pattern in matcher.patterns}
+        lists = [occurrences[pattern] for pattern in matcher.patterns]
+        overlap = max(matcher.max_length - 1, 0)
+        buf = bytearray(chunk_size + overlap)
+        view = memoryview(buf)
+        started = time.perf_counter()
+        try:
+            if extents is None:
+                image_size = self.stream_range(f, matcher, lists, view, 0, None, overlap)
+                scanned = image_size
+            else:
+                scanned = 0
+                for start, end in extents:
+                    f.seek(start)
+                    scanned += min(self.stream_range(f, matcher, lists, view, start, end, overlap), end) - start
+                image_size = f.seek(0, os.SEEK_END)
+        finally:
+            view.release()
+        self.stats.add_stage("search", time.perf_counter() - started, scanned)
+        return occurrences, image_size
+
+
+    def stream_range(self, f, matcher, lists, view, start, end, overlap):
+        """
+        Streams f from its current position (image offset start) through matcher into lists, using the
+        buffer view (its length minus overlap is the chunk size). Matches starting at or after end are
+        not reported; end=None reads to the end of the image.
+        Returns the image offset where reading stopped (the image size when the end was reached).
+        """
+        chunk_size = len(view) - overlap
+        remaining = None if end is None else end - start + overlap
+        base = start  # Image offset of view[0].
+        carry = 0  # Bytes at the start of view kept from the previous chunk.
+        limit_end = float("inf") if end is None else end
+        while True:
+            want = chunk_size if remaining is None else min(chunk_size, remaining)
+            n = f.readinto(view[carry:carry + want]) if want else 0
+            if not n:
+                # End of the range: whatever is left in the carried tail can be reported in full.
+                for offset, pattern_id in matcher.iter_matches(view.obj, 0, carry, base):
+                    if base + offset >= limit_end:
+                        break
+                    lists[pattern_id].append(base + offset)
+                return base + carry
+            if remaining is not None:
+                remaining -= n
+            filled = carry + n
+            # Matches starting in the last `overlap` bytes may be cut short; leave them for the next chunk.
+            limit = min(filled - overlap, limit_end - base)
+            for offset, pattern_id in matcher.iter_matches(view.obj, 0, filled, base):
+                if offset >= limit:
+                    break
+                lists[pattern_id].append(base + offset)
+            carry = min(overlap, filled)
+            view[:carry] = view[filled - carry:filled]
+            base += filled - carry
+
+
+    # --- Parallel Scan Engine ---
+    def scan_drive_parallel(self, image_path, signatures=None, gap_threshold=1024 * 1024, workers=None, shard_size=None, alignment=None, on_found=None, extents=None, empty_starts=None):
+        """
+        Process-pool counterpart of scan_drive. The image is split into byte-range shards which
+        are searched concurrently, each worker opening its own mmap; every shard also reads the
+        longest header/footer length past its end so boundary matches are found, but only reports
+        matches starting inside its own range, so merged results contain no duplicates.
+        Candidate fragments are then verified concurrently in batches.
+        With extents, shards are cut from those (start, end) ranges only.
+        workers defaults to os.cpu_count(). Returns the same list of dictionaries as scan_drive.
+        """
+        if workers is None:
+            workers = os.cpu_count() or 1
+        signatures = self.signature_set(signatures)
+        image_size = self.get_image_size(image_path)
+        if image_size == 0:
+            return []
+        if extents is None:
+            extents = [(0, image_size)]
+        if shard_size is None:
+            shard_size = max(self.MIN_SHARD_SIZE, -(-sum(end - start for start, end in extents) // (workers * 4)))
+        # Keep shard boundaries on the streaming chunk grid so shards read whole pages.
+        shard_size = -(-shard_size // self.STREAM_CHUNK_SIZE) * self.STREAM_CHUNK_SIZE
+        shards = fs_allocation.split_extents(extents, shard_size)
+
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            # Search phase: shard results arrive in shard order, so concatenation keeps offsets sorted.
+            occurrences = {}
+            for shard_occurrences, shard_stats in executor.map(_scan_shard, [(image_path, signatures, start, end, alignment, self.stats.enabled, self.stats.tracing) for start, end in shards]):
+                for pattern, offsets in shard_occurrences.items():
+                    occurrences.setdefault(pattern, []).extend(offsets)
+                if shard_stats:
+                    self.stats.merge(shard_stats)
+            self.stats.count_hits(signatures, occurrences)
+
+            # Fragment assembly only needs the offsets plus a few header reads for size parsing.
+            with open(image_path, "rb") as f:
+                candidates = self.assemble_candidates(occurrences, signatures, gap_threshold, image_size, self.file_reader(f), empty_starts)
+
+            # Verification phase: interleaved batches spread large and small fragments evenly.
+            batch_count = min(len(candidates), workers * 4)
+            entropies = {}
+            batches = [(image_path, list(range(i, len(candidates), batch_count)), candidates[i::batch_count], self.stats.enabled, self.stats.tracing) for i in range(batch_count)]
+            for verified, batch_stats in executor.map(_verify_batch, batches):
+                entropies.update(verified)
+                if batch_stats:
+                    self.stats.merge(batch_stats)
+
+        found_files = []
+        for index, (ext, header, footer, start, end) in enumerate(candidates):
+            if index in entropies:
+                found_files.append({"id": len(found_files) + 1, "extension": ext, "offset": start, "size": end - start, "entropy": entropies[index]})
+                if on_found:
+                    on_found(found_files[-1])
+        return found_files
+
+
+    # --- Journaled (Resumable) Scan ---
+    def scan_drive_journaled(self, image_path, journal_path, signatures=None, gap_threshold=1024 * 1024, alignment=None, checkpoint_interval=None, on_found=None, extents=None, empty_starts=None):
+        """
+        Checkpointed counterpart of scan_drive. The search runs over consecutive regions of
+        checkpoint_interval bytes and the hits of each region are appended to the journal at
+        journal_path; verified files are appended every CHECKPOINT_CANDIDATES candidates.
+        If the journal belongs to the same image (size and sampled fingerprint) and the same scan
+        parameters, the scan resumes after the last checkpoint instead of starting over.
+        With extents, only those (start, end) ranges are searched; they are part of the scan parameters,
+        as is whether orphan fragments are cut at empty_starts (see scan_drive's skip_empty).
+        Returns the same list of dictionaries as scan_drive.
+        """
+        if checkpoint_interval is None:
+            checkpoint_interval = self.CHECKPOINT_INTERVAL
+        signatures = self.signature_set(signatures)
+        with open(image_path, "rb") as f:
+            image_size = f.seek(0, os.SEEK_END)
+            header = {
+                "image_size": image_size,
+                "fingerprint": image_fingerprint(f, image_size),
+                "signatures": [[sig["extension"], sig["header"].hex(), sig["footer"].hex() if sig["footer"] else None, self.max_carve_length(sig)] for sig in signatures],
+                "gap_threshold": gap_threshold,
+                "alignment": alignment,
+                "extents": [list(extent) for extent in extents] if extents is not None else None,
+                "empty_run_length": self.EMPTY_RUN_LENGTH if empty_starts is not None else None,
+            }
+            journal = ScanJournal(journal_path, header)
+            try:
+                if image_size == 0:
+                    return []
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                view = memoryview(mm)
+                read = lambda position, length: view[position:position + length]
+                entropy_engine = EntropyEngine(mm)
+                matcher = self.build_matcher(signatures, alignment)
+                regions = fs_allocation.split_extents(extents if extents is not None else [(0, image_size)], checkpoint_interval)
+                for region_start, region_end in regions:
+                    if region_end <= journal.search_end:
+                        continue
+                    journal.record_search(region_end, self.find_signature_occurrences(mm, signatures, matcher, region_start, region_end))
+
+                occurrences = {pattern: journal.occurrences.get(pattern, []) for pattern in matcher.patterns}
+                self.stats.count_hits(signatures, occurrences)
+                candidates = self.assemble_candidates(occurrences, signatures, gap_threshold, image_size, lambda position, length: mm[position:position + length], empty_starts)
+                found = []
+                for index in range(journal.verify_next, len(candidates)):
+                    ext, header_bytes, footer, start, end = candidates[index]
+                    if self.verify_range(read, ext, header_bytes, footer, start, end):
+                        with self.stats.stage("entropy", end - start):
+                            entropy = entropy_engine.entropy(start, end)
+                        found.append({"extension": ext, "offset": start, "size": end - start, "entropy": entropy})
+                    if (index + 1) % self.CHECKPOINT_CANDIDATES == 0:
+                        journal.record_verify(index + 1, found)
+                        found = []
+                if journal.verify_next < len(candidates):
+                    journal.record_verify(len(candidates), found)
+                entropy_engine.close()
+                view.release()
+                mm.close()
+            finally:
+                journal.close()
+        found_files = [{"id": index + 1, **file_info} for index, file_info in enumerate(journal.found)]
+        if on_found:
+            for file_info in found_files:
+                on_found(file_info)
+        return found_files
+
+
+    def assemble_candidates(self, occurrences, signatures, gap_threshold, image_size, read, empty_starts=None):
+        """
+        Runs fragment assembly for every signature from precomputed header/footer offsets;
+        read(position, length) gives size parsers access to the image and empty_starts is passed
+        on to get_fragments.
+        Returns (extension, header, footer, start, end) tuples in the order scan_drive verifies them.
+        """
+        candidates = []
+        for sig in signatures:
+            header = sig["header"]
+            footer = sig["footer"]
+            footers = occurrences[footer] if footer else None
+            for start, end in self.get_fragments(None, header, footer, gap_threshold, headers=occurrences[header], footers=footers, image_size=image_size, max_length=self.max_carve_length(sig), size_parser=self.get_size_parser(sig), read=read, empty_starts=empty_starts):
+                candidates.append((sig["extension"], header, footer, start, end))
+        return candidates
+
+
+    # --- Bifragment Gap Carving ---
+    def carve_bifragments(self, image_path, signatures=None, workers=1, cluster_size=BIFRAGMENT_CLUSTER_SIZE, max_gap=BIFRAGMENT_MAX_GAP, extents=None):
+        """
+        Recovers JPEG, PNG and ZIP files stored as two fragments separated by a gap (see lib/bifragment).
+        Every cluster-aligned header of those signatures (inside extents, if given) whose file fails its
+        structure check (lib/structure_validators) when read contiguously is retried with every candidate
+        split point and gap of up to max_gap bytes before a later footer; the first candidate whose
+        reassembly validates is kept. Neither fragment may overlap an intact file, another header's
+        cluster or a file reassembled before it. With workers > 1, candidates are validated in batches
+        over a process pool and no further batches are started once one succeeds.
+        Returns dictionaries like scan_drive's, with "fragments" holding the [start, end] image ranges
+        of both fragments ("offset" is the first one's start, "size" their total length).
+        """
+        signatures = self.signature_set(signatures).select(extensions=STRUCTURE_VALIDATORS)
+        if not len(signatures):
+            return []
+        with open(image_path, "rb") as f:
+            # Files are allocated in whole clusters, so a file's header starts one.
+            occurrences, image_size = self.stream_signature_occurrences(f, signatures, alignment=cluster_size, extents=extents)
+        executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+        try:
+            return self.gap_carve(image_path, signatures, occurrences, image_size, executor, workers, cluster_size, max_gap)
+        finally:
+            if executor is not None:
+                _shutdown_pool(executor)
+
+
+    def gap_carve(self, image_path, signatures, occurrences, image_size, executor=None, workers=1, cluster_size=BIFRAGMENT_CLUSTER_SIZE, max_gap=BIFRAGMENT_MAX_GAP):
+        """
+        The gap carving of carve_bifragments on occurrences already found: the offsets of every
+        header (only those on the cluster grid) and footer of the STRUCTURE_VALIDATORS signatures.
+        Candidates are validated over executor (a process pool of workers processes) if given.
+        """
+        signatures = self.signature_set(signatures).select(extensions=STRUCTURE_VALIDATORS)
+        found_files = []
+        with open(image_path, "rb") as f:
+            read = self.file_reader(f)
+            # Contiguous structure check of every header: (sig, start, (size, resume, failed_at)).
+            checks = []
+            # Sorted, disjoint image ranges no fragment may overlap (see lib/bifragment).
+            blocked = []
+            with self.stats.stage("bifragment"):
+                for sig in signatures:
+                    validator = STRUCTURE_VALIDATORS[sig["extension"]]
+                    max_length = self.max_carve_length(sig)
+                    for start in occurrences[sig["header"]]:
+                        check = validator(bifragment.fragment_reader(read, [(start, image_size)]), min(max_length, image_size - start))
+                        checks.append((sig, start, check))
+                        bifragment.add_range(blocked, start, start + max(check[0] or 0, cluster_size))
+            for sig, start, (size, resume, failed_at) in checks:
+                if size is not None:
+                    continue
+                ext = sig["extension"]
+                with self.stats.stage("bifragment"):
+                    fragments = self.find_bifragment(executor, workers, image_path, read, ext, start, resume, failed_at, occurrences[sig["footer"]], cluster_size, max_gap, self.max_carve_length(sig), image_size, blocked)
+                if fragments is None:
+                    continue
+                for begin, end in fragments:
+                    bifragment.add_range(blocked, begin, end)
+                size = sum(end - begin for begin, end in fragments)
+                entropy = self.range_entropy(bifragment.fragment_reader(read, fragments), 0, size)
+                found_files.append({"id": len(found_files) + 1, "extension": ext, "offset": start, "size": size, "entropy": entropy, "fragments": [list(fragment) for fragment in fragments]})
+        return found_files
+
+
+    def find_bifragment(self, executor, workers, image_path, read, ext, start, resume, failed_at, footers, cluster_size, max_gap, max_length, image_size, blocked):
+        """
+        Returns the two (start, end) ranges of the file whose header is at start and whose contiguous
+        structure check failed at failed_at (resume is its resume point), or None when no candidate
+        reassembly avoiding the blocked ranges validates.
+        Candidate batches are validated on executor (inline when it is None), at most 2 * workers
+        batches ahead of the earliest unfinished one, so the result is the first valid candidate in order.
+        """
+        candidate_list = bifragment.candidates(start, resume[0], failed_at, footers, cluster_size, max_gap, self.BIFRAGMENT_SPLIT_WINDOW, self.BIFRAGMENT_MAX_CANDIDATES, blocked)
+        if executor is None:
+            return bifragment.first_valid(read, STRUCTURE_VALIDATORS[ext], start, resume, candidate_list, max_length, image_size, MIN_TAIL.get(ext, 0), blocked)
+        if candidate_list:
+            # Only the blocked ranges a second fragment can reach are sent to the workers.
+            reach_end = max(second_start for _, second_start in candidate_list) + max_length
+            blocked = blocked[max(bisect.bisect_left(blocked, (start,)) - 1, 0):bisect.bisect_left(blocked, (reach_end,))]
+        batches = (candidate_list[i:i + self.BIFRAGMENT_BATCH] for i in range(0, len(candidate_list), self.BIFRAGMENT_BATCH))
+        pending = deque()
+        try:
+            while True:
+                for batch in batches:
+                    pending.append(executor.submit(_first_valid_batch, (image_path, ext, start, resume, batch, max_length, image_size, blocked)))
+                    if len(pending) >= 2 * workers:
+                        break
+                if not pending:
+                    return None
+                fragments = pending.popleft().result()
+                if fragments is not None:
+                    return fragments
+        finally:
+            for future in pending:
+                future.cancel()
+
+
+    def merge_bifragments(self, read, found_files, bifragments):
+        """
+        Merges carve_bifragments results into scan results: a bifragment file replaces the scan result
+        of the same extension at the same offset (keeping its id) only if that contiguous carve fails
+        its structure check (read through read(position, length)); otherwise the contiguous carve is
+        kept and the bifragment file dropped. Bifragment files at other offsets are appended with new ids.
+        """
+        by_offset = {(file_info["extension"], file_info["offset"]): file_info for file_info in bifragments}
+        merged = []
+        for file_info in found_files:
+            replacement = by_offset.pop((file_info["extension"], file_info["offset"]), None)
+            if replacement is not None and not self.structure_valid(read, file_info):
+                file_info = dict(replacement, id=file_info["id"])
+            merged.append(file_info)
+        for file_info in bifragments:
+            if (file_info["extension"], file_info["offset"]) in by_offset:
+                merged.append(dict(file_info, id=len(merged) + 1))
+        return merged
+
+
+    def structure_valid(self, read, file_info):
+        """
+        Returns whether a found file passes its format's structure check (lib/structure_validators)
+        when read through read(position, length). Formats without a check always pass.
+        """
+        validator = STRUCTURE_VALIDATORS.get(file_info["extension"])
+        if validator is None:
+            return True
+        size, _, _ = validator(bifragment.fragment_reader(read, self.fragment_ranges(file_info)), file_info["size"])
+        return size is not None
+
+
+    def add_content(self, content_index, key, file_info):
+        """Registers a found file with a ContentIndex (see ContentIndex.add), reading fragmented files through their ranges."""
+        if "fragments" in file_info:
+            return content_index.add(key, 0, file_info["size"], bifragment.fragment_reader(content_index.read, self.fragment_ranges(file_info)))
+        return content_index.add(key, file_info["offset"], file_info["size"])
+
+
+    def fragment_ranges(self, file_info):
+        """Returns the (start, end) image ranges holding a found file's bytes, in file order."""
+        if "fragments" in file_info:
+            return [tuple(fragment) for fragment in file_info["fragments"]]
+        return [(file_info["offset"], file_info["offset"] + file_info["size"])]
+
+
+    # --- Pipelined Carving ---
+    def carve_pipeline(self, image_path, output_dir=None, signatures=None, gap_threshold=1024 * 1024, workers=None, alignment=None, extents=None, unallocated_only=False, skip_empty=False, on_found=None, progress=None, progress_interval=1.0, dedup=None, bifragment=False):
+        """
+        Scans (and with output_dir, recovers) the image as four stages connected by bounded queues,
+        so that reading and searching the image overlaps with verification and writing:
+          - search: MIN_SHARD_SIZE shards are searched by a process pool, in image order,
+          - assembly: a thread feeds each shard's hits to one FragmentAssembler per signature,
+            which releases candidate fragments as soon as the hits found so far settle them,
+          - verification: batches of PIPELINE_BATCH candidates are verified by a second process pool,
+          - write: accepted files are copied to output_dir by a thread pool, named as by recover_fragments.
+            With dedup="skip" or "link", a file with the same content as an earlier one gets "duplicate_of"
+            (the earlier file's id) and is not copied but skipped or hardlinked as by recover_fragments.
+        No stage runs more than PIPELINE_DEPTH items ahead of the next, so memory stays bounded.
+        signatures, gap_threshold, alignment, extents, unallocated_only, skip_empty and bifragment are as
+        for scan_drive, and the files found are the same, numbered in the order they are accepted. With
+        bifragment=True, the search stage keeps the JPEG, PNG and ZIP hits gap carving needs and runs it
+        (see gap_carve) on the search pool once the search is done, while verification goes on. Its files
+        replace the accepted file at the same offset if that file fails its structure check (such files,
+        and the files accepted after them, are held back until gap carving is done), and those at other
+        offsets follow at the end.
+        If given, on_found is called with each found file's dictionary (including "path" once written),
+        and progress about every progress_interval seconds and once at the end with a dictionary of
+        bytes_total, bytes_searched, hits, candidates, verified, found, duplicates, bytes_written, elapsed,
+        bytes_per_second, hits_per_second, eta (seconds left in the search, or None) and done.
+        workers defaults to os.cpu_count(). Returns the list of found file dictionaries.
+        """
+        self.check_dedup_mode(dedup)
+        if workers is None:
+            workers = os.cpu_count() or 1
+        signatures = self.signature_set(signatures)
+        extents, empty_starts = self.scan_scope(image_path, signatures, extents, unallocated_only, skip_empty)
+        image_size = self.get_image_size(image_path)
+        if image_size == 0:
+            return []
+        shards = fs_allocation.split_extents(extents if extents is not None else [(0, image_size)], self.MIN_SHARD_SIZE)
+        # (extension, offset) -> bifragment file not yet matched with an accepted file; filled by the search stage.
+        bifragments = {}
+        gap_carved = threading.Event()
+        gap_signatures = signatures.select(extensions=STRUCTURE_VALIDATORS) if bifragment else None
+        if not gap_signatures:
+            gap_carved.set()
+        else:
+            cluster_size = self.BIFRAGMENT_CLUSTER_SIZE
+            # Headers found on the alignment grid include the cluster grid unless alignment does not divide it.
+            reuse_hits = not alignment or alignment <= 1 or cluster_size % alignment == 0
+            gap_footers = {sig["footer"] for sig in gap_signatures if sig["footer"]}
+            # Gap carving pattern -> whether only hits on the cluster grid are kept (headers that are no footer).
+            gap_patterns = {sig["header"]: sig["header"] not in gap_footers for sig in gap_signatures}
+            gap_patterns.update((footer, False) for footer in gap_footers)
+            gap_occurrences = {pattern: [] for pattern in gap_patterns}
+        counters = {"bytes_total": sum(end - start for start, end in shards), "bytes_searched": 0, "hits": 0, "candidates": 0, "verified": 0, "found": 0, "duplicates": 0, "bytes_written": 0}
+        lock = threading.Lock()
+        stop = threading.Event()
+        errors = []
+        searched = queue.Queue(self.PIPELINE_DEPTH)
+        candidates = queue.Queue(self.PIPELINE_DEPTH)
+        accepted = queue.Queue(self.PIPELINE_DEPTH)
+        depth = self.PIPELINE_DEPTH
+        stats_enabled = self.stats.enabled
+        tracing = self.stats.tracing
+
+        def count(**increments):
+            with lock:
+                for key, value in increments.items():
+                    counters[key] += value
+
+        def put(q, item):
+            # Gives up once another stage has failed, so no thread stays blocked on a full queue.
+            while not stop.is_set():
+                try:
+                    q.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        def get(q):
+            # Returns None (end of stream) once another stage has failed.
+            while not stop.is_set():
+                try:
+                    return q.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+            return None
+
+        def stage(function):
+            def run():
+                try:
+                    function()
+                except BaseException as e:
+                    errors.append(e)
+                    stop.set()
+            return threading.Thread(target=run, daemon=True)
+
+        def search():
+            pending = deque()
+
+            def collect():
+                end, shard_bytes, future = pending.popleft()
+                shard_occurrences, shard_stats = future.result()
+                if shard_stats:
+                    self.stats.merge(shard_stats)
+                self.stats.count_hits(signatures, shard_occurrences)
+                if gap_signatures and reuse_hits:
+                    for pattern, aligned in gap_patterns.items():
+                        offsets = shard_occurrences.get(pattern, ())
+                        if aligned:
+                            offsets = [offset for offset in offsets if offset % cluster_size == 0]
+                        gap_occurrences[pattern].extend(offsets)
+                count(bytes_searched=shard_bytes, hits=sum(len(offsets) for offsets in shard_occurrences.values()))
+                return put(searched, (end, shard_occurrences))
+
+            for start, end in shards:
+                pending.append((end, end - start, search_pool.submit(_scan_shard, (image_path, signatures, start, end, alignment, stats_enabled, tracing))))
+                if len(pending) >= depth and not collect():
+                    return
+            while pending:
+                if not collect():
+                    return
+            put(searched, None)
+            if gap_signatures:
+                # The search pool is idle from here on, so gap carving candidates are validated on it.
+                if reuse_hits:
+                    gap_files = self.gap_carve(image_path, gap_signatures, gap_occurrences, image_size, search_pool, workers)
+                else:
+                    gap_files = self.carve_bifragments(image_path, gap_signatures, workers, extents=extents)
+                for file_info in gap_files:
+                    bifragments[(file_info["extension"], file_info["offset"])] = file_info
+                gap_carved.set()
+
+        def assemble():
+            with open(image_path, "rb") as f:
+                read = self.file_reader(f)
+                assemblers = [(sig, FragmentAssembler(sig["header"], sig["footer"], gap_threshold, image_size, self.max_carve_length(sig), self.get_size_parser(sig), read, empty_starts)) for sig in signatures]
+                while True:
+                    item = get(searched)
+                    if stop.is_set():
+                        return
+                    batch = []
+                    with self.stats.stage("assembly"):
+                        for sig, assembler in assemblers:
+                            if item is None:
+                                fragments = assembler.finish()
+                            else:
+                                end, shard_occurrences = item
+                                fragments = assembler.feed(shard_occurrences.get(sig["header"], ()), shard_occurrences.get(sig["footer"]) if sig["footer"] else None, end)
+                            batch.extend((sig["extension"], sig["header"], sig["footer"], start, end) for start, end in fragments)
+                    count(candidates=len(batch))
+                    for index in range(0, len(batch), self.PIPELINE_BATCH):
+                        if not put(candidates, batch[index:index + self.PIPELINE_BATCH]):
+                            return
+                    if item is None:
+                        put(candidates, None)
+                        return
+
+        def verify():
+            pending = deque()
+
+            def collect():
+                batch, future = pending.popleft()
+                verified, batch_stats = future.result()
+                if batch_stats:
+                    self.stats.merge(batch_stats)
+                count(verified=len(batch))
+                for index, (ext, header, footer, start, end) in enumerate(batch):
+                    if index in verified and not put(accepted, (ext, start, end, verified[index])):
+                        return False
+                return True
+
+            while True:
+                batch = get(candidates)
+                if batch is None:
+                    break
+                pending.append((batch, verify_pool.submit(_verify_batch, (image_path, list(range(len(batch))), batch, stats_enabled, tracing))))
+                if len(pending) >= depth and not collect():
+                    return
+            while pending and not stop.is_set():
+                if not collect():
+                    return
+            put(accepted, None)
+
+        def report(done=False):
+            with lock:
+                snapshot = dict(counters)
+            elapsed = time.monotonic() - started
+            snapshot["elapsed"] = elapsed
+            snapshot["bytes_per_second"] = snapshot["bytes_searched"] / elapsed if elapsed else 0.0
+            snapshot["hits_per_second"] = snapshot["hits"] / elapsed if elapsed else 0.0
+            remaining = snapshot["bytes_total"] - snapshot["bytes_searched"]
+            snapshot["eta"] = remaining / snapshot["bytes_per_second"] if snapshot["bytes_per_second"] else (0.0 if not remaining else None)
+            snapshot["done"] = done
+            progress(snapshot)
+
+        found_files = []
+        started = time.monotonic()
+        # Concurrent copies need positional reads; without os.pread the shared fd offset would race.
+        write_workers = self.RECOVERY_WORKERS if hasattr(os, "pread") else 1
+        search_pool = ProcessPoolExecutor(max_workers=workers)
+        verify_pool = ProcessPoolExecutor(max_workers=workers)
+        threads = [stage(search), stage(assemble), stage(verify)]
+        try:
+            with open(image_path, "rb") as f, ThreadPoolExecutor(max_workers=write_workers) as write_pool:
+                src_fd = f.fileno()
+                read = self.file_reader(f)
+                content_index = ContentIndex(read) if dedup else None
+
+                def write(file_info):
+                    dest_path = self.recovered_path(output_dir, file_info)
+                    with open(dest_path, "wb") as out, self.stats.stage("write", file_info["size"]):
+                        copied = sum(self.copy_range(src_fd, start, end - start, out.fileno()) for start, end in self.fragment_ranges(file_info))
+                    file_info["path"] = dest_path
+                    count(bytes_written=copied)
+
+                def finish_write():
+                    file_info, future = writes.popleft()
+                    if future is None:
+                        # Duplicates come after the file holding their content, which is written by now.
+                        original_path = found_files[file_info["duplicate_of"] - 1]["path"]
+                        file_info["path"] = self.place_duplicate(dedup, original_path, self.recovered_path(output_dir, file_info))
+                    else:
+                        future.result()
+                    if on_found:
+                        on_found(file_info)
+
+                def accept(file_info):
+                    found_files.append(file_info)
+                    count(found=1)
+                    if content_index is not None:
+                        with self.stats.stage("dedup"):
+                            original = self.add_content(content_index, file_info["id"], file_info)
+                        if original is not None:
+                            file_info["duplicate_of"] = original
+                            count(duplicates=1)
+                    if output_dir:
+                        writes.append((file_info, None if "duplicate_of" in file_info else write_pool.submit(write, file_info)))
+                        while writes and (writes[0][1] is None or writes[0][1].done() or len(writes) > depth):
+                            finish_write()
+                    elif on_found:
+                        on_found(file_info)
+
+                def take(file_info):
+                    replacement = bifragments.pop((file_info["extension"], file_info["offset"]), None)
+                    if replacement is not None and not self.structure_valid(read, file_info):
+                        file_info = replacement
+                    accept(dict(file_info, id=len(found_files) + 1))
+
+                for thread in threads:
+                    thread.start()
+                writes = deque()
+                # Accepted files waiting for gap carving, in order.
+                held = deque()
+                next_report = started + progress_interval
+                while True:
+                    try:
+                        item = accepted.get(timeout=min(progress_interval, 0.1))
+                    except queue.Empty:
+                        item = False
+                    if progress and time.monotonic() >= next_report:
+                        report()
+                        next_report = time.monotonic() + progress_interval
+                    if errors:
+                        raise errors[0]
+                    while held and gap_carved.is_set():
+                        take(held.popleft())
+                    if item is None:
+                        break
+                    if item is False:
+                        continue
+                    ext, start, end, entropy = item
+                    file_info = {"extension": ext, "offset": start, "size": end - start, "entropy": entropy}
+                    if held or (not gap_carved.is_set() and ext in STRUCTURE_VALIDATORS and not self.structure_valid(read, file_info)):
+                        # May be replaced by a bifragment file, which is not known before gap carving is done.
+                        held.append(file_info)
+                    else:
+                        take(file_info)
+                while not gap_carved.wait(min(progress_interval, 0.1)):
+                    if errors:
+                        raise errors[0]
+                    if progress and time.monotonic() >= next_report:
+                        report()
+                        next_report = time.monotonic() + progress_interval
+                while held:
+                    take(held.popleft())
+                for file_info in list(bifragments.values()):
+                    accept(dict(file_info, id=len(found_files) + 1))
+                while writes:
+                    finish_write()
+        finally:
+            stop.set()
+            for thread in threads:
+                if thread.ident is not None:
+                    thread.join()
+            _shutdown_pool(search_pool)
+            _shutdown_pool(verify_pool)
+        if errors:
+            raise errors[0]
+        if progress:
+            report(done=True)
+        return found_files
+
+
+    def file_reader(self, f):
+        """Returns read(position, length) over the open image f, for size parsers."""
+        fd = f.fileno()
+        if hasattr(os, "pread"):
+            return lambda position, length: os.pread(fd, length, position)
+
+        def read(position, length):
+            f.seek(position)
+            return f.read(length)
+        return read
+
+
+    def unallocated_extents(self, image_path):
+        """
+        Returns the sorted (start, end) byte ranges of the image that no file system allocates,
+        from its partition table and FAT / NTFS $Bitmap / ext block bitmaps (see lib/fs_allocation).
+        Volumes with unknown file systems and unpartitioned space are included whole.
+        """
+        with open(image_path, "rb") as f:
+            return fs_allocation.unallocated_extents(self.file_reader(f), f.seek(0, os.SEEK_END))
+
+
+    def resolve_extents(self, image_path, extents=None, unallocated_only=False, empty_runs=None, overlap=0):
+        """
+        Returns the sorted, merged byte ranges a scan is restricted to, or None for the whole image:
+        extents, intersected with the unallocated space when unallocated_only is set and with
+        everything outside empty_runs when given. The last overlap bytes of each empty run stay in,
+        so a header or footer beginning there and running into live data is still found.
+        """
+        if extents is not None:
+            extents = fs_allocation.merge_extents(extents)
+        if unallocated_only:
+            unallocated = self.unallocated_extents(image_path)
+            extents = unallocated if extents is None else fs_allocation.intersect_extents(extents, unallocated)
+        if empty_runs:
+            live = []
+            position = 0
+            for start, end in empty_runs:
+                if start > position:
+                    live.append((position, start))
+                position = max(position, end - overlap)
+            image_size = self.get_image_size(image_path)
+            if position < image_size:
+                live.append((position, image_size))
+            extents = live if extents is None else fs_allocation.intersect_extents(extents, live)
+        return extents
+
+
+    def scan_scope(self, image_path, signatures, extents=None, unallocated_only=False, skip_empty=False):
+        """
+        Returns (extents, empty_starts) for a scan of the compiled signatures with scan_drive's
+        extents, unallocated_only and skip_empty options (see resolve_extents and get_fragments).
+        """
+        if not skip_empty:
+            return self.resolve_extents(image_path, extents, unallocated_only), None
+        empty_runs = self.empty_runs(image_path)
+        return self.resolve_extents(image_path, extents, unallocated_only, empty_runs, signatures.max_length), [start for start, _ in empty_runs]
+
+
+    def classify_blocks(self, image_path):
+        """
+        Classifies every block of the image as zero, uniform, low or high entropy in one pass
+        (see lib/block_map). Returns the BlockMap.
+        """
+        with open(image_path, "rb") as f:
+            image_size = f.seek(0, os.SEEK_END)
+            with self.stats.stage("classify", image_size):
+                return block_map.build_block_map(self.file_reader(f), image_size)
+
+
+    def empty_runs(self, image_path):
+        """Returns the sorted (start, end) byte ranges of runs of zero/uniform blocks at least EMPTY_RUN_LENGTH long."""
+        return self.classify_blocks(image_path).dead_runs(self.EMPTY_RUN_LENGTH)
+
+
+    def get_image_size(self, image_path):
+        """Returns the size in bytes of an image file or block device."""
+        with open(image_path, "rb") as f:
+            return f.seek(0, os.SEEK_END)
+
+
     def find_all_with_memmem(self, mm_obj, needle):
         """
-        Use the C library's memmem to search for all occurrences of needle
-        in the memory-mapped object. Returns a list of offsets.
+        Use the C library's memmem to search for all occurrences of needle in any buffer,
+        including read-only memory maps. Returns an array('Q') of offsets.
+        Only usable when search_backends.memmem_available() is true.
         """
-        results = []
-        base_addr = ctypes.addressof(ctypes.c_char.from_buffer(mm_obj))
-        haystack_len = len(mm_obj)
-        needle_len = len(needle)
-        current_ptr = self.libc.memmem(ctypes.c_void_p(base_addr), haystack_len, needle, needle_len)
-        while current_ptr:
-            offset = current_ptr - base_addr
-            results.append(offset)
-            remaining_len = haystack_len - (offset + 1)
-            if remaining_len <= 0:
-                break
-            current_ptr = self.libc.memmem(ctypes.c_void_p(current_ptr + 1), remaining_len, needle, needle_len)
-        return results
+        return search_backends.find_all_memmem(mm_obj, needle)
 
 
     def find_all_python(self, data, needle):
@@ -104,50 +1049,172 @@ class FILE_CARVER:
 
 
     def find_all_occurrences(self, mm_obj, needle):
-        """Choose the memmem method if available; otherwise use the Python search."""
-        if self.libc.memmem is not None:
-            return self.find_all_with_memmem(mm_obj, needle)
-        else:
-            return self.find_all_python(mm_obj, needle)
+        """
+        Finds all occurrences of needle with the fastest search backend on this machine
+        (memmem, NumPy, re or bytes.find, picked once by a micro-benchmark; see lib/search_backends).
+        Returns a sorted sequence of offsets (an array('Q')).
+        """
+        with self.stats.stage("search", len(mm_obj)):
+            return search_backends.find_all(mm_obj, needle)
+
+
+    # --- Multi-Signature Search ---
+    def signature_set(self, signatures=None):
+        """Returns signatures compiled into a SignatureSet (the default set for None, unchanged if already compiled)."""
+        if signatures is None:
+            return SignatureSet.default()
+        if isinstance(signatures, SignatureSet):
+            return signatures
+        return SignatureSet(signatures)
+
+
+    def build_matcher(self, signatures, alignment=None):
+        """
+        Returns the multi-pattern matcher for every header and footer in signatures,
+        built once per signature set (see SignatureSet.matcher).
+        With alignment set, headers are only matched at multiples of alignment.
+        """
+        return self.signature_set(signatures).matcher(alignment)
+
+
+    def find_signature_occurrences(self, mm_obj, signatures, matcher=None, start=0, end=None, alignment=None):
+        """
+        Locates every header and footer of the given signatures in one sequential pass.
+        Only matches starting in [start, end) are reported; they may extend past end.
+        With alignment set, headers are only reported at multiples of alignment.
+        Returns a dict mapping each header/footer pattern to a sorted list of offsets.
+        """
+        if matcher is None:
+            matcher = self.build_matcher(signatures, alignment)
+        if end is None or end >= len(mm_obj):
+            with self.stats.stage("search", len(mm_obj) - start):
+                return matcher.find_all(mm_obj, start)
+        occurrences = {pattern: [] for pattern in matcher.patterns}
+        lists = [occurrences[pattern] for pattern in matcher.patterns]
+        search_end = min(end + matcher.max_length - 1, len(mm_obj))
+        with self.stats.stage("search", end - start):
+            for offset, pattern_id in matcher.iter_matches(mm_obj, start, search_end):
+                if offset >= end:
+                    break
+                lists[pattern_id].append(offset)
+        return occurrences
+
+
+    def find_extent_occurrences(self, mm_obj, signatures, extents, matcher=None, alignment=None):
+        """
+        Same as find_signature_occurrences, restricted to matches starting inside the sorted
+        (start, end) ranges of extents.
+        """
+        if matcher is None:
+            matcher = self.build_matcher(signatures, alignment)
+        occurrences = {pattern: [] for pattern in matcher.patterns}
+        for start, end in extents:
+            for pattern, offsets in self.find_signature_occurrences(mm_obj, signatures, matcher, start, end).items():
+                occurrences[pattern].extend(offsets)
+        return occurrences
 
 
     # --- Fragment Assembly ---
-    def get_fragments(self, mm, header, footer, gap_threshold=1024 * 1024):
+    def get_fragments(self, mm, header, footer, gap_threshold=1024 * 1024, headers=None, footers=None, image_size=None, max_length=None, size_parser=None, read=None, empty_starts=None):
         """
         Returns a list of (start, end) tuples representing candidate file fragments.
         First, it finds contiguous fragments (header followed by footer). For headers without
         an immediately found footer, the region until the next header (or end of file) is marked
         as an orphan fragment. Orphan fragments separated by gaps smaller than gap_threshold are merged.
+        Headers are paired with footers by a single sweep over the sorted footer offsets, and no
+        fragment (contiguous, orphan or merged) is allowed to grow beyond max_length bytes.
+        Header and footer offsets already found by a multi-signature pass can be supplied through
+        headers and footers; when both are given (together with image_size) mm is not accessed at all.
+        If a size_parser (see lib/size_parsers) is given, each header is first parsed through
+        read(position, length) (default: slices of mm) and an exact size becomes a contiguous fragment
+        without any footer search; headers it cannot size fall back to footer/orphan carving.
+        With empty_starts (the sorted offsets where long runs of empty blocks begin, see
+        scan_drive's skip_empty), orphan fragments end at the next such run and are not merged across it.
         """
         contiguous = []
         orphan = []
-        headers = self.find_all_occurrences(mm, header)
+        if headers is None:
+            headers = self.find_all_occurrences(mm, header)
+        if footers is None and footer:
+            footers = self.find_all_occurrences(mm, footer)
+        if image_size is None:
+            image_size = len(mm)
+        if max_length is None:
+            max_length = image_size
+        if size_parser is not None and read is None:
+            read = lambda position, length: mm[position:position + length]
 
-        for idx, pos in enumerate(headers):
-            footer_offset = mm.find(footer, pos + len(header))
-            if footer_offset != -1:
-                contiguous.append((pos, footer_offset + len(footer)))
-            else:
-                # If no footer is found, mark as orphan fragment until the next header or end of file.
-                next_header = headers[idx + 1] if idx + 1 < len(headers) else len(mm)
-                orphan.append((pos, next_header))
-
-        # Merge orphan fragments if gap between them is below the threshold.
-        merged_orphan = []
-        if orphan:
-            current_start, current_end = orphan[0]
-            for frag in orphan[1:]:
-                frag_start, frag_end = frag
-                if frag_start - current_end < gap_threshold:
-                    current_end = frag_end
+        with self.stats.stage("assembly"):
+            # Headers are sorted, so the first footer after each header only ever moves forward.
+            next_footer = 0
+            for idx, pos in enumerate(headers):
+                if size_parser is not None:
+                    size = size_parser(read, pos, min(max_length, image_size - pos))
+                    if size:
+                        contiguous.append((pos, pos + size))
+                        continue
+                footer_offset = -1
+                if footer:
+                    while next_footer < len(footers) and footers[next_footer] < pos + len(header):
+                        next_footer += 1
+                    if next_footer < len(footers) and footers[next_footer] + len(footer) - pos <= max_length:
+                        footer_offset = footers[next_footer]
+                if footer_offset != -1:
+                    contiguous.append((pos, footer_offset + len(footer)))
                 else:
-                    merged_orphan.append((current_start, current_end))
-                    current_start, current_end = frag
-            merged_orphan.append((current_start, current_end))
+                    # If no footer is found, mark as orphan fragment until the next header or end of file.
+                    next_header = headers[idx + 1] if idx + 1 < len(headers) else image_size
+                    orphan_end = min(next_header, pos + max_length)
+                    if empty_starts:
+                        next_empty = bisect.bisect_right(empty_starts, pos)
+                        if next_empty < len(empty_starts):
+                            orphan_end = min(orphan_end, empty_starts[next_empty])
+                    orphan.append((pos, orphan_end))
+
+            # Merge orphan fragments if gap between them is below the threshold.
+            merged_orphan = []
+            if orphan:
+                current_start, current_end = orphan[0]
+                for frag in orphan[1:]:
+                    frag_start, frag_end = frag
+                    if empty_starts:
+                        next_empty = bisect.bisect_left(empty_starts, current_end)
+                        crosses_empty = next_empty < len(empty_starts) and empty_starts[next_empty] < frag_start
+                    else:
+                        crosses_empty = False
+                    if frag_start - current_end < gap_threshold and frag_end - current_start <= max_length and not crosses_empty:
+                        current_end = frag_end
+                    else:
+                        merged_orphan.append((current_start, current_end))
+                        current_start, current_end = frag
+                merged_orphan.append((current_start, current_end))
 
         return contiguous + merged_orphan
 
 
+    def get_size_parser(self, sig):
+        """Returns the structure-aware size parser for a signature's format, or None."""
+        return SIZE_PARSERS.get(sig["extension"])
+
+
+    def structure_matches(self, ext, read, start, end):
+        """
+        True if the format's size parser resolves the file at start to exactly end - start bytes and,
+        for containers shared by several formats (ZIP, ISO-BMFF), the contents are those of ext
+        (see size_parsers.STRUCTURE_FORMATS), so e.g. a plain ZIP is not also a DOCX, XLSX and XPS.
+        """
+        size_parser = SIZE_PARSERS.get(ext)
+        if size_parser is None or size_parser(read, start, end - start) != end - start:
+            return False
+        identify = STRUCTURE_FORMATS.get(ext)
+        return identify is None or identify(read, start, end - start) == ext
+
+
+    def max_carve_length(self, sig):
+        """Returns the longest fragment to carve for a signature ("max_size" key, else MAX_CARVE_LENGTH)."""
+        return sig.get("max_size") or self.MAX_CARVE_LENGTH
+
+
     # --- File Integrity Verification Using Headers and Entropy ---
     def compute_entropy(self, data):
         """
@@ -155,78 +1222,191 @@ class FILE_CARVER:
         """
         if not data:
             return 0
-        counter = Counter(data)
-        length = len(data)
-        entropy = 0
-        for count in counter.values():
-            p = count / length
-            entropy -= p * math.log2(p)
-        return entropy
+        with self.stats.stage("entropy", len(data)):
+            return self.entropy_from_counts(byte_histogram(data), len(data))
+
+
+    def entropy_from_counts(self, counts, length):
+        """
+        Computes the Shannon entropy (in bits per byte) from byte counts totalling length bytes.
+        """
+        return shannon_entropy(counts, length)
 
 
-    def verify_file_integrity(self, data, ext, header, footer):
+    def verification_rule(self, ext):
+        """Returns the integrity thresholds for an extension from file_signatures.VERIFICATION_RULES."""
+        return file_signatures.VERIFICATION_RULES.get(ext, file_signatures.DEFAULT_VERIFICATION_RULE)
+
+
+    def verify_file_integrity(self, data, ext, header, footer, entropy=None):
         """
-        Verifies file integrity using a heuristic score based on:
-        - Whether the data starts with the expected header and ends with the expected footer.
-        - The Shannon entropy of the data.
-        - A minimal file size threshold.
+        Verifies file integrity of data (bytes or a memoryview) using a heuristic score based on:
+        - Whether the data starts with the expected header (and any secondary magic of the format)
+          and ends with the expected footer (or, for formats with a size parser, whether its
+          structure spans exactly the data).
+        - The Shannon entropy of the data (pass entropy if it has already been computed).
+        - Size bounds.
         Each factor contributes to an overall score. Only files scoring above a threshold are considered intact.
+        The thresholds come from the signature-driven rule table (see verify_range).
         """
-        header_ok = data.startswith(header)
-        footer_ok = data.endswith(footer)
-        entropy = self.compute_entropy(data)
-        size = len(data)
-
-        # Set thresholds based on file extension.
-        if ext in ["jpg", "jpeg"]:
-            # JPEG files are usually compressed with high entropy.
-            entropy_ok = 7.0 <= entropy <= 8.0
-            size_ok = size > 1024  # At least 1KB
-        elif ext == "png":
-            entropy_ok = 7.0 <= entropy <= 8.0
-            size_ok = size > 1024
-        elif ext == "pdf":
-            # PDFs can vary; use a broad entropy range.
-            entropy_ok = 4.5 <= entropy <= 8.0
-            size_ok = size > 1024
-        elif ext == "gif":
-            entropy_ok = 3.5 <= entropy <= 7.0
-            size_ok = size > 512
-        elif ext == "zip":
-            entropy_ok = 7.0 <= entropy <= 8.0
-            size_ok = size > 1024
-        else:
-            entropy_ok = entropy >= 3.0
-            size_ok = size > 256
+        return self.verify_range(lambda position, length: data[position:position + length], ext, header, footer, 0, len(data), entropy)
+
+
+    def verify_range(self, read, ext, header, footer, start, end, entropy=None):
+        """
+        Tiered integrity check of the fragment [start, end), read through read(position, length).
+        Returns True if the fragment is accepted (see rejection_reason); the verdict is
+        reported to self.stats.
+        """
+        with self.stats.stage("verify", end - start):
+            rejected_by = self.rejection_reason(read, ext, header, footer, start, end, entropy)
+        self.stats.verdict(ext, start, end, rejected_by)
+        return rejected_by is None
+
+
+    def rejection_reason(self, read, ext, header, footer, start, end, entropy=None):
+        """
+        Runs the verification tiers on [start, end) and returns None if the fragment is accepted,
+        otherwise the name of the rule that rejected it ("min_size", "max_size", "header", "magic",
+        "footer" or "entropy"). Cheap checks run first and reject (or accept) as early as possible:
+        1. Size bounds from the extension's rule.
+        2. Header, secondary magic at fixed offsets, and footer/structure - a few small reads.
+        3. Only if the entropy can still change the outcome: entropy of a few sampled blocks,
+           and the full-fragment entropy only when the sample is close to a threshold.
+        """
+        rule = self.verification_rule(ext)
+        size = end - start
+
+        # Stage 1: size bounds.
+        if size <= rule["min_size"]:
+            return "min_size"
+        if size > rule.get("max_size", size):
+            return "max_size"
+
+        # Stage 2: header, secondary magic and footer/structure.
+        header_ok = read(start, len(header)) == header
+        magic_ok = True
+        for magic_offset, magic in rule.get("magic", ()):
+            magic_ok = magic_ok and read(start + magic_offset, len(magic)) == magic
+        header_ok = header_ok and magic_ok
+        footer_ok = bool(footer) and size >= len(footer) and read(end - len(footer), len(footer)) == footer
+        # An exact structural size counts as the end-of-file evidence for footer-less formats (and ZIP).
+        footer_ok = footer_ok or self.structure_matches(ext, read, start, end)
 
         # Heuristic scoring: header and footer are strong signals.
-        score = 0.0
-        if header_ok:
-            score += 0.4
-        if footer_ok:
-            score += 0.4
-        if entropy_ok:
-            score += 0.2
-        if not size_ok:
-            score = 0.0  # Disqualify if size is too small
+        score = self.HEADER_WEIGHT * header_ok + self.FOOTER_WEIGHT * footer_ok
+        if score >= self.SCORE_THRESHOLD:
+            return None
+        if score + self.ENTROPY_WEIGHT < self.SCORE_THRESHOLD:
+            if not header_ok:
+                return "magic" if not magic_ok else "header"
+            return "footer"
+
+        # Stage 3: entropy decides; sample first, read everything only for borderline samples.
+        min_entropy, max_entropy = rule["min_entropy"], rule["max_entropy"]
+        if entropy is None:
+            entropy = self.sampled_entropy(read, start, end)
+            margin = self.ENTROPY_SAMPLE_MARGIN
+            # An upper bound of 8 bits per byte can never be exceeded, so only a lower one can be borderline.
+            if abs(entropy - min_entropy) < margin or (max_entropy < 8.0 and abs(entropy - max_entropy) < margin):
+                entropy = self.range_entropy(read, start, end)
+        if min_entropy <= entropy <= max_entropy:
+            score += self.ENTROPY_WEIGHT
+        return None if score >= self.SCORE_THRESHOLD else "entropy"
+
+
+    def sampled_entropy(self, read, start, end):
+        """
+        Estimates the entropy of [start, end) from ENTROPY_SAMPLE_BLOCKS evenly spaced blocks
+        of ENTROPY_SAMPLE_SIZE bytes (the exact entropy for fragments smaller than that).
+        """
+        size = end - start
+        if size <= self.ENTROPY_SAMPLE_BLOCKS * self.ENTROPY_SAMPLE_SIZE:
+            return self.range_entropy(read, start, end)
+        counts = [0] * 256
+        stride = (size - self.ENTROPY_SAMPLE_SIZE) // (self.ENTROPY_SAMPLE_BLOCKS - 1)
+        for block in range(self.ENTROPY_SAMPLE_BLOCKS):
+            counts = add_histograms(byte_histogram(read(start + block * stride, self.ENTROPY_SAMPLE_SIZE)), counts)
+        return self.entropy_from_counts(counts, self.ENTROPY_SAMPLE_BLOCKS * self.ENTROPY_SAMPLE_SIZE)
+
+
+    def range_entropy(self, read, start, end, chunk_size=STREAM_CHUNK_SIZE):
+        """Computes the exact entropy of [start, end) through read(position, length) in bounded chunks."""
+        counts = [0] * 256
+        with self.stats.stage("entropy", end - start):
+            for position in range(start, end, chunk_size):
+                counts = add_histograms(byte_histogram(read(position, min(chunk_size, end - position))), counts)
+        return self.entropy_from_counts(counts, end - start)
+
 
-        # For our purposes, a score of 0.7 or higher indicates the file is likely intact.
-        # (This threshold can be adjusted as needed.)
-        return score >= 0.7
+    # --- Output Writing ---
+    def copy_range(self, src_fd, offset, size, dst_fd, chunk_size=STREAM_CHUNK_SIZE):
+        """
+        Copies size bytes starting at offset of the image fd src_fd to the current position of dst_fd.
+        The copy stays in the kernel where possible (copy_file_range, then sendfile); otherwise it
+        falls back to bounded chunked reads, so memory use never depends on the fragment size.
+        Returns the number of bytes copied.
+        """
+        copied = 0
+        if hasattr(os, "copy_file_range"):
+            try:
+                while copied < size:
+                    n = os.copy_file_range(src_fd, dst_fd, size - copied, offset + copied)
+                    if n == 0:
+                        return copied
+                    copied += n
+            except OSError:
+                # Not supported for this pair of file systems; continue with the next method.
+                pass
+        if copied < size and hasattr(os, "sendfile"):
+            try:
+                while copied < size:
+                    n = os.sendfile(dst_fd, src_fd, offset + copied, size - copied)
+                    if n == 0:
+                        return copied
+                    copied += n
+            except OSError:
+                pass
+        if copied < size and hasattr(os, "pread"):
+            # Positional reads leave the shared file offset alone, so concurrent copies are safe.
+            while copied < size:
+                chunk = os.pread(src_fd, min(chunk_size, size - copied), offset + copied)
+                if not chunk:
+                    break
+                os.write(dst_fd, chunk)
+                copied += len(chunk)
+        elif copied < size:
+            os.lseek(src_fd, offset + copied, os.SEEK_SET)
+            while copied < size:
+                chunk = os.read(src_fd, min(chunk_size, size - copied))
+                if not chunk:
+                    break
+                os.write(dst_fd, chunk)
+                copied += len(chunk)
+        return copied
 
 
     # --- Main Carving Function ---
-    def carve_files(self, image_path, output_dir, signatures, gap_threshold=1024 * 1024):
+    def carve_files(self, image_path, output_dir, signatures, gap_threshold=1024 * 1024, alignment=None, dedup=None):
         """
         Carves files from a disk image (or binary file) using provided file signatures.
         It handles both contiguous fragments and orphan fragments (which may be merged if gaps are small).
         Before writing out a recovered file, it verifies the file's integrity using header/footer matching
-        and Shannon entropy.
+        and Shannon entropy. With alignment set, headers are only searched for at multiples of it.
+        With dedup="skip" or "link", files identical to one already recovered are skipped or hardlinked.
         """
+        self.check_dedup_mode(dedup)
         if not os.path.exists(output_dir):
             os.makedirs(output_dir)
+        signatures = self.signature_set(signatures)
         with open(image_path, "rb") as f:
             mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            occurrences = self.find_signature_occurrences(mm, signatures, alignment=alignment)
+            self.stats.count_hits(signatures, occurrences)
+            view = memoryview(mm)
+            read = lambda position, length: view[position:position + length]
+            entropy_engine = EntropyEngine(mm)
+            content_index = ContentIndex(lambda position, length: mm[position:position + length]) if dedup else None
             file_counter = 0
 
             for sig in signatures:
@@ -234,18 +1414,100 @@ class FILE_CARVER:
                 header = sig["header"]
                 footer = sig["footer"]
                 print(f"\nProcessing file type: {ext} (header: {header}, footer: {footer})")
-                fragments = self.get_fragments(mm, header, footer, gap_threshold)
+                footers = occurrences[footer] if footer else None
+                fragments = self.get_fragments(mm, header, footer, gap_threshold, headers=occurrences[header], footers=footers, max_length=self.max_carve_length(sig), size_parser=self.get_size_parser(sig))
 
                 for frag in fragments:
                     start, end = frag
-                    carved_data = mm[start:end]
                     # Verify file integrity using our custom heuristic.
-                    if self.verify_file_integrity(carved_data, ext, header, footer):
+                    if self.verify_range(read, ext, header, footer, start, end):
+                        with self.stats.stage("entropy", end - start):
+                            entropy = entropy_engine.entropy(start, end)
                         file_counter += 1
                         output_filename = os.path.join(output_dir, f"recovered_{file_counter}.{ext}")
-                        with open(output_filename, "wb") as outf:
-                            outf.write(carved_data)
-                        print(f"Recovered file: {output_filename} (offsets {start} to {end}, entropy: {self.compute_entropy(carved_data):.2f})")
+                        original = content_index.add(output_filename, start, end - start) if content_index is not None else None
+                        if original is not None:
+                            placed = self.place_duplicate(dedup, original, output_filename)
+                            print(f"Duplicate of {original}: {placed} (offsets {start} to {end})")
+                            continue
+                        with open(output_filename, "wb") as outf, self.stats.stage("write", end - start):
+                            self.copy_range(f.fileno(), start, end - start, outf.fileno())
+                        print(f"Recovered file: {output_filename} (offsets {start} to {end}, entropy: {entropy:.2f})")
                     else:
-                        print(f"Fragment at offsets {start}-{end} for {ext} failed integrity check (entropy: {self.compute_entropy(carved_data):.2f}).")
+                        print(f"Fragment at offsets {start}-{end} for {ext} failed integrity check.")
+            entropy_engine.close()
+            view.release()
+            mm.close()
+
+
+# --- Process Pool Helpers ---
+def _shutdown_pool(executor):
+    """
+    Shuts executor down, dropping the tasks it has not started yet. cancel_futures needs Python 3.9;
+    older versions let those tasks finish (callers keep at most a few pipeline depths queued).
+    """
+    if sys.version_info >= (3, 9):
+        executor.shutdown(cancel_futures=True)
+    else:
+        executor.shutdown()
+
+
+# --- Process Pool Workers ---
+# Module-level so they can be pickled by ProcessPoolExecutor.
+def _worker_carver(stats_enabled, tracing):
+    """
+    Returns a FILE_CARVER for a worker process, recording into a fresh ScanStats if the parent does;
+    if the parent traces, the worker keeps its events so they are returned with its totals.
+    """
+    carver = FILE_CARVER()
+    if stats_enabled:
+        carver.stats = ScanStats(keep_events=tracing)
+    return carver
+
+
+def _scan_shard(args):
+    """
+    Searches one [start, end) shard of the image for every header and footer.
+    Returns (occurrences, stats), where stats is the worker's ScanStats.as_dict() or None.
+    """
+    image_path, signatures, start, end, alignment, stats_enabled, tracing = args
+    carver = _worker_carver(stats_enabled, tracing)
+    with open(image_path, "rb") as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            occurrences = carver.find_signature_occurrences(mm, signatures, start=start, end=end, alignment=alignment)
+        finally:
             mm.close()
+    return occurrences, carver.stats.as_dict() if stats_enabled else None
+
+
+def _verify_batch(args):
+    """
+    Verifies a batch of candidate fragments.
+    Returns ({candidate index: entropy} for those that pass, the worker's stats dict or None).
+    """
+    image_path, indexes, candidates, stats_enabled, tracing = args
+    carver = _worker_carver(stats_enabled, tracing)
+    verified = {}
+    with open(image_path, "rb") as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(mm)
+        read = lambda position, length: view[position:position + length]
+        entropy_engine = EntropyEngine(mm)
+        try:
+            for index, (ext, header, footer, start, end) in zip(indexes, candidates):
+                if carver.verify_range(read, ext, header, footer, start, end):
+                    with carver.stats.stage("entropy", end - start):
+                        verified[index] = entropy_engine.entropy(start, end)
+        finally:
+            entropy_engine.close()
+            view.release()
+            mm.close()
+    return verified, carver.stats.as_dict() if stats_enabled else None
+
+
+def _first_valid_batch(args):
+    """Validates one batch of bifragment candidates in order; returns the first valid reassembly's ranges or None."""
+    image_path, ext, start, resume, candidate_list, max_length, image_size, blocked = args
+    with open(image_path, "rb") as f:
+        return bifragment.first_valid(FILE_CARVER().file_reader(f), STRUCTURE_VALIDATORS[ext], start, resume, candidate_list, max_length, image_size, MIN_TAIL.get(ext, 0), blocked)
@@ -0,0 +1,127 @@
+# bifragment.py
+
+"""
+Bifragment gap carving: recovers a file stored as two fragments, where a
+header-anchored run of clusters is followed by a gap of unrelated clusters and
+then a footer-anchored run holding the rest of the file.
+
+A file whose structure check (lib/structure_validators) fails when it is read
+contiguously from its header has its first fragment end somewhere between the
+validator's resume point and the point where the check failed. Candidates are
+every cluster-aligned split point in that range (from the failure backwards,
+at most split_window bytes), combined with every cluster-aligned start of the
+second fragment up to max_gap bytes later and no later than the last footer
+within reach. The first fragment of a split is checked once, up to the split;
+each of its candidates then re-runs the structure check on the reassembled
+bytes from the last resume point before the split (the start of the PNG chunk
+or ZIP member the split falls in, or the split itself inside a JPEG scan).
+Most wrong candidates fail within the first chunk, JPEG marker or ZIP member
+past the split, so each one costs little more than that.
+
+A cluster belongs to at most one file, so neither fragment may overlap the
+blocked ranges: the extents of intact (structurally valid) files, the header
+clusters of other files and the fragments of files already reassembled.
+Without this, the tail of a truncated file is "completed" with the body of
+the next intact file of the same format, which validates just as well.
+
+first_valid evaluates candidates in order and stops at the first one whose
+reassembly validates; FILE_CARVER.carve_bifragments spreads batches of
+candidates over a process pool and stops submitting once a batch succeeds.
+"""
+
+import bisect
+
+
+def fragment_reader(read, fragments):
+    """Returns read(position, length) over the concatenation of the (start, end) image ranges in fragments."""
+    starts = []
+    total = 0
+    for start, end in fragments:
+        starts.append(total)
+        total += end - start
+
+    def reassembled(position, length):
+        pieces = []
+        index = max(bisect.bisect_right(starts, position) - 1, 0)
+        while length > 0 and index < len(fragments):
+            start, end = fragments[index]
+            offset = position - starts[index]
+            if 0 <= offset < end - start:
+                piece = read(start + offset, min(length, end - start - offset))
+                if not piece:
+                    break
+                pieces.append(piece)
+                position += len(piece)
+                length -= len(piece)
+            else:
+                index += 1
+        return b"".join(pieces)
+    return reassembled
+
+
+def overlaps(ranges, start, end):
+    """Returns whether [start, end) overlaps any of the sorted, disjoint (start, end) ranges."""
+    index = bisect.bisect_left(ranges, (end,))
+    return index > 0 and ranges[index - 1][1] > start
+
+
+def add_range(ranges, start, end):
+    """Adds [start, end) to the sorted, disjoint (start, end) ranges, merging it with those it touches."""
+    low = bisect.bisect_left(ranges, (start,))
+    if low > 0 and ranges[low - 1][1] >= start:
+        low -= 1
+    high = low
+    while high < len(ranges) and ranges[high][0] <= end:
+        start = min(start, ranges[high][0])
+        end = max(end, ranges[high][1])
+        high += 1
+    ranges[low:high] = [(start, end)]
+
+
+def candidates(start, resume_at, failed_at, footers, cluster_size, max_gap, split_window, max_candidates, blocked=()):
+    """
+    Returns the (split, second_start) candidates for a file whose header is at image offset start:
+    split is the length of the first fragment, second_start the image offset of the second.
+    resume_at and failed_at are file-relative (from the contiguous structure check); footers are
+    the sorted image offsets of the format's footer. Splits are tried nearest to the failure first,
+    and for each split the smallest gaps first. Candidates whose first fragment (past its header
+    cluster) overlaps blocked, or whose second fragment starts inside it, are left out.
+    At most max_candidates are returned.
+    """
+    result = []
+    highest = failed_at // cluster_size * cluster_size
+    lowest = max(-(-resume_at // cluster_size) * cluster_size, cluster_size, highest - split_window)
+    for split in range(highest, lowest - 1, -cluster_size):
+        first_end = start + split
+        # The second fragment holds the footer, so it starts no later than the last footer.
+        if not footers or footers[-1] <= first_end or overlaps(blocked, start + cluster_size, first_end):
+            continue
+        last_start = min(first_end + max_gap, footers[-1])
+        for second_start in range(first_end + cluster_size, last_start + 1, cluster_size):
+            if overlaps(blocked, second_start, second_start + 1):
+                continue
+            result.append((split, second_start))
+            if len(result) >= max_candidates:
+                return result
+    return result
+
+
+def first_valid(read, validator, start, resume, candidate_list, max_length, image_size, min_tail=0, blocked=()):
+    """
+    Validates the candidates in order and returns the fragments [(start, end), (start, end)]
+    of the first whose reassembly passes validator with a second fragment of at least min_tail
+    bytes (see structure_validators.MIN_TAIL) that does not overlap blocked, or None. The first
+    fragment of each split is checked once, and its candidates are validated from the last
+    resume point before the split.
+    """
+    split_resume = (None, None)
+    for split, second_start in candidate_list:
+        if split_resume[0] != split:
+            _, prefix_resume, _ = validator(fragment_reader(read, [(start, start + split)]), split, resume)
+            split_resume = (split, prefix_resume)
+        limit = min(max_length, split + image_size - second_start)
+        fragments = [(start, start + split), (second_start, image_size)]
+        size, _, _ = validator(fragment_reader(read, fragments), limit, split_resume[1])
+        if size is not None and size - split >= max(min_tail, 1) and not overlaps(blocked, second_start, second_start + size - split):
+            return [(start, start + split), (second_start, second_start + size - split)]
+    return None
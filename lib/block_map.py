@@ -0,0 +1,144 @@
+# block_map.py
+
+"""
+BlockMap: a compact per-block classification of an image, built in one pass
+before the signature search.
+
+Every BLOCK_SIZE block is classified as:
+  - ZERO: every byte is 0x00 (never written or wiped),
+  - UNIFORM: every byte has the same non-zero value (e.g. 0xFF erased flash),
+  - LOW: at most LOW_DISTINCT_BYTES distinct byte values, which bounds the
+    entropy to log2(LOW_DISTINCT_BYTES) = 4 bits per byte (sparse tables,
+    padding, simple bitmaps),
+  - HIGH: anything else (text, code, compressed or encrypted data).
+ZERO and UNIFORM blocks are "dead": no file data worth carving starts or
+continues in a long run of them.
+
+Classes take 2 bits per block (4 blocks per byte, 64 MiB of map for a 1 TiB
+image with 4 KiB blocks). With NumPy installed, whole windows of blocks are
+classified with vectorized compares and a per-block bincount; otherwise each
+block is compared against a precomputed uniform block and its distinct bytes
+are counted with set().
+"""
+
+import re
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+BLOCK_SIZE = 4096
+LOW_DISTINCT_BYTES = 16
+# Blocks classified per read.
+WINDOW_BLOCKS = 256
+
+ZERO = 0
+UNIFORM = 1
+LOW = 2
+HIGH = 3
+CLASS_NAMES = ("zero", "uniform", "low", "high")
+
+# Map bytes whose four 2-bit fields are all ZERO or UNIFORM (high bit of each field clear).
+_DEAD_BYTES = re.compile(b"[" + b"".join(re.escape(bytes((b,))) for b in range(256) if not b & 0xAA) + b"]+")
+
+
+class BlockMap:
+
+    def __init__(self, size, block_size=BLOCK_SIZE):
+        """An all-ZERO map for an image of size bytes; filled in by build_block_map."""
+        self.size = size
+        self.block_size = block_size
+        self.count = -(-size // block_size)
+        self.bits = bytearray(-(-self.count // 4))
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index):
+        return self.bits[index >> 2] >> ((index & 3) * 2) & 3
+
+    def set_classes(self, first, classes):
+        """Stores the classes (a sequence of ints) of consecutive blocks starting at block first."""
+        bits = self.bits
+        index = first
+        for block_class in classes:
+            shift = (index & 3) * 2
+            bits[index >> 2] = bits[index >> 2] & ~(3 << shift) | block_class << shift
+            index += 1
+
+    def class_counts(self):
+        """Returns {class name: number of blocks}."""
+        counts = [0, 0, 0, 0]
+        for index in range(self.count):
+            counts[self[index]] += 1
+        return dict(zip(CLASS_NAMES, counts))
+
+    def dead_runs(self, min_length):
+        """
+        Returns the sorted (start, end) byte ranges of runs of ZERO/UNIFORM blocks at least
+        min_length bytes long. Runs are found four blocks at a time, so up to three dead
+        blocks at either end of a run may be left out (never a live one included).
+        """
+        runs = []
+        unit = 4 * self.block_size
+        for m in _DEAD_BYTES.finditer(self.bits):
+            start = m.start() * unit
+            end = min(m.end() * unit, self.size)
+            if end - start >= min_length:
+                runs.append((start, end))
+        return runs
+
+
+def _classify_numpy(window, block_size):
+    blocks = np.frombuffer(window, dtype=np.uint8)
+    count = len(blocks) // block_size
+    rows = blocks[:count * block_size].reshape(count, block_size)
+    first = rows[:, 0]
+    uniform = (rows == first[:, None]).all(axis=1)
+    classes = np.where(uniform, np.where(first == 0, ZERO, UNIFORM), HIGH).astype(np.uint8)
+    mixed = np.flatnonzero(~uniform)
+    if len(mixed):
+        keys = (np.arange(len(mixed), dtype=np.int32)[:, None] * 256 + rows[mixed]).ravel()
+        distinct = (np.bincount(keys, minlength=len(mixed) * 256).reshape(len(mixed), 256) > 0).sum(axis=1)
+        classes[mixed[distinct <= LOW_DISTINCT_BYTES]] = LOW
+    return classes.tolist()
+
+
+def _classify_python(window, block_size, uniform_blocks):
+    classes = []
+    for pos in range(0, len(window) - block_size + 1, block_size):
+        block = window[pos:pos + block_size]
+        first = block[0]
+        if block == uniform_blocks[first]:
+            classes.append(ZERO if first == 0 else UNIFORM)
+        elif len(set(block)) <= LOW_DISTINCT_BYTES:
+            classes.append(LOW)
+        else:
+            classes.append(HIGH)
+    return classes
+
+
+def classify_block(block):
+    """Classifies a single block (used for a short last block)."""
+    if not block or block == bytes((block[0],)) * len(block):
+        return ZERO if not block or block[0] == 0 else UNIFORM
+    return LOW if len(set(block)) <= LOW_DISTINCT_BYTES else HIGH
+
+
+def build_block_map(read, size, block_size=BLOCK_SIZE):
+    """Classifies every block of the size-byte image read through read(position, length)."""
+    block_map = BlockMap(size, block_size)
+    uniform_blocks = [bytes((value,)) * block_size for value in range(256)]
+    window_size = WINDOW_BLOCKS * block_size
+    for position in range(0, size, window_size):
+        window = bytes(read(position, min(window_size, size - position)))
+        full = len(window) - len(window) % block_size
+        if np is not None:
+            classes = _classify_numpy(window[:full], block_size) if full else []
+        else:
+            classes = _classify_python(window, block_size, uniform_blocks)
+        if full < len(window):
+            classes.append(classify_block(window[full:]))
+        block_map.set_classes(position // block_size, classes)
+    return block_map
@@ -0,0 +1,77 @@
+# dedup.py
+
+"""
+ContentIndex: finds carved files whose bytes are identical to a file carved
+before, so the output stage can skip or hardlink them instead of writing
+another copy.
+
+The same JPEG or ZIP is often found many times on one image (slack space,
+thumbnails, copies). Comparing full hashes of every candidate would read each
+file twice, so each file first gets a cheap fingerprint: its size plus a
+BLAKE2b digest of its first and last FINGERPRINT_SIZE bytes. Only files whose
+fingerprint is shared get a full streaming SHA-256, and an earlier file is
+only hashed once a later one collides with it. Files no longer than
+2 * FINGERPRINT_SIZE are covered entirely by the fingerprint and never
+hashed again.
+"""
+
+import hashlib
+
+FINGERPRINT_SIZE = 4096
+# Read size of the full-content hash.
+HASH_CHUNK_SIZE = 4 * 1024 * 1024
+DEDUP_MODES = ("skip", "link")
+
+
+class ContentIndex:
+
+    def __init__(self, read):
+        """Indexes content of the image read through read(position, length)."""
+        self.read = read
+        # (size, prefix/suffix digest) -> [[key, offset, full digest or None, read], ...]
+        self.by_fingerprint = {}
+        self.full_hashes = 0
+        self.duplicates = 0
+
+    def fingerprint(self, offset, size, read):
+        digest = hashlib.blake2b(digest_size=16)
+        if size <= 2 * FINGERPRINT_SIZE:
+            digest.update(read(offset, size))
+        else:
+            digest.update(read(offset, FINGERPRINT_SIZE))
+            digest.update(read(offset + size - FINGERPRINT_SIZE, FINGERPRINT_SIZE))
+        return size, digest.digest()
+
+    def full_hash(self, offset, size, read):
+        self.full_hashes += 1
+        digest = hashlib.sha256()
+        for position in range(offset, offset + size, HASH_CHUNK_SIZE):
+            digest.update(read(position, min(HASH_CHUNK_SIZE, offset + size - position)))
+        return digest.digest()
+
+    def add(self, key, offset, size, read=None):
+        """
+        Registers the size bytes at offset under key. Returns the key of an earlier
+        registered file with identical content, or None if the content is new.
+        read, if given, replaces the image reader for this file (e.g. a
+        bifragment.fragment_reader over a fragmented file, with offset 0).
+        """
+        if read is None:
+            read = self.read
+        fingerprint = self.fingerprint(offset, size, read)
+        entries = self.by_fingerprint.get(fingerprint)
+        if entries is None:
+            self.by_fingerprint[fingerprint] = [[key, offset, None, read]]
+            return None
+        if size <= 2 * FINGERPRINT_SIZE:
+            self.duplicates += 1
+            return entries[0][0]
+        digest = self.full_hash(offset, size, read)
+        for entry in entries:
+            if entry[2] is None:
+                entry[2] = self.full_hash(entry[1], size, entry[3])
+            if entry[2] == digest:
+                self.duplicates += 1
+                return entry[0]
+        entries.append([key, offset, digest, read])
+        return None
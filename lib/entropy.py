@@ -0,0 +1,124 @@
+# entropy.py
+
+"""
+Byte histogram and Shannon entropy helpers used by the carver.
+
+Histograms are computed with NumPy's bincount over a zero-copy view of the
+data when NumPy is installed, and with collections.Counter otherwise.
+
+EntropyEngine answers entropy queries for arbitrary [start, end) ranges of
+one image. Ranges spanning several blocks are assembled from per-block
+histograms that are computed once and reused, so overlapping fragments
+(e.g. merged orphans that cover contiguous fragments) never rescan the same
+bytes, and the entropy of each range is cached. Both caches are LRU-bounded
+(CACHED_BLOCKS and CACHED_RANGES), so memory stays flat however large the
+image. The fragments of a signature are verified in offset order, so the
+blocks that overlapping fragments share are still cached when reused.
+"""
+
+import math
+from collections import Counter, OrderedDict
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+def byte_histogram(data):
+    """
+    Returns the 256 byte counts of data (bytes, bytearray, memoryview or mmap)
+    as a NumPy array, or as a list when NumPy is not available.
+    """
+    if np is not None:
+        return np.bincount(np.frombuffer(data, dtype=np.uint8), minlength=256)
+    counts = [0] * 256
+    for byte, count in Counter(memoryview(data)).items():
+        counts[byte] = count
+    return counts
+
+
+def add_histograms(total, counts):
+    """Adds counts into total in place and returns total."""
+    if np is not None:
+        total += counts
+        return total
+    for byte in range(256):
+        total[byte] += counts[byte]
+    return total
+
+
+def shannon_entropy(counts, length):
+    """
+    Computes the Shannon entropy (in bits per byte) from byte counts totalling length bytes.
+    """
+    if not length:
+        return 0
+    if np is not None and isinstance(counts, np.ndarray):
+        p = counts[counts > 0] / length
+        return float(-(p * np.log2(p)).sum())
+    entropy = 0
+    for count in counts:
+        if count:
+            p = count / length
+            entropy -= p * math.log2(p)
+    return entropy
+
+
+class EntropyEngine:
+
+    # Block histograms (of block_size bytes each) and range entropies kept, least recently used dropped first.
+    CACHED_BLOCKS = 64
+    CACHED_RANGES = 4096
+
+    def __init__(self, data, block_size=4 * 1024 * 1024):
+        """
+        Wraps data (typically the image mmap) for repeated range entropy queries.
+        Call close() before closing the underlying mmap.
+        """
+        self.view = memoryview(data)
+        self.block_size = block_size
+        self._blocks = OrderedDict()
+        self._cache = OrderedDict()
+
+    def _block_histogram(self, block):
+        counts = self._blocks.get(block)
+        if counts is None:
+            start = block * self.block_size
+            counts = byte_histogram(self.view[start:start + self.block_size])
+            self._blocks[block] = counts
+            if len(self._blocks) > self.CACHED_BLOCKS:
+                self._blocks.popitem(last=False)
+        else:
+            self._blocks.move_to_end(block)
+        return counts
+
+    def histogram(self, start, end):
+        """Returns the byte histogram of [start, end)."""
+        first_block = -(-start // self.block_size)
+        last_block = end // self.block_size
+        if last_block - first_block < 2:
+            return byte_histogram(self.view[start:end])
+        total = byte_histogram(self.view[start:first_block * self.block_size])
+        for block in range(first_block, last_block):
+            add_histograms(total, self._block_histogram(block))
+        return add_histograms(total, byte_histogram(self.view[last_block * self.block_size:end]))
+
+    def entropy(self, start, end):
+        """Returns the Shannon entropy of [start, end), computed at most once per range."""
+        key = (start, end)
+        entropy = self._cache.get(key)
+        if entropy is None:
+            entropy = shannon_entropy(self.histogram(start, end), end - start)
+            self._cache[key] = entropy
+            if len(self._cache) > self.CACHED_RANGES:
+                self._cache.popitem(last=False)
+        else:
+            self._cache.move_to_end(key)
+        return entropy
+
+    def close(self):
+        """Releases the view so the underlying mmap can be closed."""
+        self._blocks.clear()
+        self._cache.clear()
+        self.view.release()
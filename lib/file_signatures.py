@@ -6,6 +6,8 @@ Each dictionary includes:
   - "extension": the file extension (without the dot)
   - "header": the file's magic number (as bytes)
   - "footer": the expected file footer (as bytes) or None if not defined.
+  - "max_size" (optional): the longest fragment to carve for this signature,
+    overriding FILE_CARVER.MAX_CARVE_LENGTH.
 
 This collection includes image, archive/compression, document, executable,
 audio, video, font, disk image, and miscellaneous binary file types.
@@ -177,3 +179,55 @@ SIGNATURES = [
     # Serialized Java Object
     {"extension": "ser", "header": b"\xac\xed\x00\x05", "footer": None},
 ]
+
+
+"""
+CATEGORIES: the extensions of SIGNATURES grouped like the sections above, for
+selecting a subset of signatures (see lib/signature_set.SignatureSet.select).
+"""
+
+CATEGORIES = {
+    "image": ["jpg", "png", "gif", "tiff", "bmp", "ico", "webp", "jp2", "heic", "heif", "avif", "exr", "pcx"],
+    "archive": ["zip", "rar", "rar5", "7z", "gz", "bz2", "xz", "lzma", "Z", "lzip", "cab", "arj", "lz4", "zst", "lzo", "zpaq"],
+    "document": ["pdf", "doc", "xls", "ppt", "docx", "xlsx", "pptx", "docm", "xlsm", "pptm", "odt", "ods", "odp", "epub", "rtf", "chm", "mobi", "ps", "eps", "xps"],
+    "executable": ["exe", "elf", "macho"],
+    "audio": ["mp3", "wav", "flac", "ogg", "aac"],
+    "video": ["avi", "mp4", "mkv", "mov"],
+    "font": ["ttf", "otf", "woff", "woff2"],
+    "disk_image": ["dmg", "vhd", "vmdk"],
+    "misc": ["swf", "ser"],
+}
+
+
+"""
+VERIFICATION_RULES: per-extension integrity thresholds used by
+FILE_CARVER.verify_file_integrity. Extensions not listed use DEFAULT_VERIFICATION_RULE.
+Each rule may include:
+  - "min_size": fragments must be strictly larger than this many bytes.
+  - "max_size" (optional): fragments larger than this are rejected outright.
+  - "min_entropy" / "max_entropy": the expected Shannon entropy range (bits per byte).
+  - "magic" (optional): a list of (offset, bytes) pairs that must appear at fixed offsets
+    from the start of the file, for formats whose header alone is ambiguous.
+"""
+
+DEFAULT_VERIFICATION_RULE = {"min_size": 256, "min_entropy": 3.0, "max_entropy": 8.0}
+
+VERIFICATION_RULES = {
+    # JPEG files are usually compressed with high entropy.
+    "jpg": {"min_size": 1024, "min_entropy": 7.0, "max_entropy": 8.0},
+    "jpeg": {"min_size": 1024, "min_entropy": 7.0, "max_entropy": 8.0},
+    "png": {"min_size": 1024, "min_entropy": 7.0, "max_entropy": 8.0},
+    # PDFs can vary; use a broad entropy range.
+    "pdf": {"min_size": 1024, "min_entropy": 4.5, "max_entropy": 8.0},
+    "gif": {"min_size": 512, "min_entropy": 3.5, "max_entropy": 7.0},
+    "zip": {"min_size": 1024, "min_entropy": 7.0, "max_entropy": 8.0},
+    # RIFF containers share the "RIFF" header; the form type follows the chunk size.
+    "webp": {"min_size": 256, "min_entropy": 3.0, "max_entropy": 8.0, "magic": [(8, b"WEBP")]},
+    "wav": {"min_size": 256, "min_entropy": 3.0, "max_entropy": 8.0, "magic": [(8, b"WAVE")]},
+    "avi": {"min_size": 256, "min_entropy": 3.0, "max_entropy": 8.0, "magic": [(8, b"AVI ")]},
+    # OpenDocument / EPUB store an uncompressed "mimetype" entry first in the archive.
+    "odt": {"min_size": 256, "min_entropy": 3.0, "max_entropy": 8.0, "magic": [(30, b"mimetypeapplication/vnd.oasis.opendocument.text")]},
+    "ods": {"min_size": 256, "min_entropy": 3.0, "max_entropy": 8.0, "magic": [(30, b"mimetypeapplication/vnd.oasis.opendocument.spreadsheet")]},
+    "odp": {"min_size": 256, "min_entropy": 3.0, "max_entropy": 8.0, "magic": [(30, b"mimetypeapplication/vnd.oasis.opendocument.presentation")]},
+    "epub": {"min_size": 256, "min_entropy": 3.0, "max_entropy": 8.0, "magic": [(30, b"mimetypeapplication/epub+zip")]},
+}
@@ -0,0 +1,135 @@
+# fragment_assembler.py
+
+"""
+FragmentAssembler: incremental form of FILE_CARVER.get_fragments for one
+signature, used by the pipelined scan (FILE_CARVER.carve_pipeline) to hand
+candidate fragments to verification while the search is still running.
+
+Header and footer offsets are fed in ascending order together with the search
+horizon: the image offset before which every match has been reported. A
+header is settled as soon as the hits before the horizon decide its fragment:
+  - a size parser resolves its size (no search information needed),
+  - the first footer after it is known, or no footer can still be found
+    within max_length,
+  - for an orphan, the next header is known or lies beyond max_length.
+Orphans are merged exactly like get_fragments does, and a merged orphan is
+released once no later orphan can still join it. Once the horizon reaches the
+end of the image (finish), the fragments produced are the same as those from
+get_fragments over all the offsets, though not in the same order.
+"""
+
+import bisect
+
+
+class FragmentAssembler:
+
+    def __init__(self, header, footer, gap_threshold, image_size, max_length, size_parser=None, read=None, empty_starts=None):
+        self.header = header
+        self.footer = footer
+        self.gap_threshold = gap_threshold
+        self.image_size = image_size
+        self.max_length = max_length
+        self.size_parser = size_parser
+        self.read = read
+        self.empty_starts = empty_starts
+        self.headers = []
+        self.footers = []
+        self.searched = 0
+        self.finished = False
+        self.next_header = 0  # Index of the first header that is not settled yet.
+        self.next_footer = 0
+        self.parsed = -1  # Index of the last header already tried with the size parser.
+        self.chain = None  # (start, end) of the orphan fragments being merged.
+
+    def feed(self, headers, footers, searched):
+        """
+        Adds the header and footer offsets found below the search horizon searched (each list
+        sorted and following the offsets fed before). Returns the newly settled (start, end) fragments.
+        """
+        self.headers.extend(headers)
+        if footers:
+            self.footers.extend(footers)
+        self.searched = searched
+        return self.settle()
+
+    def finish(self):
+        """Marks the whole image as searched and returns every remaining fragment."""
+        self.searched = self.image_size
+        self.finished = True
+        fragments = self.settle()
+        if self.chain is not None:
+            fragments.append(self.chain)
+            self.chain = None
+        return fragments
+
+    def settle(self):
+        fragments = []
+        headers = self.headers
+        while self.next_header < len(headers):
+            fragment = self.settle_header(self.next_header)
+            if fragment is None:
+                break
+            self.next_header += 1
+            is_orphan, fragment = fragment
+            if not is_orphan:
+                fragments.append(fragment)
+            elif self.chain is None:
+                self.chain = fragment
+            elif self.can_merge(self.chain, fragment[0], fragment[1]):
+                self.chain = (self.chain[0], fragment[1])
+            else:
+                fragments.append(self.chain)
+                self.chain = fragment
+        if self.chain is not None and not self.finished:
+            # Any later orphan starts at or after the next unsettled header (or the horizon).
+            lower = headers[self.next_header] if self.next_header < len(headers) else self.searched
+            chain_start, chain_end = self.chain
+            if lower - chain_end >= self.gap_threshold or lower - chain_start >= self.max_length or self.crosses_empty(chain_end, lower):
+                fragments.append(self.chain)
+                self.chain = None
+        return fragments
+
+    def settle_header(self, idx):
+        """Returns (is_orphan, (start, end)) for header idx, or None while the search cannot decide it yet."""
+        pos = self.headers[idx]
+        max_length = self.max_length
+        if self.size_parser is not None and self.parsed < idx:
+            self.parsed = idx
+            size = self.size_parser(self.read, pos, min(max_length, self.image_size - pos))
+            if size:
+                return False, (pos, pos + size)
+        if self.footer:
+            footers = self.footers
+            footer_len = len(self.footer)
+            while self.next_footer < len(footers) and footers[self.next_footer] < pos + len(self.header):
+                self.next_footer += 1
+            if self.next_footer < len(footers):
+                footer_offset = footers[self.next_footer]
+                if footer_offset + footer_len - pos <= max_length:
+                    return False, (pos, footer_offset + footer_len)
+            elif not self.finished and self.searched + footer_len - pos <= max_length:
+                # A footer found later could still end within max_length.
+                return None
+        if idx + 1 < len(self.headers):
+            next_header = self.headers[idx + 1]
+        elif self.finished or self.searched >= pos + max_length:
+            next_header = self.image_size
+        else:
+            return None
+        orphan_end = min(next_header, pos + max_length)
+        if self.empty_starts:
+            next_empty = bisect.bisect_right(self.empty_starts, pos)
+            if next_empty < len(self.empty_starts):
+                orphan_end = min(orphan_end, self.empty_starts[next_empty])
+        return True, (pos, orphan_end)
+
+    def can_merge(self, chain, frag_start, frag_end):
+        chain_start, chain_end = chain
+        return frag_start - chain_end < self.gap_threshold and frag_end - chain_start <= self.max_length and not self.crosses_empty(chain_end, frag_start)
+
+    def crosses_empty(self, start, end):
+        """True if a long empty run begins in [start, end)."""
+        if not self.empty_starts:
+            return False
+        next_empty = bisect.bisect_left(self.empty_starts, start)
+        return next_empty < len(self.empty_starts) and self.empty_starts[next_empty] < end
@@ -0,0 +1,443 @@
+# fs_allocation.py
+
+"""
+Partition table and file system allocation parsing, used to restrict a scan to
+the unallocated space of an image (where deleted files live).
+
+Supported layouts:
+  - partition tables: GPT (512- or 4096-byte sectors) and MBR, including
+    logical partitions in an extended partition; an image without a partition
+    table is treated as a single volume,
+  - file systems: FAT12/16/32 (free FAT entries), NTFS (the $Bitmap metadata
+    file) and ext2/3/4 (block group bitmaps).
+
+Everything that cannot be proven allocated is treated as unallocated: space
+outside any partition, volumes with an unknown (or unparseable) file system,
+and ext block groups whose bitmap was never initialized. A restricted scan
+therefore never skips bytes that could hold deleted data.
+
+All parsers read the image through read(position, length) (see
+lib/size_parsers) and return absolute (start, end) byte ranges.
+"""
+
+import re
+import struct
+
+SECTOR_SIZE = 512
+# Bytes of a FAT read and decoded at once.
+FAT_CHUNK_SIZE = 4 * 1024 * 1024
+
+# Runs of fully free bytes, fully allocated bytes, and single mixed bytes of an allocation bitmap.
+_BITMAP_RUNS = re.compile(rb"\x00+|\xff+|[\x01-\xfe]")
+
+
+# --- Helpers ---
+def bitmap_free_runs(bitmap, count):
+    """
+    Returns the (first, end) index runs of clear bits among the first count bits of an
+    LSB-first allocation bitmap (NTFS, ext). Bits missing from a short bitmap count as free.
+    """
+    runs = []
+    run_start = None
+    for m in _BITMAP_RUNS.finditer(bitmap):
+        position = m.start() * 8
+        byte = bitmap[m.start()]
+        if byte == 0:
+            if run_start is None:
+                run_start = position
+        elif byte == 0xFF:
+            if run_start is not None:
+                runs.append((run_start, position))
+                run_start = None
+        else:
+            for bit in range(8):
+                if byte >> bit & 1:
+                    if run_start is not None:
+                        runs.append((run_start, position + bit))
+                        run_start = None
+                elif run_start is None:
+                    run_start = position + bit
+    if run_start is None and len(bitmap) * 8 < count:
+        run_start = len(bitmap) * 8
+    if run_start is not None:
+        runs.append((run_start, max(len(bitmap) * 8, count)))
+    return [(start, min(end, count)) for start, end in runs if start < count]
+
+
+def merge_extents(extents):
+    """Sorts (start, end) ranges and merges the ones that overlap or touch; empty ranges are dropped."""
+    merged = []
+    for start, end in sorted(extents):
+        if end <= start:
+            continue
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def intersect_extents(a, b):
+    """Returns the ranges covered by both sorted, merged extent lists a and b."""
+    result = []
+    i = j = 0
+    while i < len(a) and j < len(b):
+        start = max(a[i][0], b[j][0])
+        end = min(a[i][1], b[j][1])
+        if start < end:
+            result.append((start, end))
+        if a[i][1] < b[j][1]:
+            i += 1
+        else:
+            j += 1
+    return result
+
+
+def split_extents(extents, size):
+    """Splits (start, end) ranges into consecutive pieces of at most size bytes."""
+    return [(start, min(start + size, end)) for first, end in extents for start in range(first, end, size)]
+
+
+# --- FAT ---
+def _fat_geometry(boot):
+    """Returns (bytes per sector, sectors per cluster, reserved sectors, data start sector, clusters) of a FAT boot sector, or None."""
+    if len(boot) < SECTOR_SIZE or boot[510:512] != b"\x55\xaa" or bytes(boot[3:11]) in (b"NTFS    ", b"EXFAT   "):
+        return None
+    bytes_per_sector, sectors_per_cluster, reserved, fat_count, root_entries, total16 = struct.unpack_from("<HBHBHH", boot, 11)
+    fat16_sectors = struct.unpack_from("<H", boot, 22)[0]
+    total32, fat32_sectors = struct.unpack_from("<II", boot, 32)
+    if bytes_per_sector not in (512, 1024, 2048, 4096) or not sectors_per_cluster or sectors_per_cluster & (sectors_per_cluster - 1):
+        return None
+    if not reserved or fat_count not in (1, 2):
+        return None
+    fat_sectors = fat16_sectors or fat32_sectors
+    total_sectors = total16 or total32
+    root_sectors = (root_entries * 32 + bytes_per_sector - 1) // bytes_per_sector
+    data_start = reserved + fat_count * fat_sectors + root_sectors
+    if not fat_sectors or data_start >= total_sectors:
+        return None
+    return bytes_per_sector, sectors_per_cluster, reserved, data_start, (total_sectors - data_start) // sectors_per_cluster
+
+
+def fat_free_extents(read, offset, size):
+    """FAT12/16/32: clusters whose FAT entry is 0. Returns None if offset holds no FAT boot sector."""
+    geometry = _fat_geometry(read(offset, SECTOR_SIZE))
+    if geometry is None:
+        return None
+    bytes_per_sector, sectors_per_cluster, reserved, data_start, clusters = geometry
+    if clusters < 4085:
+        entry_bits = 12
+    elif clusters < 65525:
+        entry_bits = 16
+    else:
+        entry_bits = 32
+    cluster_size = sectors_per_cluster * bytes_per_sector
+    data_offset = offset + data_start * bytes_per_sector
+    fat_offset = offset + reserved * bytes_per_sector
+
+    free = []
+    run_start = None
+    # Entries 0 and 1 are reserved; cluster n is entry n.
+    for cluster, value in _fat_entries(read, fat_offset, entry_bits, clusters + 2):
+        if cluster < 2:
+            continue
+        if value == 0:
+            if run_start is None:
+                run_start = cluster
+        elif run_start is not None:
+            free.append((run_start, cluster))
+            run_start = None
+    if run_start is not None:
+        free.append((run_start, clusters + 2))
+    return [(data_offset + (start - 2) * cluster_size, data_offset + (end - 2) * cluster_size) for start, end in free]
+
+
+def _fat_entries(read, fat_offset, entry_bits, count):
+    """Yields (index, value) for the first count entries of a FAT."""
+    if entry_bits == 12:
+        table = read(fat_offset, (count * 3 + 1) // 2)
+        for index in range(min(count, len(table) * 2 // 3)):
+            value = table[index * 3 // 2] | table[index * 3 // 2 + 1] << 8
+            yield index, (value >> 4 if index & 1 else value & 0xFFF)
+        return
+    entry_size = entry_bits // 8
+    fmt = "<H" if entry_size == 2 else "<I"
+    mask = 0xFFFF if entry_size == 2 else 0x0FFFFFFF
+    per_chunk = FAT_CHUNK_SIZE // entry_size
+    for first in range(0, count, per_chunk):
+        table = read(fat_offset + first * entry_size, min(per_chunk, count - first) * entry_size)
+        for index, (value,) in enumerate(struct.iter_unpack(fmt, table[:len(table) - len(table) % entry_size]), first):
+            yield index, value & mask
+
+
+# --- NTFS ---
+def ntfs_free_extents(read, offset, size):
+    """NTFS: clear bits of the $Bitmap metadata file (MFT record 6). Returns None if offset holds no NTFS boot sector."""
+    boot = read(offset, SECTOR_SIZE)
+    if len(boot) < SECTOR_SIZE or bytes(boot[3:11]) != b"NTFS    ":
+        return None
+    bytes_per_sector = struct.unpack_from("<H", boot, 11)[0]
+    sectors_per_cluster = boot[13] if boot[13] <= 0x80 else 1 << (256 - boot[13])
+    total_sectors, mft_cluster = struct.unpack_from("<QQ", boot, 0x28)
+    clusters_per_record = struct.unpack_from("<b", boot, 0x40)[0]
+    cluster_size = bytes_per_sector * sectors_per_cluster
+    if not cluster_size:
+        return None
+    record_size = clusters_per_record * cluster_size if clusters_per_record > 0 else 1 << -clusters_per_record
+    record = bytearray(read(offset + mft_cluster * cluster_size + 6 * record_size, record_size))
+    if len(record) < record_size or record[:4] != b"FILE" or not _ntfs_apply_fixups(record):
+        return None
+    bitmap = _ntfs_unnamed_data(read, offset, size, cluster_size, record)
+    if bitmap is None:
+        return None
+    clusters = total_sectors // sectors_per_cluster
+    return [(offset + start * cluster_size, offset + end * cluster_size) for start, end in bitmap_free_runs(bitmap, clusters)]
+
+
+def _ntfs_apply_fixups(record):
+    """Restores the last two bytes of every 512-byte stride of an MFT record; False if the record is torn."""
+    usa_offset, usa_count = struct.unpack_from("<HH", record, 4)
+    if usa_offset + 2 * usa_count > len(record):
+        return False
+    usn = record[usa_offset:usa_offset + 2]
+    for i in range(1, usa_count):
+        end = i * 512
+        if end > len(record) or record[end - 2:end] != usn:
+            return False
+        record[end - 2:end] = record[usa_offset + 2 * i:usa_offset + 2 * i + 2]
+    return True
+
+
+def _ntfs_unnamed_data(read, offset, size, cluster_size, record):
+    """
+    Returns the contents of the unnamed $DATA attribute of an MFT record of the size-byte volume
+    at offset, or None. Raises ValueError if its size or a data run lies outside the volume.
+    """
+    pos = struct.unpack_from("<H", record, 0x14)[0]
+    while pos + 16 <= len(record):
+        attr_type, length = struct.unpack_from("<II", record, pos)
+        if attr_type == 0xFFFFFFFF or length == 0:
+            break
+        non_resident, name_length = record[pos + 8], record[pos + 9]
+        if attr_type == 0x80 and name_length == 0:
+            if not non_resident:
+                content_length, content_offset = struct.unpack_from("<IH", record, pos + 0x10)
+                return bytes(record[pos + content_offset:pos + content_offset + content_length])
+            runlist_offset = struct.unpack_from("<H", record, pos + 0x20)[0]
+            data_size = struct.unpack_from("<Q", record, pos + 0x30)[0]
+            if data_size > size:
+                raise ValueError("NTFS attribute larger than its volume")
+            # Sparse runs (and bytes past the end of the image) are left zero.
+            data = bytearray(data_size)
+            position = 0
+            for lcn, length_clusters in ntfs_runlist(record, pos + runlist_offset, pos + length):
+                if position >= data_size:
+                    break
+                run_size = min(length_clusters * cluster_size, data_size - position)
+                if lcn is not None:
+                    if lcn < 0 or (lcn + length_clusters) * cluster_size > size:
+                        raise ValueError("NTFS data run outside its volume")
+                    chunk = read(offset + lcn * cluster_size, run_size)
+                    data[position:position + len(chunk)] = chunk
+                position += run_size
+            return bytes(data)
+        pos += length
+    return None
+
+
+def ntfs_runlist(data, pos, end):
+    """Decodes an NTFS data run list into (first cluster or None for sparse runs, cluster count) pairs."""
+    runs = []
+    lcn = 0
+    while pos < end and data[pos]:
+        length_size = data[pos] & 0x0F
+        offset_size = data[pos] >> 4
+        pos += 1
+        length = int.from_bytes(data[pos:pos + length_size], "little")
+        pos += length_size
+        if offset_size:
+            lcn += int.from_bytes(data[pos:pos + offset_size], "little", signed=True)
+            runs.append((lcn, length))
+        else:
+            runs.append((None, length))
+        pos += offset_size
+    return runs
+
+
+# --- ext2/3/4 ---
+def ext_free_extents(read, offset, size):
+    """ext2/3/4: clear bits of every block group's block bitmap. Returns None if offset holds no ext superblock."""
+    sb = read(offset + 1024, 1024)
+    if len(sb) < 1024 or struct.unpack_from("<H", sb, 0x38)[0] != 0xEF53:
+        return None
+    blocks_lo = struct.unpack_from("<I", sb, 4)[0]
+    first_data_block, log_block_size = struct.unpack_from("<II", sb, 20)
+    blocks_per_group = struct.unpack_from("<I", sb, 32)[0]
+    incompat, ro_compat = struct.unpack_from("<II", sb, 0x60)
+    if log_block_size > 6 or not blocks_per_group:
+        return None
+    block_size = 1024 << log_block_size
+    is_64bit = incompat & 0x80
+    desc_size = struct.unpack_from("<H", sb, 0xFE)[0] if is_64bit else 32
+    desc_size = max(desc_size, 32)
+    blocks = blocks_lo | (struct.unpack_from("<I", sb, 0x150)[0] << 32 if is_64bit else 0)
+    # BLOCK_UNINIT is only meaningful with group descriptor checksums (uninit_bg or metadata_csum).
+    uninit_valid = ro_compat & (0x10 | 0x400)
+    groups = -(-(blocks - first_data_block) // blocks_per_group)
+    gdt = read(offset + (first_data_block + 1) * block_size, groups * desc_size)
+    if len(gdt) < groups * desc_size:
+        return None
+
+    free = []
+    for group in range(groups):
+        desc = group * desc_size
+        bitmap_block = struct.unpack_from("<I", gdt, desc)[0]
+        if is_64bit and desc_size >= 64:
+            bitmap_block |= struct.unpack_from("<I", gdt, desc + 0x20)[0] << 32
+        flags = struct.unpack_from("<H", gdt, desc + 0x12)[0]
+        group_start = first_data_block + group * blocks_per_group
+        count = min(blocks_per_group, blocks - group_start)
+        if uninit_valid and flags & 0x2:
+            runs = [(0, count)]
+        else:
+            runs = bitmap_free_runs(read(offset + bitmap_block * block_size, (count + 7) // 8), count)
+        free.extend((offset + (group_start + start) * block_size, offset + (group_start + end) * block_size) for start, end in runs)
+    return free
+
+
+# Allocation parser of each supported file system.
+FILESYSTEMS = {"fat": fat_free_extents, "ntfs": ntfs_free_extents, "ext": ext_free_extents}
+
+
+def detect_filesystem(read, offset):
+    """Returns "ntfs", "fat" or "ext" from the boot sector / superblock of the volume at offset, or None."""
+    boot = read(offset, SECTOR_SIZE)
+    if bytes(boot[3:11]) == b"NTFS    ":
+        return "ntfs"
+    if _fat_geometry(boot) is not None:
+        return "fat"
+    sb = read(offset + 1024, 1024)
+    if len(sb) >= 0x3A and struct.unpack_from("<H", sb, 0x38)[0] == 0xEF53:
+        return "ext"
+    return None
+
+
+# --- Partition Tables ---
+def partitions(read, image_size):
+    """
+    Returns the (start, end) byte ranges of the partitions of a GPT or MBR partitioned image,
+    or an empty list if the image has no partition table (e.g. a bare file system).
+    """
+    if detect_filesystem(read, 0):
+        return []
+    for sector_size in (512, 4096):
+        header = read(sector_size, 92)
+        if len(header) == 92 and bytes(header[:8]) == b"EFI PART":
+            return _gpt_partitions(read, header, sector_size, image_size)
+    return _mbr_partitions(read, image_size)
+
+
+def _gpt_partitions(read, header, sector_size, image_size):
+    entries_lba, entry_count, entry_size = struct.unpack_from("<QII", header, 0x48)
+    if entry_size < 128:
+        return []
+    table = read(entries_lba * sector_size, entry_count * entry_size)
+    found = []
+    for index in range(len(table) // entry_size):
+        entry = table[index * entry_size:(index + 1) * entry_size]
+        if not any(entry[:16]):
+            continue
+        first_lba, last_lba = struct.unpack_from("<QQ", entry, 32)
+        start, end = first_lba * sector_size, (last_lba + 1) * sector_size
+        if first_lba <= last_lba and end <= image_size:
+            found.append((start, end))
+    return found
+
+
+def _mbr_partitions(read, image_size):
+    mbr = read(0, SECTOR_SIZE)
+    if len(mbr) < SECTOR_SIZE or mbr[510:512] != b"\x55\xaa":
+        return []
+    found = []
+    for index in range(4):
+        status, part_type, first, count = _mbr_entry(mbr, index)
+        if status not in (0x00, 0x80):
+            # Not a partition table (boot code or a foreign boot sector).
+            return []
+        if not part_type or not count:
+            continue
+        if part_type in (0x05, 0x0F, 0x85):
+            found.extend(_logical_partitions(read, first, image_size))
+        elif (first + count) * SECTOR_SIZE <= image_size:
+            found.append((first * SECTOR_SIZE, (first + count) * SECTOR_SIZE))
+    return found
+
+
+def _mbr_entry(sector, index):
+    entry = 0x1BE + 16 * index
+    status, part_type = sector[entry], sector[entry + 4]
+    first, count = struct.unpack_from("<II", sector, entry + 8)
+    return status, part_type, first, count
+
+
+def _logical_partitions(read, extended_start, image_size):
+    """Follows the chain of extended boot records; logical partitions are relative to their EBR."""
+    found = []
+    ebr_lba = extended_start
+    seen = set()
+    while ebr_lba not in seen and (ebr_lba + 1) * SECTOR_SIZE <= image_size:
+        seen.add(ebr_lba)
+        ebr = read(ebr_lba * SECTOR_SIZE, SECTOR_SIZE)
+        if len(ebr) < SECTOR_SIZE or ebr[510:512] != b"\x55\xaa":
+            break
+        _, part_type, first, count = _mbr_entry(ebr, 0)
+        if part_type and count and (ebr_lba + first + count) * SECTOR_SIZE <= image_size:
+            found.append(((ebr_lba + first) * SECTOR_SIZE, (ebr_lba + first + count) * SECTOR_SIZE))
+        _, next_type, next_first, _ = _mbr_entry(ebr, 1)
+        if not next_type:
+            break
+        ebr_lba = extended_start + next_first
+    return found
+
+
+# --- Volumes ---
+def volumes(read, image_size):
+    """
+    Returns one dictionary per volume: {"start", "end", "filesystem", "free"}, where
+    filesystem is "fat", "ntfs", "ext" or None, and free is the list of unallocated
+    (start, end) ranges (the whole volume for unknown file systems).
+    """
+    found = []
+    for start, end in partitions(read, image_size) or [(0, image_size)]:
+        filesystem = detect_filesystem(read, start)
+        extents = None
+        if filesystem:
+            try:
+                extents = FILESYSTEMS[filesystem](read, start, end - start)
+            except (struct.error, IndexError, ValueError, OverflowError):
+                # Damaged metadata: scan the whole volume rather than trust it.
+                extents = None
+        if extents is None:
+            free = [(start, end)]
+        else:
+            free = intersect_extents(merge_extents(extents), [(start, end)])
+        found.append({"start": start, "end": end, "filesystem": filesystem, "free": free})
+    return found
+
+
+def unallocated_extents(read, image_size):
+    """
+    Returns the sorted, merged (start, end) ranges of the image that are not allocated to
+    any file: free space of recognized file systems, whole volumes with unknown file
+    systems, and space outside every partition.
+    """
+    extents = []
+    covered = 0
+    for volume in sorted(volumes(read, image_size), key=lambda v: v["start"]):
+        if volume["start"] > covered:
+            extents.append((covered, volume["start"]))
+        extents.extend(volume["free"])
+        covered = max(covered, volume["end"])
+    if covered < image_size:
+        extents.append((covered, image_size))
+    return merge_extents(extents)
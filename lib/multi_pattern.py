@@ -0,0 +1,267 @@
+# multi_pattern.py
+
+"""
+MultiPatternMatcher: finds every occurrence of a set of byte patterns in a
+single sequential pass over a buffer (bytes, bytearray, memoryview or mmap).
+
+The matcher is built once from all signature headers and footers:
+  - Patterns that start with another pattern are not searched for (their
+    hits are a subset of its hits, e.g. the ZIP-based formats and ZIP); the
+    remaining patterns are the anchors.
+  - The buffer is searched in SEARCH_WINDOW windows, so the image is read
+    once. With NumPy, a window is searched in a single pass whatever the
+    number of patterns: every 2-byte pair in it is looked up in a 65536-entry
+    table holding, for each anchor, its rarest pair among its first PAIR_SPAN
+    bytes (pairs of 0x00/0xFF bytes, which fill empty and erased space, are
+    avoided). Without NumPy, the window
+    is searched for each anchor in turn with the fastest single-needle backend
+    of lib/search_backends (libc memmem where available).
+  - A byte trie of all patterns is then walked from each candidate offset, in
+    offset order, to report every pattern that matches there (overlapping
+    patterns and patterns that are prefixes of each other are all reported).
+
+With NumPy, scan cost is one table pass per window plus a trie walk per
+candidate, and does not depend on the number of patterns. Without it, cost is
+one C-level pass per distinct anchor: it grows with the number of anchors, but
+unlike a regular expression alternation it never retries every pattern at
+every byte that starts one (e.g. every zero byte of an empty disk).
+
+Patterns can also be restricted to aligned offsets (e.g. file headers, which
+start on sector or cluster boundaries). Those are only tested at multiples of
+the alignment: the first byte of every aligned offset is gathered with a
+strided slice and screened with a byte-class expression before the trie walk.
+"""
+
+import re
+from heapq import merge
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from lib import search_backends
+
+# Bytes filling empty (zeroed) and erased (flash) space; anchor pairs made of them are avoided.
+FILL_BYTES = (0x00, 0xFF)
+
+
+class MultiPatternMatcher:
+
+    # Number of aligned offsets screened per strided slice.
+    STRIDE_BATCH = 64 * 1024
+    # Bytes searched for every anchor at a time, and anchor bytes the NumPy pair table may key on.
+    SEARCH_WINDOW = 16 * 1024 * 1024
+    PAIR_SPAN = 8
+
+    def __init__(self, patterns, aligned_patterns=(), alignment=None):
+        """
+        Builds the trie, the search anchors and the aligned prefilter from an iterable of byte
+        patterns. Empty and duplicate patterns are ignored.
+        With alignment set, aligned_patterns are additionally added and only
+        reported at offsets that are a multiple of alignment; a pattern given in
+        both iterables is reported at every offset.
+        """
+        patterns = list(patterns)
+        self.patterns = []
+        self.index = {}
+        self.alignment = alignment if alignment and alignment > 1 else None
+        unaligned = set()
+        for pattern in patterns:
+            if pattern:
+                unaligned.add(bytes(pattern))
+        for pattern in list(patterns) + list(aligned_patterns):
+            if not pattern or pattern in self.index:
+                continue
+            self.index[pattern] = len(self.patterns)
+            self.patterns.append(bytes(pattern))
+        if self.alignment is None:
+            unaligned = set(self.patterns)
+        self._aligned_only = [pattern not in unaligned for pattern in self.patterns]
+        self.max_length = max((len(p) for p in self.patterns), default=0)
+
+        # Trie nodes: a dict of byte -> child node, and the pattern ids ending at each node.
+        self._children = [{}]
+        self._terminal = [()]
+        for pattern_id, pattern in enumerate(self.patterns):
+            node = 0
+            for byte in pattern:
+                child = self._children[node].get(byte)
+                if child is None:
+                    child = len(self._children)
+                    self._children[node][byte] = child
+                    self._children.append({})
+                    self._terminal.append(())
+                node = child
+            self._terminal[node] = self._terminal[node] + (pattern_id,)
+
+        # Shortest first, so an anchor is only kept when no shorter kept anchor is a prefix of it:
+        # anchors then never match at the same offset, and each match is walked exactly once.
+        self._anchors = []
+        for anchor in sorted(unaligned, key=len):
+            if not any(anchor.startswith(shorter) for shorter in self._anchors):
+                self._anchors.append(anchor)
+        # Anchor index -> id of the only pattern that can match at its hits, when the anchor is a whole
+        # pattern and no other pattern extends it (no trie walk needed), else None.
+        self._anchor_pattern = []
+        for anchor in self._anchors:
+            node = 0
+            for byte in anchor:
+                node = self._children[node].get(byte)
+            leaf = node is not None and not self._children[node] and len(self._terminal[node]) == 1
+            self._anchor_pattern.append(self._terminal[node][0] if leaf else None)
+        self._pair_table = self._build_pair_table() if np is not None and self._anchors else None
+        first_bytes = sorted({p[0] for p, only in zip(self.patterns, self._aligned_only) if only})
+        if first_bytes:
+            self._first_byte_regex = re.compile(b"[" + b"".join(re.escape(bytes((b,))) for b in first_bytes) + b"]")
+        else:
+            self._first_byte_regex = None
+
+    def _build_pair_table(self):
+        """
+        Returns the NumPy pair table: entry first | second << 8 has bit k set if an anchor has that pair
+        of bytes at offset k, so the anchor can start k bytes before where the pair is found.
+        A one-byte anchor sets bit 0 for every pair starting with its byte.
+        """
+        table = np.zeros(65536, dtype=np.uint8)
+        for anchor in self._anchors:
+            if len(anchor) == 1:
+                table[anchor[0] + 256 * np.arange(256)] |= 1
+                continue
+            k = min(range(min(len(anchor), self.PAIR_SPAN) - 1), key=lambda k: (anchor[k] in FILL_BYTES) + (anchor[k + 1] in FILL_BYTES))
+            table[anchor[k] | anchor[k + 1] << 8] |= 1 << k
+        return table
+
+    def _walk(self, data, pos, end):
+        """Returns the ids of every pattern that starts at pos and ends at or before end."""
+        matched = []
+        children = self._children
+        terminal = self._terminal
+        node = 0
+        while pos < end:
+            node = children[node].get(data[pos])
+            if node is None:
+                break
+            if terminal[node]:
+                matched.extend(terminal[node])
+            pos += 1
+        return matched
+
+    def iter_matches(self, data, start=0, end=None, base=0):
+        """
+        Yields (offset, pattern_id) for every occurrence of every pattern that lies
+        entirely inside data[start:end], in increasing offset order.
+        base is the absolute offset of data[0], used to place the alignment grid
+        when data is only a window of a larger image.
+        """
+        if end is None:
+            end = len(data)
+        if self._first_byte_regex is None:
+            yield from self._iter_unaligned(data, start, end)
+        elif not self._anchors:
+            yield from self._iter_aligned(data, start, end, base)
+        else:
+            yield from merge(self._iter_unaligned(data, start, end), self._iter_aligned(data, start, end, base))
+
+    def _iter_unaligned(self, data, start, end):
+        aligned_only = self._aligned_only
+        overlap = max(self.max_length - 1, 0)
+        for window_start in range(start, end, self.SEARCH_WINDOW):
+            window_end = min(window_start + self.SEARCH_WINDOW, end)
+            # Anchors starting in this window may extend into the next one (up to end).
+            for offset, pattern_id in self._anchor_offsets(data, window_start, min(window_end + overlap, end), window_end):
+                if pattern_id is not None:
+                    yield offset, pattern_id
+                    continue
+                for pattern_id in self._walk(data, offset, end):
+                    if not aligned_only[pattern_id]:
+                        yield offset, pattern_id
+
+    def _anchor_offsets(self, data, start, end, limit):
+        """
+        Returns, in offset order, (offset, pattern id) for the offsets below limit where an anchor lies
+        entirely inside data[start:end]. The pattern id is None where the trie must be walked.
+        """
+        if self._pair_table is not None:
+            return [(offset, None) for offset in self._pair_offsets(data, start, end, limit)]
+        # Hits are sorted as offset * stride + anchor index, which anchors never share.
+        stride = len(self._anchors)
+        keys = []
+        _, backend = search_backends.select_backend(data, self._anchors)
+        if backend is search_backends.find_all_find and hasattr(data, "find"):
+            # Bounded finds search data in place (a memoryview window has no find()).
+            find = data.find
+            for index, anchor in enumerate(self._anchors):
+                pos = find(anchor, start, end)
+                while pos != -1 and pos < limit:
+                    keys.append(pos * stride + index)
+                    pos = find(anchor, pos + 1, end)
+        else:
+            if backend is search_backends.find_all_find:
+                backend = search_backends.find_all_regex
+            with memoryview(data) as view:
+                window = view[start:end]
+                try:
+                    for index, anchor in enumerate(self._anchors):
+                        keys.extend((start + offset) * stride + index for offset in backend(window, anchor) if start + offset < limit)
+                finally:
+                    window.release()
+        keys.sort()
+        anchor_pattern = self._anchor_pattern
+        return [(key // stride, anchor_pattern[key % stride]) for key in keys]
+
+    def _pair_offsets(self, data, start, end, limit):
+        """NumPy form of _anchor_offsets: candidate offsets (a superset of the anchor hits) from one pair table pass."""
+        with memoryview(data) as view:
+            window = view[start:end]
+            try:
+                size = len(window)
+                if size < 2:
+                    # No pair fits; only a one-byte anchor can (at a cost of one trie walk).
+                    return [start] if size and start < limit else []
+                table = self._pair_table
+                # Pairs at even and odd offsets, read as little-endian 16-bit words in place.
+                bits = np.empty(size - 1, dtype=np.uint8)
+                bits[0::2] = table[np.frombuffer(window, dtype="<u2", count=size // 2)]
+                bits[1::2] = table[np.frombuffer(window, dtype="<u2", count=(size - 1) // 2, offset=1)]
+                positions = np.flatnonzero(bits)
+                found = bits[positions]
+                starts = [positions[(found >> k) & 1 != 0] - k for k in range(self.PAIR_SPAN - 1)]
+                candidates = np.unique(np.concatenate(starts))
+                candidates = candidates[candidates >= 0] + start
+                offsets = candidates[candidates < limit].tolist()
+                del bits, positions, found, starts, candidates
+            finally:
+                window.release()
+        # The last byte of the buffer starts no pair, but may be a one-byte anchor.
+        if end - 1 < limit and bytes(data[end - 1:end]) in self._anchors:
+            offsets.append(end - 1)
+        return offsets
+
+    def _iter_aligned(self, data, start, end, base):
+        alignment = self.alignment
+        aligned_only = self._aligned_only
+        finditer = self._first_byte_regex.finditer
+        # First offset >= start that sits on the alignment grid of the whole image.
+        pos = start + (-(base + start) % alignment)
+        batch = alignment * self.STRIDE_BATCH
+        while pos < end:
+            batch_end = min(pos + batch, end)
+            stride = bytes(data[pos:batch_end:alignment])
+            for m in finditer(stride):
+                offset = pos + m.start() * alignment
+                for pattern_id in self._walk(data, offset, end):
+                    if aligned_only[pattern_id]:
+                        yield offset, pattern_id
+            pos += batch
+
+    def find_all(self, data, start=0, end=None):
+        """
+        Returns a dict mapping each pattern to the sorted list of offsets where it occurs.
+        Patterns that never occur map to an empty list.
+        """
+        results = {pattern: [] for pattern in self.patterns}
+        lists = [results[pattern] for pattern in self.patterns]
+        for offset, pattern_id in self.iter_matches(data, start, end):
+            lists[pattern_id].append(offset)
+        return results
@@ -0,0 +1,400 @@
+# scan_db.py
+
+"""
+ScanDatabase: an indexed SQLite store for scan results.
+
+Each found file is one row of the "files" table with the same fields as the
+dictionaries returned by FILE_CARVER.scan_drive (id, extension, offset, size,
+entropy), plus the optional duplicate_of of deduplicated carves and fragments
+of reassembled bifragment carves (as JSON text), stored as NULL when absent (older databases gain the column when opened or loaded). Rows can be streamed in while a scan runs (add buffers inserts and
+commits them in batches), queried a page at a time with filtering and sorting
+on indexed columns, and imported from / exported to the legacy JSON format.
+page_after pages by sort key (seek pagination) rather than by row number, so
+scrolling anywhere in millions of rows costs the same as the first page.
+"""
+
+import json
+import os
+import pathlib
+import sqlite3
+
+
+class ScanDatabase:
+
+    # Pending rows inserted per transaction by add(), and characters read at a time by import_json.
+    BATCH_SIZE = 10000
+    JSON_CHUNK_SIZE = 1024 * 1024
+    COLUMNS = ("id", "extension", "offset", "size", "entropy")
+    # Nullable columns (name, SQL type) for keys only some found files have; NULL means the key is absent.
+    OPTIONAL_COLUMNS = (("duplicate_of", "INTEGER"), ("fragments", "TEXT"))
+    # Optional columns holding lists, stored as JSON text.
+    JSON_COLUMNS = ("fragments",)
+    # Indexes serving every sorted page: an extension filter with each sort column, and each sort column
+    # followed by id (the tie-breaker) and the other range-filtered column, so a page sorted by size and
+    # filtered by entropy (or the reverse) is read off one index without visiting rejected rows.
+    INDEXES = (("offset",), ("extension", "offset", "id"), ("extension", "size", "id"), ("extension", "entropy", "id"), ("size", "id", "entropy"), ("entropy", "id", "size"))
+    # SQLite VM instructions a seek page may spend walking the sort index before it uses the filter's index instead.
+    SEEK_WALK_STEPS = 2000000
+
+    def __init__(self, path=":memory:"):
+        """
+        Opens (or creates) the database at path; the default is an in-memory database
+        that can later be written to disk with save().
+        """
+        self.path = path
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS files (id INTEGER PRIMARY KEY, extension TEXT NOT NULL, offset INTEGER NOT NULL, size INTEGER NOT NULL, entropy REAL NOT NULL)")
+        self._upgrade_schema()
+        self._pending = []
+
+    def _upgrade_schema(self):
+        # Databases written before an optional column or index existed get it added (NULL for every row).
+        present = {row[1] for row in self.conn.execute("PRAGMA table_info(files)")}
+        for column, sql_type in self.OPTIONAL_COLUMNS:
+            if column not in present:
+                self.conn.execute(f"ALTER TABLE files ADD COLUMN {column} {sql_type}")
+        for columns in self.INDEXES:
+            self.conn.execute(f"CREATE INDEX IF NOT EXISTS idx_files_{'_'.join(columns)} ON files ({', '.join(columns)})")
+        self.conn.commit()
+
+    @classmethod
+    def _select(cls):
+        return ", ".join(cls.COLUMNS + tuple(column for column, _ in cls.OPTIONAL_COLUMNS))
+
+    @classmethod
+    def _row_dict(cls, row):
+        file_info = dict(zip(cls.COLUMNS, row))
+        for (column, _), value in zip(cls.OPTIONAL_COLUMNS, row[len(cls.COLUMNS):]):
+            if value is not None:
+                file_info[column] = json.loads(value) if column in cls.JSON_COLUMNS else value
+        return file_info
+
+    # --- Inserts ---
+    def add(self, file_info):
+        """Queues one found file (a scan_drive result dictionary) for insertion."""
+        row = [file_info[column] for column in self.COLUMNS]
+        for column, _ in self.OPTIONAL_COLUMNS:
+            value = file_info.get(column)
+            row.append(json.dumps(value) if value is not None and column in self.JSON_COLUMNS else value)
+        self._pending.append(tuple(row))
+        if len(self._pending) >= self.BATCH_SIZE:
+            self.flush()
+
+    def add_many(self, found_files):
+        """Inserts an iterable of found files."""
+        for file_info in found_files:
+            self.add(file_info)
+        self.flush()
+
+    def flush(self):
+        """Writes all queued rows in a single transaction."""
+        if self._pending:
+            self.conn.executemany(f"INSERT OR REPLACE INTO files ({self._select()}) VALUES ({', '.join('?' * len(self._pending[0]))})", self._pending)
+            self.conn.commit()
+            self._pending = []
+
+    def clear(self):
+        """Removes every row."""
+        self._pending = []
+        self.conn.execute("DELETE FROM files")
+        self.conn.commit()
+
+    # --- Queries ---
+    def _where(self, extension=None, min_size=None, max_size=None, min_entropy=None, max_entropy=None, unindexed=(), seek=None):
+        # unindexed columns are compared as +column, which keeps SQLite from searching their index;
+        # seek is (order_by, key, forward): only rows after key in (order_by, id) order (before it if not forward).
+        clauses = []
+        params = []
+        if extension:
+            extensions = [extension] if isinstance(extension, str) else list(extension)
+            clauses.append(f"extension IN ({', '.join('?' * len(extensions))})")
+            params.extend(extensions)
+        for column, operator, value in (("size", ">=", min_size), ("size", "<=", max_size), ("entropy", ">=", min_entropy), ("entropy", "<=", max_entropy)):
+            if value is not None:
+                clauses.append(f"{'+' if column in unindexed else ''}{column} {operator} ?")
+                params.append(value)
+        if seek is not None and seek[1] is not None:
+            order_by, (value, file_id), forward = seek
+            operator = ">" if forward else "<"
+            if order_by == "id":
+                clauses.append(f"id {operator} ?")
+                params.append(file_id)
+            else:
+                # The redundant bound lets SQLite start the index search at the key.
+                clauses.append(f"{order_by} {operator}= ? AND ({order_by} {operator} ? OR id {operator} ?)")
+                params.extend((value, value, file_id))
+        return (" WHERE " + " AND ".join(clauses) if clauses else ""), params
+
+    @staticmethod
+    def _order(order_by, descending):
+        direction = "DESC" if descending else "ASC"
+        return f"{order_by} {direction}" if order_by == "id" else f"{order_by} {direction}, id {direction}"
+
+    @classmethod
+    def matches(cls, file_info, extension=None, min_size=None, max_size=None, min_entropy=None, max_entropy=None):
+        """Returns whether a found file passes the filters accepted by page(), without querying."""
+        if extension and file_info["extension"] not in ([extension] if isinstance(extension, str) else extension):
+            return False
+        return ((min_size is None or file_info["size"] >= min_size) and (max_size is None or file_info["size"] <= max_size)
+                and (min_entropy is None or file_info["entropy"] >= min_entropy) and (max_entropy is None or file_info["entropy"] <= max_entropy))
+
+    @staticmethod
+    def sort_key(file_info, order_by):
+        """Returns the key of a found file in (order_by, id) order, as taken by page_after."""
+        return (file_info[order_by], file_info["id"])
+
+    def count(self, **filters):
+        """Returns the number of rows matching the filters accepted by page()."""
+        self.flush()
+        where, params = self._where(**filters)
+        return self.conn.execute(f"SELECT COUNT(*) FROM files{where}", params).fetchone()[0]
+
+    def page(self, start=0, limit=100, order_by="id", descending=False, **filters):
+        """
+        Returns up to limit found-file dictionaries starting at row start of the filtered, sorted result
+        (sorted by order_by, then id, both reversed if descending). order_by is one of COLUMNS; filters are
+        extension (a string or a list), min_size, max_size, min_entropy and max_entropy.
+        Skipping start rows costs O(start); page_after does not.
+        """
+        if order_by not in self.COLUMNS:
+            raise ValueError(f"Cannot sort by {order_by!r}")
+        self.flush()
+        where, params = self._where(**filters)
+        rows = self.conn.execute(f"SELECT {self._select()} FROM files{where} ORDER BY {self._order(order_by, descending)} LIMIT ? OFFSET ?", params + [limit, start])
+        return [self._row_dict(row) for row in rows]
+
+    def page_after(self, key=None, limit=100, order_by="id", descending=False, backward=False, **filters):
+        """
+        Seek pagination: returns up to limit found files of the filtered result, in page()'s order, that
+        follow the row whose sort_key is key (the first rows if key is None), or with backward=True the
+        limit rows just before it (the last rows if key is None). The rows are found by searching an
+        index for key, so the cost does not depend on how far into the result the key is.
+        """
+        if order_by not in self.COLUMNS:
+            raise ValueError(f"Cannot sort by {order_by!r}")
+        self.flush()
+        forward = descending == backward
+        order = self._order(order_by, not forward)
+        # Walk the sort index, checking range filters on other columns as rows come (cheap unless the
+        # filters reject nearly everything); if that takes too long, the few matching rows are found
+        # through the filters' own index and sorted instead.
+        unindexed = {"size", "entropy"} - {order_by}
+        where, params = self._where(unindexed=unindexed, seek=(order_by, key, forward), **filters)
+        sql = f"SELECT {self._select()} FROM files{where} ORDER BY {order} LIMIT ?"
+        rows = self._bounded(sql, params + [limit], self.SEEK_WALK_STEPS) if any(filters.get(name) is not None for name in ("min_size", "max_size", "min_entropy", "max_entropy")) else None
+        if rows is None:
+            where, params = self._where(seek=(order_by, key, forward), **filters)
+            rows = self.conn.execute(f"SELECT {self._select()} FROM files{where} ORDER BY {order} LIMIT ?", params + [limit]).fetchall()
+        if backward:
+            rows.reverse()
+        return [self._row_dict(row) for row in rows]
+
+    def key_at(self, position, order_by="id", descending=False, **filters):
+        """
+        Returns the sort_key of the row at position in page()'s order (None past the end), for jumping
+        to a position before paging on with page_after. Costs O(position) index steps, counted from
+        whichever end of the result is nearer.
+        """
+        if order_by not in self.COLUMNS:
+            raise ValueError(f"Cannot sort by {order_by!r}")
+        total = self.count(**filters)
+        if not 0 <= position < total:
+            return None
+        if position >= total // 2:
+            position, descending = total - 1 - position, not descending
+        where, params = self._where(unindexed={"size", "entropy"} - {order_by}, **filters)
+        row = self.conn.execute(f"SELECT {order_by}, id FROM files{where} ORDER BY {self._order(order_by, descending)} LIMIT 1 OFFSET ?", params + [position]).fetchone()
+        return tuple(row) if row else None
+
+    def _bounded(self, sql, params, steps):
+        # Runs a query, or returns None once it has run about steps SQLite VM instructions.
+        budget = [steps // 1000]
+
+        def spend():
+            budget[0] -= 1
+            return budget[0] < 0
+        self.conn.set_progress_handler(spend, 1000)
+        try:
+            return self.conn.execute(sql, params).fetchall()
+        except sqlite3.OperationalError:
+            if budget[0] >= 0:
+                raise
+            return None
+        finally:
+            self.conn.set_progress_handler(None, 0)
+
+    def get(self, file_id):
+        """Returns the found file with the given id, or None."""
+        self.flush()
+        row = self.conn.execute(f"SELECT {self._select()} FROM files WHERE id = ?", (file_id,)).fetchone()
+        return self._row_dict(row) if row else None
+
+    def extensions(self):
+        """Returns the sorted list of distinct extensions."""
+        self.flush()
+        return [row[0] for row in self.conn.execute("SELECT DISTINCT extension FROM files ORDER BY extension")]
+
+    def __iter__(self):
+        self.flush()
+        for row in self.conn.execute(f"SELECT {self._select()} FROM files ORDER BY id"):
+            yield self._row_dict(row)
+
+    def __len__(self):
+        return self.count()
+
+    # --- Persistence ---
+    def save(self, path):
+        """Writes the whole database to a SQLite file at path (replacing any file there)."""
+        self.flush()
+        if not hasattr(self.conn, "backup"):
+            # Connection.backup needs Python 3.7.
+            self._save_rows(path)
+            return
+        target = sqlite3.connect(path)
+        try:
+            self.conn.backup(target)
+        finally:
+            target.close()
+
+    def _save_rows(self, path):
+        # Copies the rows into a new scan database at path through ATTACH (for Pythons without backup).
+        if os.path.exists(path):
+            os.remove(path)
+        ScanDatabase(path).close()
+        columns = self._select()
+        self.conn.execute("ATTACH DATABASE ? AS target", (path,))
+        try:
+            self.conn.execute(f"INSERT INTO target.files ({columns}) SELECT {columns} FROM main.files")
+            self.conn.commit()
+        finally:
+            self.conn.execute("DETACH DATABASE target")
+
+    def _load_rows(self, path, columns):
+        # Replaces the rows with those of the scan database at path, which has the given columns,
+        # through ATTACH (for Pythons without backup).
+        columns = ", ".join(column for column in self._select().split(", ") if column in columns)
+        self.conn.execute("ATTACH DATABASE ? AS source", (path,))
+        try:
+            self.conn.execute("DELETE FROM main.files")
+            self.conn.execute(f"INSERT INTO main.files ({columns}) SELECT {columns} FROM source.files")
+            self.conn.commit()
+        finally:
+            self.conn.execute("DETACH DATABASE source")
+
+    def load(self, path):
+        """
+        Replaces the contents of this database with the SQLite file at path, which is opened read-only
+        and left untouched. Raises FileNotFoundError if it does not exist and ValueError if it is not
+        a scan database; this database is then unchanged.
+        """
+        if not os.path.isfile(path):
+            raise FileNotFoundError(f"No such scan database: {path}")
+        source = sqlite3.connect(pathlib.Path(path).resolve().as_uri() + "?mode=ro", uri=True)
+        try:
+            try:
+                columns = {row[1] for row in source.execute("PRAGMA table_info(files)")}
+            except sqlite3.DatabaseError as e:
+                raise ValueError(f"{path} is not a SQLite database: {e}") from None
+            missing = [column for column in self.COLUMNS if column not in columns]
+            if missing:
+                raise ValueError(f"{path} is not a scan database (no files table with {', '.join(missing)})")
+            self._pending = []
+            if hasattr(self.conn, "backup"):
+                source.backup(self.conn)
+        finally:
+            source.close()
+        if not hasattr(self.conn, "backup"):
+            # Connection.backup needs Python 3.7.
+            self._load_rows(path, columns)
+        self._upgrade_schema()
+
+    def import_json(self, path):
+        """
+        Adds the found files of a JSON database written by export_json (or older versions of Save DB).
+        The file is decoded one found file at a time, so it is never held in memory whole.
+        Raises ValueError if it is not a JSON list of found files (see check_file_info); the rows before
+        the bad one have been added by then, so import into a fresh database to keep a failed import out.
+        """
+        with open(path, "r") as f:
+            self.add_many(self.check_file_info(file_info, index) for index, file_info in enumerate(iter_json_list(f, self.JSON_CHUNK_SIZE)))
+
+    @classmethod
+    def check_file_info(cls, file_info, index=None):
+        """Returns file_info if it is a found-file dictionary this database can store, else raises ValueError."""
+        where = f"Found file {index}" if index is not None else "Found file"
+        if not isinstance(file_info, dict):
+            raise ValueError(f"{where} is not an object")
+        for column, types in (("id", int), ("extension", str), ("offset", int), ("size", int), ("entropy", (int, float))):
+            if column not in file_info:
+                raise ValueError(f"{where} has no {column!r}")
+            if not isinstance(file_info[column], types) or isinstance(file_info[column], bool):
+                raise ValueError(f"{where} has an invalid {column!r}: {file_info[column]!r}")
+        duplicate_of = file_info.get("duplicate_of")
+        if duplicate_of is not None and (not isinstance(duplicate_of, int) or isinstance(duplicate_of, bool)):
+            raise ValueError(f"{where} has an invalid 'duplicate_of': {duplicate_of!r}")
+        fragments = file_info.get("fragments")
+        if fragments is not None and not (isinstance(fragments, list) and all(
+                isinstance(fragment, list) and len(fragment) == 2 and all(isinstance(bound, int) for bound in fragment) for fragment in fragments)):
+            raise ValueError(f"{where} has invalid 'fragments': {fragments!r}")
+        return file_info
+
+    def export_json(self, path):
+        """Writes every found file to path as a JSON list of dictionaries."""
+        # Streamed row by row so exporting never holds the whole result set in memory.
+        with open(path, "w") as f:
+            f.write("[")
+            for index, file_info in enumerate(self):
+                f.write(("," if index else "") + "\n    " + json.dumps(file_info))
+            f.write("\n]\n")
+
+    def close(self):
+        self.flush()
+        self.conn.close()
+
+
+def iter_json_list(f, chunk_size):
+    """Yields the items of the JSON list in the open text file f, reading chunk_size characters at a time."""
+    decoder = json.JSONDecoder()
+    buffer = ""
+    pos = 0
+    eof = False
+
+    def skip_whitespace():
+        # Returns the next non-whitespace character (reading more as needed), or "" at the end of the file.
+        nonlocal buffer, pos, eof
+        while True:
+            while pos < len(buffer) and buffer[pos] in " \t\r\n":
+                pos += 1
+            if pos < len(buffer) or eof:
+                return buffer[pos:pos + 1]
+            buffer, pos = f.read(chunk_size), 0
+            eof = not buffer
+
+    if skip_whitespace() != "[":
+        raise ValueError("Expected a JSON list")
+    pos += 1
+    if skip_whitespace() == "]":
+        return
+    while True:
+        if not skip_whitespace():
+            raise ValueError("Unterminated JSON list")
+        try:
+            item, end = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            item, end = None, None
+        if end is None or (end == len(buffer) and not eof):
+            # The item may continue past the buffer (a cut object, or a number whose digits go on).
+            if eof:
+                raise ValueError(f"Invalid JSON list item at character {pos}")
+            more = f.read(chunk_size)
+            eof = not more
+            buffer, pos = buffer[pos:] + more, 0
+            continue
+        yield item
+        pos = end
+        separator = skip_whitespace()
+        pos += 1
+        if separator == "]":
+            return
+        if separator != ",":
+            raise ValueError("Expected ',' or ']' in JSON list")
@@ -0,0 +1,109 @@
+# scan_journal.py
+
+"""
+ScanJournal: an append-only, line-delimited JSON checkpoint file that lets a
+long scan resume after a crash without rescanning the completed region.
+
+Record types (one JSON object per line):
+  - "header": the image size, a sampled fingerprint of the image and the scan
+    parameters. A journal is only resumed if all of them match.
+  - "search": the image offset up to which the signature search is complete,
+    and the header/footer hits found in that region (patterns as hex).
+  - "verify": the index of the next candidate fragment to verify, and the
+    verified files found since the previous verify record.
+
+Every record is flushed and fsynced before the scan moves on, and a truncated
+last line (from a crash mid-write) is ignored on load.
+"""
+
+import hashlib
+import json
+import os
+
+
+def image_fingerprint(f, image_size, samples=16, sample_size=4096):
+    """
+    Returns a hex digest of image_size and samples evenly spaced blocks of the open image f.
+    Cheap enough for multi-terabyte images, yet catches a different or rewritten image.
+    """
+    digest = hashlib.sha256(str(image_size).encode())
+    if image_size:
+        step = max(image_size // samples, 1)
+        for offset in range(0, image_size, step)[:samples]:
+            f.seek(offset)
+            digest.update(f.read(sample_size))
+    return digest.hexdigest()
+
+
+class ScanJournal:
+
+    def __init__(self, path, header):
+        """
+        Opens (or creates) the journal at path for a scan described by the header dict.
+        If an existing journal has a different header it is discarded and a new one is started;
+        otherwise its progress is loaded into search_end, occurrences, verify_next and found.
+        """
+        self.path = path
+        self.header = header
+        self.search_end = 0
+        self.occurrences = {}
+        self.verify_next = 0
+        self.found = []
+        records, valid_length = self._read_records()
+        if records and records[0].get("type") == "header" and records[0].get("header") == header:
+            for record in records[1:]:
+                self._apply(record)
+            self._file = open(path, "a")
+            # Drop any partially written record so new records start on a fresh line.
+            self._file.truncate(valid_length)
+        else:
+            self._file = open(path, "w")
+            self._append({"type": "header", "header": header})
+
+    def _read_records(self):
+        """Returns the complete records of an existing journal and the byte length they occupy."""
+        records = []
+        valid_length = 0
+        if not os.path.exists(self.path):
+            return records, valid_length
+        with open(self.path, "rb") as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    # Partially written record from an interrupted scan; everything after it is untrusted.
+                    break
+                valid_length += len(line)
+        return records, valid_length
+
+    def _apply(self, record):
+        if record.get("type") == "search":
+            for pattern, offsets in record["hits"].items():
+                self.occurrences.setdefault(bytes.fromhex(pattern), []).extend(offsets)
+            self.search_end = record["end"]
+        elif record.get("type") == "verify":
+            self.found.extend(record["found"])
+            self.verify_next = record["next"]
+
+    def _append(self, record):
+        self._file.write(json.dumps(record) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def record_search(self, end, occurrences):
+        """Records that the search is complete up to end, with the hits found since the last record."""
+        self._append({"type": "search", "end": end, "hits": {pattern.hex(): offsets for pattern, offsets in occurrences.items() if offsets}})
+        for pattern, offsets in occurrences.items():
+            self.occurrences.setdefault(pattern, []).extend(offsets)
+        self.search_end = end
+
+    def record_verify(self, next_index, found):
+        """Records that candidates before next_index are verified, with the files found since the last record."""
+        self._append({"type": "verify", "next": next_index, "found": found})
+        self.found.extend(found)
+        self.verify_next = next_index
+
+    def close(self):
+        self._file.close()
@@ -0,0 +1,216 @@
+# scan_stats.py
+
+"""
+Optional instrumentation for FILE_CARVER.
+
+ScanStats collects, for one or more scans:
+  - per-stage wall time, call count and bytes handed to the stage
+    ("search", "assembly", "verify", "entropy", "write"); stages nest, e.g.
+    the entropy sampled while verifying is counted in both "verify" and
+    "entropy",
+  - header and footer hit counts per signature, which show noisy signatures
+    such as b"\x0A" (pcx) or b"BM" (bmp) at a glance,
+  - accepted candidates and rejections per verification rule, per extension.
+With trace_path set, every stage and verdict is also appended to that file as
+one JSON object per line. Worker processes record into a ScanStats with
+keep_events set instead: its events travel back in as_dict() and merge() writes
+them to the parent's trace.
+
+FILE_CARVER.stats defaults to NULL_STATS, whose methods do nothing, so the
+instrumentation costs a no-op call per stage and per candidate when disabled.
+"""
+
+import json
+import threading
+import time
+
+
+class _NullStage:
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+class NullStats:
+    """Disabled instrumentation: same interface as ScanStats, records nothing."""
+
+    enabled = False
+    tracing = False
+
+    def stage(self, name, nbytes=0):
+        return _NULL_STAGE
+
+    def add_stage(self, name, seconds, nbytes=0):
+        pass
+
+    def count_hits(self, signatures, occurrences):
+        pass
+
+    def verdict(self, ext, start, end, rejected_by=None):
+        pass
+
+    def merge(self, other):
+        pass
+
+    def close(self):
+        pass
+
+
+NULL_STATS = NullStats()
+
+
+class _Stage:
+
+    def __init__(self, stats, name, nbytes):
+        self.stats = stats
+        self.name = name
+        self.nbytes = nbytes
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stats.add_stage(self.name, time.perf_counter() - self.started, self.nbytes)
+        return False
+
+
+class ScanStats:
+
+    enabled = True
+
+    def __init__(self, trace_path=None, keep_events=False):
+        """
+        Starts empty statistics; with trace_path set, events are appended there as JSON lines,
+        with keep_events set, they are also kept in memory and returned by as_dict().
+        """
+        self.stages = {}
+        self.hits = {}
+        self.accepted = {}
+        self.rejections = {}
+        # Recovery copies files from several threads.
+        self._lock = threading.Lock()
+        self._trace = open(trace_path, "a") if trace_path else None
+        self._events = [] if keep_events else None
+
+    @property
+    def tracing(self):
+        """True if events are written to a trace or kept, i.e. workers should send theirs back."""
+        return self._trace is not None or self._events is not None
+
+    # --- Recording ---
+    def stage(self, name, nbytes=0):
+        """Returns a context manager that times its block as one call of stage name over nbytes bytes."""
+        return _Stage(self, name, nbytes)
+
+    def add_stage(self, name, seconds, nbytes=0):
+        with self._lock:
+            totals = self.stages.setdefault(name, {"calls": 0, "seconds": 0.0, "bytes": 0})
+            totals["calls"] += 1
+            totals["seconds"] += seconds
+            totals["bytes"] += nbytes
+            self._write({"event": "stage", "stage": name, "seconds": seconds, "bytes": nbytes})
+
+    def count_hits(self, signatures, occurrences):
+        """Adds the header and footer hits of each signature from a find_signature_occurrences result."""
+        with self._lock:
+            for sig in signatures:
+                key = self.signature_key(sig)
+                counts = self.hits.setdefault(key, {"headers": 0, "footers": 0})
+                headers = len(occurrences.get(sig["header"], ()))
+                footers = len(occurrences.get(sig["footer"], ())) if sig["footer"] else 0
+                counts["headers"] += headers
+                counts["footers"] += footers
+                self._write({"event": "hits", "signature": key, "headers": headers, "footers": footers})
+
+    def verdict(self, ext, start, end, rejected_by=None):
+        """Records the verification outcome of the candidate [start, end): accepted, or the rule that rejected it."""
+        with self._lock:
+            if rejected_by is None:
+                self.accepted[ext] = self.accepted.get(ext, 0) + 1
+            else:
+                rules = self.rejections.setdefault(ext, {})
+                rules[rejected_by] = rules.get(rejected_by, 0) + 1
+            self._write({"event": "verdict", "extension": ext, "offset": start, "size": end - start, "rejected_by": rejected_by})
+
+    def merge(self, other):
+        """
+        Adds the totals of another ScanStats (or its as_dict()), e.g. from a worker process,
+        and writes the events it kept to this trace.
+        """
+        if isinstance(other, ScanStats):
+            other = other.as_dict()
+        with self._lock:
+            for name, totals in other["stages"].items():
+                mine = self.stages.setdefault(name, {"calls": 0, "seconds": 0.0, "bytes": 0})
+                for field in mine:
+                    mine[field] += totals[field]
+            for key, counts in other["hits"].items():
+                mine = self.hits.setdefault(key, {"headers": 0, "footers": 0})
+                mine["headers"] += counts["headers"]
+                mine["footers"] += counts["footers"]
+            for ext, count in other["accepted"].items():
+                self.accepted[ext] = self.accepted.get(ext, 0) + count
+            for ext, rules in other["rejections"].items():
+                mine = self.rejections.setdefault(ext, {})
+                for rule, count in rules.items():
+                    mine[rule] = mine.get(rule, 0) + count
+            for event in other.get("events", ()):
+                self._write(event)
+
+    def _write(self, event):
+        if self._trace is not None:
+            self._trace.write(json.dumps(event) + "\n")
+        if self._events is not None:
+            self._events.append(event)
+
+    @staticmethod
+    def signature_key(sig):
+        return f"{sig['extension']} {sig['header']!r}"
+
+    # --- Reporting ---
+    def as_dict(self):
+        """Returns all totals (and the kept events, under "events") as plain, JSON-serializable dictionaries."""
+        with self._lock:
+            stats = {
+                "stages": {name: dict(totals) for name, totals in self.stages.items()},
+                "hits": {key: dict(counts) for key, counts in self.hits.items()},
+                "accepted": dict(self.accepted),
+                "rejections": {ext: dict(rules) for ext, rules in self.rejections.items()},
+            }
+            if self._events is not None:
+                stats["events"] = list(self._events)
+            return stats
+
+    def report(self, top=10):
+        """Returns a human-readable summary: stage totals, the top noisiest signatures and the rejection counts."""
+        stats = self.as_dict()
+        lines = ["stage        calls    seconds        MiB     MiB/s"]
+        for name, totals in stats["stages"].items():
+            mib = totals["bytes"] / (1024 * 1024)
+            rate = mib / totals["seconds"] if totals["seconds"] else 0.0
+            lines.append(f"{name:<10} {totals['calls']:>7} {totals['seconds']:>10.3f} {mib:>10.1f} {rate:>9.1f}")
+        noisy = sorted(stats["hits"].items(), key=lambda item: item[1]["headers"], reverse=True)[:top]
+        if noisy:
+            lines.append("")
+            lines.append("noisiest signatures (header hits / footer hits / accepted):")
+            for key, counts in noisy:
+                accepted = stats["accepted"].get(key.split(" ", 1)[0], 0)
+                lines.append(f"  {key}: {counts['headers']} / {counts['footers']} / {accepted}")
+        if stats["rejections"]:
+            lines.append("")
+            lines.append("rejections per rule:")
+            for ext, rules in sorted(stats["rejections"].items()):
+                lines.append(f"  {ext}: " + ", ".join(f"{rule}={count}" for rule, count in sorted(rules.items())))
+        return "\n".join(lines)
+
+    def close(self):
+        if self._trace is not None:
+            self._trace.close()
+            self._trace = None
@@ -0,0 +1,279 @@
+# search_backends.py
+
+"""
+Single-needle search backends used by FILE_CARVER.find_all_occurrences.
+
+Every backend has the signature backend(data, needle) and returns the offsets
+of every (overlapping) occurrence of needle in data as an array('Q'). data may
+be any contiguous buffer: bytes, bytearray, memoryview or a read-only mmap.
+
+  - "memmem": libc's memmem through ctypes, with its prototype declared. The
+    buffer address is taken through the buffer protocol, so read-only
+    mappings work, and the buffer stays exported (the mmap cannot be closed)
+    while the search runs.
+  - "numpy": vectorized compare of the first needle byte over windows of the
+    buffer, then of each following byte at the surviving offsets, so even
+    very frequent short needles (b"\x0A", b"BM") cost a handful of NumPy
+    calls per window instead of one Python call per hit. Needs NumPy.
+  - "regex": re.finditer with a zero-width lookahead (overlapping matches).
+  - "find": bytes.find in a loop (bytes, bytearray and mmap only).
+
+Which backends are usable depends on the platform (no memmem in the Windows
+C runtime, no ctypes.pythonapi outside CPython) and on NumPy being installed.
+find_all uses the fastest usable one, picked once per process by
+select_backend: a micro-benchmark that also discards any backend whose
+results disagree with the others. It runs on slices of the first buffer
+searched, with the needles searched for in it (the per-hit call overhead of
+memmem and the per-call overhead of NumPy weigh very differently on a
+frequent one-byte needle and on a rare signature), and only falls back to a
+synthetic buffer with typical signature needles when called without data.
+"""
+
+import ctypes
+import ctypes.util
+import platform
+import random
+import re
+import time
+from array import array
+from contextlib import contextmanager
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Window of the buffer compared at once by the NumPy backend (bounds its temporary arrays).
+NUMPY_WINDOW = 16 * 1024 * 1024
+# Bytes (taken as BENCHMARK_SLICES evenly spaced slices of the searched data) and needles timed by select_backend.
+BENCHMARK_SIZE = 1024 * 1024
+BENCHMARK_SLICES = 8
+BENCHMARK_NEEDLES = 16
+# Needles timed when select_backend has no data to sample: typical (rare, multi-byte) signature headers and footers.
+BENCHMARK_DEFAULT_NEEDLES = (b"\xff\xd8\xff", b"\x89PNG\r\n\x1a\n", b"PK\x03\x04", b"%PDF", b"\xff\xd9", b"IEND\xaeB`\x82", b"PK\x05\x06", b"Rar!")
+
+
+# --- libc memmem ---
+def load_libc():
+    """Returns the C library with memmem's prototype declared, or None if it (or memmem) cannot be loaded."""
+    if platform.system() == "Windows":
+        # The Microsoft C runtime has no memmem.
+        return None
+    names = [ctypes.util.find_library("c"), "libc.so.6", "libc.dylib", None]
+    for name in names:
+        try:
+            libc = ctypes.CDLL(name)
+            memmem = libc.memmem
+        except (OSError, AttributeError):
+            continue
+        memmem.argtypes = [ctypes.c_void_p, ctypes.c_size_t, ctypes.c_void_p, ctypes.c_size_t]
+        memmem.restype = ctypes.c_void_p
+        return libc
+    return None
+
+
+class _PyBuffer(ctypes.Structure):
+    # Py_buffer from the CPython buffer protocol.
+    _fields_ = [
+        ("buf", ctypes.c_void_p),
+        ("obj", ctypes.c_void_p),
+        ("len", ctypes.c_ssize_t),
+        ("itemsize", ctypes.c_ssize_t),
+        ("readonly", ctypes.c_int),
+        ("ndim", ctypes.c_int),
+        ("format", ctypes.c_char_p),
+        ("shape", ctypes.c_void_p),
+        ("strides", ctypes.c_void_p),
+        ("suboffsets", ctypes.c_void_p),
+        ("internal", ctypes.c_void_p),
+    ]
+
+
+def _load_buffer_api():
+    try:
+        get_buffer = ctypes.pythonapi.PyObject_GetBuffer
+        release_buffer = ctypes.pythonapi.PyBuffer_Release
+    except AttributeError:
+        return None, None
+    get_buffer.argtypes = [ctypes.py_object, ctypes.POINTER(_PyBuffer), ctypes.c_int]
+    get_buffer.restype = ctypes.c_int
+    release_buffer.argtypes = [ctypes.POINTER(_PyBuffer)]
+    release_buffer.restype = None
+    return get_buffer, release_buffer
+
+
+LIBC = load_libc()
+_get_buffer, _release_buffer = _load_buffer_api()
+
+
+@contextmanager
+def buffer_address(data):
+    """Yields (address, length) of the contiguous buffer data, which stays exported until the block exits."""
+    view = _PyBuffer()
+    # PyBUF_SIMPLE (0): contiguous bytes, read-only buffers allowed.
+    _get_buffer(data, ctypes.byref(view), 0)
+    try:
+        yield view.buf, view.len
+    finally:
+        _release_buffer(ctypes.byref(view))
+
+
+def find_all_memmem(data, needle):
+    """Finds every occurrence of needle in data with libc memmem (see memmem_available)."""
+    offsets = array("Q")
+    needle = bytes(needle)
+    needle_len = len(needle)
+    if not needle_len:
+        return offsets
+    append = offsets.append
+    memmem = LIBC.memmem
+    with buffer_address(data) as (base, length):
+        if not length:
+            return offsets
+        pos = base
+        last = base + length
+        while last - pos >= needle_len:
+            hit = memmem(pos, last - pos, needle, needle_len)
+            if not hit:
+                break
+            append(hit - base)
+            pos = hit + 1
+    return offsets
+
+
+def memmem_available():
+    return LIBC is not None and _get_buffer is not None
+
+
+# --- NumPy ---
+def find_all_numpy(data, needle):
+    """Finds every occurrence of needle in data with vectorized NumPy compares (NumPy required)."""
+    offsets = array("Q")
+    needle = bytes(needle)
+    if not needle:
+        return offsets
+    haystack = np.frombuffer(data, dtype=np.uint8)
+    total = len(haystack)
+    last_start = total - len(needle)  # Last offset where the needle still fits.
+    for window_start in range(0, last_start + 1, NUMPY_WINDOW):
+        window_end = min(window_start + NUMPY_WINDOW, last_start + 1)
+        candidates = np.flatnonzero(haystack[window_start:window_end] == needle[0]) + window_start
+        for index in range(1, len(needle)):
+            if not len(candidates):
+                break
+            candidates = candidates[haystack[candidates + index] == needle[index]]
+        offsets.frombytes(candidates.astype(np.uint64).tobytes())
+    return offsets
+
+
+# --- Pure Python ---
+def find_all_regex(data, needle):
+    """Finds every occurrence of needle in data with re.finditer (a lookahead keeps overlapping matches)."""
+    needle = bytes(needle)
+    if not needle:
+        return array("Q")
+    pattern = re.compile(b"(?=" + re.escape(needle) + b")", re.DOTALL)
+    return array("Q", [m.start() for m in pattern.finditer(data)])
+
+
+def find_all_find(data, needle):
+    """Finds every occurrence of needle in data with data.find (bytes, bytearray or mmap)."""
+    offsets = array("Q")
+    needle = bytes(needle)
+    if not needle:
+        return offsets
+    append = offsets.append
+    find = data.find
+    idx = find(needle)
+    while idx != -1:
+        append(idx)
+        idx = find(needle, idx + 1)
+    return offsets
+
+
+# --- Backend Selection ---
+def available_backends():
+    """Returns the usable backends on this platform as a dict of name -> function."""
+    backends = {}
+    if memmem_available():
+        backends["memmem"] = find_all_memmem
+    if np is not None:
+        backends["numpy"] = find_all_numpy
+    backends["regex"] = find_all_regex
+    backends["find"] = find_all_find
+    return backends
+
+
+_SELECTED = None
+# Whether _SELECTED was measured on searched data rather than on the synthetic fallback.
+_SELECTED_ON_DATA = False
+
+
+def benchmark_sample(data):
+    """Returns up to BENCHMARK_SIZE bytes of data, as BENCHMARK_SLICES slices spread evenly over it."""
+    size = len(data)
+    if size <= BENCHMARK_SIZE:
+        return bytes(data)
+    slice_size = BENCHMARK_SIZE // BENCHMARK_SLICES
+    step = (size - slice_size) // (BENCHMARK_SLICES - 1)
+    return b"".join(bytes(data[i * step:i * step + slice_size]) for i in range(BENCHMARK_SLICES))
+
+
+def benchmark_needles(needles):
+    """Returns at most BENCHMARK_NEEDLES distinct non-empty needles, spread evenly over needles by length."""
+    needles = sorted({bytes(needle) for needle in needles if needle}, key=lambda needle: (len(needle), needle))
+    if len(needles) <= BENCHMARK_NEEDLES:
+        return needles
+    step = len(needles) / BENCHMARK_NEEDLES
+    return [needles[int(i * step)] for i in range(BENCHMARK_NEEDLES)]
+
+
+def select_backend(data=None, needles=None):
+    """
+    Returns (name, function) of the fastest usable backend, measured once per process.
+    The first call given data and needles times the backends on benchmark_sample(data) with
+    benchmark_needles(needles); calls before that use BENCHMARK_SIZE pseudo-random bytes
+    with BENCHMARK_DEFAULT_NEEDLES.
+    """
+    global _SELECTED, _SELECTED_ON_DATA
+    on_data = data is not None and bool(needles)
+    if _SELECTED is not None and (_SELECTED_ON_DATA or not on_data):
+        return _SELECTED
+    if on_data:
+        sample = benchmark_sample(data)
+        needles = benchmark_needles(needles)
+    else:
+        sample = random.Random(0).getrandbits(8 * BENCHMARK_SIZE).to_bytes(BENCHMARK_SIZE, "little")
+        needles = BENCHMARK_DEFAULT_NEEDLES
+    expected = [find_all_find(sample, needle) for needle in needles]
+    timings = []
+    best = float("inf")
+    for name, backend in available_backends().items():
+        results = []
+        try:
+            started = time.perf_counter()
+            for needle in needles:
+                results.append(backend(sample, needle))
+                elapsed = time.perf_counter() - started
+                if elapsed > best:
+                    # Already slower than a backend timed before: no need to finish.
+                    break
+        except Exception:
+            # A backend that cannot run here (e.g. a broken ctypes setup) is simply not used.
+            continue
+        if results == expected:
+            timings.append((elapsed, name, backend))
+            best = min(best, elapsed)
+    _, name, backend = min(timings)
+    _SELECTED = (name, backend)
+    _SELECTED_ON_DATA = on_data
+    return _SELECTED
+
+
+def find_all(data, needle):
+    """Finds every occurrence of needle in data with the fastest usable backend."""
+    name, backend = select_backend(data, (needle,))
+    if backend is find_all_find and not hasattr(data, "find"):
+        # memoryview has no find(); the regex backend accepts any buffer.
+        return find_all_regex(data, needle)
+    return backend(data, needle)
@@ -0,0 +1,107 @@
+# signature_set.py
+
+"""
+SignatureSet: a compiled, read-only view of a list of file signatures.
+
+Compiling a signature list once gives every scan:
+  - the signatures deduplicated (same extension, header, footer and maximum
+    size), in their original order,
+  - by_header: signatures grouped by identical header (e.g. every ZIP-based
+    format under b"PK\x03\x04"), plus the unique header and footer patterns,
+  - the shortest and longest header/footer pattern (min_length, max_length),
+  - the verification rule of every extension in the set,
+  - the multi-pattern matcher (whose trie shares common header prefixes),
+    built on first use per alignment.
+Matchers are cached per process under a SHA-256 digest of the signature
+definitions, so recompiling the same list never rebuilds them.
+
+select() narrows a set to categories (see file_signatures.CATEGORIES) and/or
+extensions, so a scan for images and archives only never builds or evaluates
+the other signatures.
+"""
+
+import hashlib
+
+from lib import file_signatures
+from lib.multi_pattern import MultiPatternMatcher
+
+# Matchers built so far, keyed by (signature digest, alignment).
+_MATCHERS = {}
+_DEFAULT = None
+
+
+class SignatureSet:
+
+    def __init__(self, signatures=None):
+        """Compiles an iterable of signature dictionaries (default: file_signatures.SIGNATURES)."""
+        if signatures is None:
+            signatures = file_signatures.SIGNATURES
+        self.signatures = []
+        seen = set()
+        for sig in signatures:
+            key = self.signature_key(sig)
+            if key not in seen:
+                seen.add(key)
+                self.signatures.append(sig)
+
+        self.by_header = {}
+        for sig in self.signatures:
+            self.by_header.setdefault(sig["header"], []).append(sig)
+        self.headers = list(self.by_header)
+        self.footers = list(dict.fromkeys(sig["footer"] for sig in self.signatures if sig["footer"]))
+        lengths = [len(pattern) for pattern in self.headers + self.footers]
+        self.min_length = min(lengths, default=0)
+        self.max_length = max(lengths, default=0)
+        self.extensions = sorted({sig["extension"] for sig in self.signatures})
+        self.rules = {ext: file_signatures.VERIFICATION_RULES.get(ext, file_signatures.DEFAULT_VERIFICATION_RULE) for ext in self.extensions}
+        self.digest = hashlib.sha256(repr([self.signature_key(sig) for sig in self.signatures]).encode()).hexdigest()
+
+    @staticmethod
+    def signature_key(sig):
+        footer = bytes(sig["footer"]) if sig["footer"] else None
+        return (sig["extension"], bytes(sig["header"]), footer, sig.get("max_size"))
+
+    @classmethod
+    def default(cls):
+        """Returns the compiled set of every signature in file_signatures.SIGNATURES (compiled once)."""
+        global _DEFAULT
+        if _DEFAULT is None:
+            _DEFAULT = cls()
+        return _DEFAULT
+
+    def __iter__(self):
+        return iter(self.signatures)
+
+    def __len__(self):
+        return len(self.signatures)
+
+    # --- Matcher ---
+    def matcher(self, alignment=None):
+        """
+        Returns the MultiPatternMatcher for every header and footer of the set.
+        With alignment set, headers are only matched at multiples of alignment.
+        """
+        alignment = alignment if alignment and alignment > 1 else None
+        key = (self.digest, alignment)
+        matcher = _MATCHERS.get(key)
+        if matcher is None:
+            if alignment:
+                matcher = MultiPatternMatcher(self.footers, aligned_patterns=self.headers, alignment=alignment)
+            else:
+                matcher = MultiPatternMatcher(self.headers + self.footers)
+            _MATCHERS[key] = matcher
+        return matcher
+
+    # --- Subsets ---
+    def select(self, categories=None, extensions=None):
+        """
+        Returns the subset of this set whose extensions belong to any of the given categories
+        (keys of file_signatures.CATEGORIES) or are listed in extensions.
+        Raises ValueError for an unknown category.
+        """
+        wanted = set(extensions or ())
+        for category in categories or ():
+            if category not in file_signatures.CATEGORIES:
+                raise ValueError(f"Unknown signature category {category!r}")
+            wanted.update(file_signatures.CATEGORIES[category])
+        return SignatureSet(sig for sig in self.signatures if sig["extension"] in wanted)
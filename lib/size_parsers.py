@@ -0,0 +1,330 @@
+# size_parsers.py
+
+"""
+Structure-aware size parsers for file formats whose length can be read from
+(or walked through) their own headers, instead of searching for a footer.
+
+Each parser is called as parser(read, offset, limit), where:
+  - read(position, length) returns up to length bytes of the image at position,
+  - offset is where the file's header starts,
+  - limit is the largest size the file may have (bounded by the end of the
+    image and the signature's maximum carve length).
+It returns the exact file size in bytes, or None if the header is not
+plausible or the size cannot be determined (the carver then falls back to
+footer/orphan carving). Parsers read O(1) bytes, or O(chunks) for formats
+made of chunks/boxes/records.
+
+SIZE_PARSERS maps a signature extension to its parser. Several formats share
+one container (ZIP for OOXML, OpenDocument, EPUB and XPS; ISO-BMFF for MP4,
+MOV, HEIF, AVIF and JPEG 2000), so a parsed size alone does not say which of
+them a file is: STRUCTURE_FORMATS maps those extensions to a function
+(read, offset, size) returning the extension the container's contents belong
+to, and only that extension (or the generic zip/mp4) may claim the file.
+"""
+
+import struct
+import zlib
+
+
+def bmp_size(read, offset, limit):
+    """BMP: file size field of the BITMAPFILEHEADER, checked against the DIB header."""
+    header = read(offset, 18)
+    if len(header) < 18 or header[:2] != b"BM":
+        return None
+    size, reserved, data_offset, dib_size = struct.unpack_from("<IIII", header, 2)
+    if reserved != 0 or dib_size not in (12, 40, 52, 56, 64, 108, 124):
+        return None
+    if not 14 + dib_size <= data_offset < size <= limit:
+        return None
+    return size
+
+
+def riff_size(read, offset, limit):
+    """RIFF containers (WebP, WAV, AVI): chunk size of the outer RIFF chunk plus its 8-byte header."""
+    header = read(offset, 12)
+    if len(header) < 12 or header[:4] != b"RIFF":
+        return None
+    form_type = bytes(header[8:12])
+    if not all(32 <= c < 127 for c in form_type):
+        return None
+    size = struct.unpack_from("<I", header, 4)[0] + 8
+    if not 12 <= size <= limit:
+        return None
+    return size
+
+
+def png_size(read, offset, limit):
+    """PNG: walks the chunk list up to and including IEND."""
+    pos = offset + 8
+    end = offset + limit
+    while pos + 12 <= end:
+        chunk = read(pos, 8)
+        if len(chunk) < 8:
+            return None
+        length = struct.unpack_from(">I", chunk, 0)[0]
+        chunk_type = bytes(chunk[4:8])
+        if not chunk_type.isalpha():
+            return None
+        pos += 12 + length
+        if chunk_type == b"IEND":
+            return pos - offset if pos <= end else None
+    return None
+
+
+def zip_size(read, offset, limit):
+    """
+    ZIP and ZIP-based formats: walks local file records and the central directory
+    to the end of central directory record (including its comment). The central directory
+    offset it records must match, so a walk started at a later member's header is rejected.
+    """
+    pos = offset
+    end = offset + limit
+    directory_start = None
+    while pos + 4 <= end:
+        signature = bytes(read(pos, 4))
+        if signature == b"PK\x03\x04":
+            record = read(pos, 30)
+            if len(record) < 30:
+                return None
+            flags = struct.unpack_from("<H", record, 6)[0]
+            compressed_size = struct.unpack_from("<I", record, 18)[0]
+            name_length, extra_length = struct.unpack_from("<HH", record, 26)
+            if flags & 0x08 and compressed_size == 0:
+                # Sizes are only in the trailing data descriptor; the records cannot be walked.
+                return None
+            pos += 30 + name_length + extra_length + compressed_size
+        elif signature == b"PK\x01\x02":
+            if directory_start is None:
+                directory_start = pos
+            record = read(pos, 46)
+            if len(record) < 46:
+                return None
+            name_length, extra_length, comment_length = struct.unpack_from("<HHH", record, 28)
+            pos += 46 + name_length + extra_length + comment_length
+        elif signature == b"PK\x06\x06":
+            record = read(pos, 12)
+            if len(record) < 12:
+                return None
+            pos += 12 + struct.unpack_from("<Q", record, 4)[0]
+        elif signature == b"PK\x06\x07":
+            pos += 20
+        elif signature == b"PK\x05\x06":
+            record = read(pos, 22)
+            if len(record) < 22:
+                return None
+            directory_offset = struct.unpack_from("<I", record, 16)[0]
+            # 0xFFFFFFFF: the offset is in the ZIP64 record instead.
+            if directory_start is not None and directory_offset not in (0xFFFFFFFF, directory_start - offset):
+                return None
+            pos += 22 + struct.unpack_from("<H", record, 20)[0]
+            return pos - offset if pos <= end else None
+        else:
+            return None
+    return None
+
+
+def isobmff_size(read, offset, limit):
+    """
+    ISO Base Media File Format (MP4, MOV, HEIF/HEIC, AVIF, JPEG 2000): sums consecutive
+    top-level boxes until the next box header is no longer plausible.
+    """
+    pos = offset
+    end = offset + limit
+    boxes = 0
+    while pos + 8 <= end:
+        header = read(pos, 16)
+        if len(header) < 8:
+            break
+        size = struct.unpack_from(">I", header, 0)[0]
+        box_type = bytes(header[4:8])
+        if not all(48 <= c < 123 or c == 32 for c in box_type):
+            break
+        if size == 1:
+            if len(header) < 16:
+                break
+            size = struct.unpack_from(">Q", header, 8)[0]
+        elif size == 0:
+            # Box extends to the end of the file, which is unknown here.
+            return None
+        if size < 8 or pos + size > end:
+            break
+        pos += size
+        boxes += 1
+    # A lone ftyp/signature box is not a file.
+    return pos - offset if boxes >= 2 else None
+
+
+def zip_members(read, offset, limit):
+    """Returns (name, data offset, stored size) of the local file records of the ZIP at offset, in order."""
+    members = []
+    pos = offset
+    end = offset + limit
+    while pos + 30 <= end:
+        record = read(pos, 30)
+        if len(record) < 30 or bytes(record[:4]) != b"PK\x03\x04":
+            break
+        compressed_size = struct.unpack_from("<I", record, 18)[0]
+        name_length, extra_length = struct.unpack_from("<HH", record, 26)
+        data_offset = pos + 30 + name_length + extra_length
+        members.append((bytes(read(pos + 30, name_length)), data_offset, compressed_size))
+        pos = data_offset + compressed_size
+    return members
+
+
+# mimetype entry of OpenDocument / EPUB archives -> extension.
+ZIP_MIMETYPES = {
+    b"application/vnd.oasis.opendocument.text": "odt",
+    b"application/vnd.oasis.opendocument.spreadsheet": "ods",
+    b"application/vnd.oasis.opendocument.presentation": "odp",
+    b"application/epub+zip": "epub",
+}
+# Office Open XML part folder -> (extension, macro-enabled extension).
+OOXML_PARTS = ((b"word/", ("docx", "docm")), (b"xl/", ("xlsx", "xlsm")), (b"ppt/", ("pptx", "pptm")))
+
+
+def zip_format(read, offset, size):
+    """
+    Returns the extension of the ZIP-based format of the size-byte archive at offset: odt, ods, odp or epub
+    (first member "mimetype"), docx, xlsx, pptx or their macro-enabled variants ([Content_Types].xml plus a
+    word/, xl/ or ppt/ part; vbaProject.bin makes it macro-enabled), xps (a FixedDocumentSequence .fdseq part),
+    else zip.
+    """
+    members = zip_members(read, offset, size)
+    names = {name for name, _, _ in members}
+    if members and members[0][0] == b"mimetype":
+        _, data_offset, stored_size = members[0]
+        extension = ZIP_MIMETYPES.get(bytes(read(data_offset, min(stored_size, 128))))
+        if extension:
+            return extension
+    if any(name.endswith(b".fdseq") for name in names):
+        return "xps"
+    if b"[Content_Types].xml" in names:
+        for folder, extensions in OOXML_PARTS:
+            if any(name.startswith(folder) for name in names):
+                return extensions[folder + b"vbaProject.bin" in names]
+    return "zip"
+
+
+# ftyp major brand -> extension (mif1/msf1 files are AVIF when they list an avif brand).
+ISOBMFF_BRANDS = {
+    b"qt  ": "mov",
+    b"heic": "heic", b"heix": "heic", b"heim": "heic", b"heis": "heic", b"hevc": "heic", b"hevx": "heic",
+    b"mif1": "heif", b"msf1": "heif", b"heif": "heif",
+    b"avif": "avif", b"avis": "avif",
+    b"jp2 ": "jp2", b"jpx ": "jp2", b"jpm ": "jp2",
+}
+
+
+def isobmff_format(read, offset, size):
+    """
+    Returns the extension of the ISO-BMFF file at offset from the major and compatible brands of its ftyp box
+    (the second box in JPEG 2000, after the signature box): mov, heic, heif, avif or jp2, else mp4.
+    """
+    pos = offset
+    header = read(pos, 8)
+    if len(header) == 8 and bytes(header[4:8]) == b"jP  ":
+        pos += struct.unpack_from(">I", header, 0)[0]
+        header = read(pos, 8)
+    if len(header) < 8 or bytes(header[4:8]) != b"ftyp":
+        return "mp4"
+    box_size = min(struct.unpack_from(">I", header, 0)[0], offset + size - pos, 8 + 8 + 4 * 64)
+    box = bytes(read(pos, box_size))
+    major = box[8:12]
+    compatible = {box[i:i + 4] for i in range(16, len(box) - 3, 4)}
+    extension = ISOBMFF_BRANDS.get(major, "mp4")
+    if extension == "heif" and compatible & {b"avif", b"avis"}:
+        return "avif"
+    if extension == "heif" and compatible & {b"heic", b"heix"}:
+        return "heic"
+    return extension
+
+
+def sevenzip_size(read, offset, limit):
+    """7z: the signature header gives the offset and size of the end header (CRC-checked)."""
+    header = read(offset, 32)
+    if len(header) < 32:
+        return None
+    start_header_crc = struct.unpack_from("<I", header, 8)[0]
+    if zlib.crc32(bytes(header[12:32])) != start_header_crc:
+        return None
+    next_header_offset, next_header_size = struct.unpack_from("<QQ", header, 12)
+    size = 32 + next_header_offset + next_header_size
+    if not 32 < size <= limit:
+        return None
+    return size
+
+
+def elf_size(read, offset, limit):
+    """ELF: the section header table is normally the last thing in the file."""
+    header = read(offset, 64)
+    if len(header) < 52 or header[:4] != b"\x7fELF":
+        return None
+    elf_class, data = header[4], header[5]
+    if data not in (1, 2):
+        return None
+    order = "<" if data == 1 else ">"
+    if elf_class == 1:
+        section_offset = struct.unpack_from(order + "I", header, 0x20)[0]
+        entry_size, entry_count = struct.unpack_from(order + "HH", header, 0x2E)
+        expected_entry_size = 40
+    elif elf_class == 2 and len(header) >= 64:
+        section_offset = struct.unpack_from(order + "Q", header, 0x28)[0]
+        entry_size, entry_count = struct.unpack_from(order + "HH", header, 0x3A)
+        expected_entry_size = 64
+    else:
+        return None
+    if entry_size != expected_entry_size or entry_count == 0:
+        return None
+    size = section_offset + entry_size * entry_count
+    if not len(header) <= size <= limit:
+        return None
+    return size
+
+
+def woff_size(read, offset, limit):
+    """WOFF / WOFF2: total length field of the font header."""
+    header = read(offset, 12)
+    if len(header) < 12:
+        return None
+    size = struct.unpack_from(">I", header, 8)[0]
+    if not 12 < size <= limit:
+        return None
+    return size
+
+
+SIZE_PARSERS = {
+    "bmp": bmp_size,
+    "webp": riff_size,
+    "wav": riff_size,
+    "avi": riff_size,
+    "png": png_size,
+    "zip": zip_size,
+    "docx": zip_size,
+    "xlsx": zip_size,
+    "pptx": zip_size,
+    "docm": zip_size,
+    "xlsm": zip_size,
+    "pptm": zip_size,
+    "odt": zip_size,
+    "ods": zip_size,
+    "odp": zip_size,
+    "epub": zip_size,
+    "xps": zip_size,
+    "jp2": isobmff_size,
+    "heic": isobmff_size,
+    "heif": isobmff_size,
+    "avif": isobmff_size,
+    "mp4": isobmff_size,
+    "mov": isobmff_size,
+    "7z": sevenzip_size,
+    "elf": elf_size,
+    "woff": woff_size,
+    "woff2": woff_size,
+}
+
+# Extensions sharing a size parser with other formats -> function naming the format a parsed file belongs to.
+STRUCTURE_FORMATS = {
+    extension: zip_format if parser is zip_size else isobmff_format
+    for extension, parser in SIZE_PARSERS.items()
+    if parser in (zip_size, isobmff_size)
+}
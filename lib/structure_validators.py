@@ -0,0 +1,292 @@
+# structure_validators.py
+
+"""
+Structural decoder checks that validate a whole file rather than just its
+size, used by bifragment gap carving (lib/bifragment) to tell a correct
+reassembly of a fragmented file from a wrong one.
+
+Each validator is called as validator(read, limit, resume=None), where:
+  - read(position, length) returns the file's bytes at file-relative
+    positions (0 is the first header byte); the file may be reassembled from
+    several image ranges (see bifragment.fragment_reader),
+  - limit is the largest size the file may have,
+  - resume is a resume point returned by an earlier call over the same
+    leading bytes; validation then starts there instead of at the header.
+It returns (size, resume, failed_at):
+  - size: the exact file size if the structure is valid up to its end, else None,
+  - resume: (position, state), the last point before failed_at from which
+    validation can restart (everything before it has been checked); when the
+    check only ran out of bytes at limit this is as close to limit as the
+    format allows (the start of the unfinished PNG chunk or ZIP member, or
+    limit itself inside a JPEG scan),
+  - failed_at: where validation failed, or None when the file is valid.
+Damage (e.g. the end of the first fragment) therefore lies in
+[resume position, failed_at].
+
+Checks:
+  - PNG: the CRC-32 of every chunk, up to IEND.
+  - ZIP: the CRC-32 of every stored or deflated member (inflating with zlib),
+    then the central directory entries, which must point at local headers,
+    up to the end of central directory record.
+  - JPEG: a marker walk of the header segments and the entropy-coded scans,
+    where 0xFF may only be followed by a stuffed 0x00, the next restart marker
+    in sequence, or a marker that can legally follow a scan. A run of
+    JPEG_ZERO_RUN zero bytes (unwritten or wiped space) is also rejected.
+
+STRUCTURE_VALIDATORS maps a signature extension to its validator, and
+MIN_TAIL the bytes past a fragment split its verdict needs to be trusted.
+"""
+
+import struct
+import zlib
+
+# Bytes read (and CRC'd or inflated) at a time.
+READ_CHUNK = 1024 * 1024
+PNG_MAGIC = b"\x89PNG\r\n\x1a\n"
+JPEG_ZERO_RUN = b"\x00" * 4096
+# Markers that may follow an entropy-coded scan: EOI, DHT, DAC, SOS, DQT, DNL, DRI, APPn, COM.
+JPEG_AFTER_SCAN = {0xD9, 0xC4, 0xCC, 0xDA, 0xDB, 0xDC, 0xDD, 0xFE} | set(range(0xE0, 0xF0))
+
+
+def png_check(read, limit, resume=None):
+    """PNG: every chunk's CRC, up to and including IEND."""
+    if resume is None:
+        if bytes(read(0, 8)) != PNG_MAGIC:
+            return None, (0, None), 0
+        pos = 8
+    else:
+        pos = resume[0]
+    while True:
+        header = read(pos, 8)
+        if len(header) < 8 or pos + 12 > limit:
+            return None, (pos, None), min(pos + len(header), limit)
+        length = struct.unpack_from(">I", header, 0)[0]
+        chunk_type = bytes(header[4:8])
+        end = pos + 12 + length
+        if not chunk_type.isalpha() or end > limit:
+            return None, (pos, None), pos + 8
+        crc = zlib.crc32(chunk_type)
+        for position in range(pos + 8, pos + 8 + length, READ_CHUNK):
+            crc = zlib.crc32(read(position, min(READ_CHUNK, pos + 8 + length - position)), crc)
+        stored = read(pos + 8 + length, 4)
+        if len(stored) < 4 or struct.unpack(">I", stored)[0] != crc:
+            return None, (pos, None), end
+        pos = end
+        if chunk_type == b"IEND":
+            return pos, (pos, None), None
+
+
+def _inflate(read, start, end):
+    """
+    Inflates the raw deflate stream starting at start (reading no further than end).
+    Returns (compressed size, uncompressed size, CRC-32), or None if the stream is invalid or unfinished.
+    """
+    decompressor = zlib.decompressobj(-15)
+    crc = 0
+    size = 0
+    pos = start
+    try:
+        while pos < end and not decompressor.eof:
+            data = read(pos, min(READ_CHUNK, end - pos))
+            if not data:
+                return None
+            pos += len(data)
+            while data and not decompressor.eof:
+                out = decompressor.decompress(data, READ_CHUNK)
+                crc = zlib.crc32(out, crc)
+                size += len(out)
+                data = decompressor.unconsumed_tail
+        if not decompressor.eof:
+            return None
+        out = decompressor.flush()
+    except zlib.error:
+        return None
+    return pos - len(decompressor.unused_data) - start, size + len(out), zlib.crc32(out, crc)
+
+
+def zip_check(read, limit, resume=None):
+    """ZIP: every member's CRC (stored or deflated), then the central directory and end record."""
+    if resume is None:
+        if bytes(read(0, 4)) != b"PK\x03\x04":
+            return None, (0, None), 0
+        pos = 0
+    else:
+        pos = resume[0]
+
+    # Local file records.
+    while True:
+        signature = bytes(read(pos, 4))
+        if signature != b"PK\x03\x04":
+            break
+        record = read(pos, 30)
+        if len(record) < 30:
+            return None, (pos, None), pos
+        flags, method = struct.unpack_from("<HH", record, 6)
+        crc, compressed_size, size = struct.unpack_from("<III", record, 14)
+        name_length, extra_length = struct.unpack_from("<HH", record, 26)
+        data_start = pos + 30 + name_length + extra_length
+        if data_start > limit:
+            return None, (pos, None), pos + 30
+        descriptor = flags & 0x08
+        if flags & 0x01 or method not in (0, 8):
+            # Encrypted or other compression: only the record structure can be followed.
+            if descriptor and compressed_size == 0:
+                return None, (pos, None), data_start
+            data_end = data_start + compressed_size
+        elif method == 8 and descriptor and compressed_size == 0:
+            inflated = _inflate(read, data_start, limit)
+            if inflated is None:
+                return None, (pos, None), limit
+            compressed_size, inflated_size, inflated_crc = inflated
+            data_end = data_start + compressed_size
+            described = read(data_end, 16)
+            if bytes(described[:4]) == b"PK\x07\x08":
+                described = described[4:]
+            if len(described) < 12 or struct.unpack_from("<III", described, 0) != (inflated_crc, compressed_size, inflated_size):
+                return None, (pos, None), data_end + 16
+        else:
+            data_end = data_start + compressed_size
+            if data_end > limit:
+                return None, (pos, None), limit
+            if method == 0:
+                actual_crc = 0
+                for position in range(data_start, data_end, READ_CHUNK):
+                    actual_crc = zlib.crc32(read(position, min(READ_CHUNK, data_end - position)), actual_crc)
+                valid = compressed_size == size and actual_crc == crc
+            else:
+                inflated = _inflate(read, data_start, data_end)
+                valid = inflated == (compressed_size, size, crc)
+            if not valid:
+                return None, (pos, None), data_end
+        pos = data_end
+        if descriptor:
+            pos += 16 if bytes(read(pos, 4)) == b"PK\x07\x08" else 12
+
+    # Central directory: restarting at its first entry revalidates all of it.
+    directory_start = pos
+    entries = 0
+    while True:
+        signature = bytes(read(pos, 4))
+        if signature == b"PK\x01\x02":
+            record = read(pos, 46)
+            if len(record) < 46:
+                return None, (directory_start, None), pos
+            name_length, extra_length, comment_length = struct.unpack_from("<HHH", record, 28)
+            local_offset = struct.unpack_from("<I", record, 42)[0]
+            if local_offset != 0xFFFFFFFF and (local_offset >= directory_start or bytes(read(local_offset, 4)) != b"PK\x03\x04"):
+                return None, (directory_start, None), pos + 46
+            pos += 46 + name_length + extra_length + comment_length
+            entries += 1
+        elif signature == b"PK\x06\x06":
+            record = read(pos, 12)
+            if len(record) < 12:
+                return None, (directory_start, None), pos
+            pos += 12 + struct.unpack_from("<Q", record, 4)[0]
+        elif signature == b"PK\x06\x07":
+            pos += 20
+        elif signature == b"PK\x05\x06":
+            record = read(pos, 22)
+            if len(record) < 22:
+                return None, (directory_start, None), pos
+            total_entries = struct.unpack_from("<H", record, 10)[0]
+            directory_offset = struct.unpack_from("<I", record, 16)[0]
+            end = pos + 22 + struct.unpack_from("<H", record, 20)[0]
+            if (total_entries != 0xFFFF and total_entries != entries) or (directory_offset != 0xFFFFFFFF and directory_offset != directory_start) or end > limit:
+                return None, (directory_start, None), pos + 22
+            return end, (end, None), None
+        else:
+            return None, (directory_start, None), pos
+        if pos > limit:
+            return None, (directory_start, None), limit
+
+
+def jpeg_check(read, limit, resume=None):
+    """JPEG: marker walk through the header segments and entropy-coded scans, up to EOI."""
+    if resume is None:
+        if bytes(read(0, 2)) != b"\xff\xd8":
+            return None, (0, False), 0
+        pos, in_scan = 2, False
+    else:
+        pos, in_scan = resume
+    checkpoint = (pos, in_scan)
+    next_restart = None
+    # Scan data is read in windows growing to READ_CHUNK: a wrong reassembly usually fails within the first few.
+    window = 16 * 1024
+    while pos < limit:
+        if not in_scan:
+            marker = read(pos, 4)
+            if len(marker) < 2 or marker[0] != 0xFF:
+                return None, checkpoint, pos
+            code = marker[1]
+            if code == 0xFF:
+                pos += 1  # Fill byte before a marker.
+                continue
+            if code == 0xD9:
+                return pos + 2, (pos + 2, False), None
+            if 0xD0 <= code <= 0xD7 or code == 0x01:
+                pos += 2
+                continue
+            if code == 0x00 or len(marker) < 4:
+                return None, checkpoint, pos
+            length = struct.unpack_from(">H", marker, 2)[0]
+            if length < 2 or pos + 2 + length > limit:
+                return None, checkpoint, pos + 2
+            checkpoint = (pos, False)
+            pos += 2 + length
+            if code == 0xDA:
+                in_scan = True
+                next_restart = None
+                checkpoint = (pos, True)
+            continue
+
+        data = read(pos, min(window, limit - pos))
+        window = min(2 * window, READ_CHUNK)
+        zero_run = data.find(JPEG_ZERO_RUN)
+        end = len(data) if zero_run == -1 else zero_run
+        index = 0
+        while True:
+            found = data.find(b"\xff", index, end)
+            if found == -1 or found + 1 >= len(data):
+                break
+            code = data[found + 1]
+            if code == 0x00:
+                index = found + 2
+            elif 0xD0 <= code <= 0xD7:
+                if next_restart is not None and code != next_restart:
+                    return None, checkpoint, pos + found
+                next_restart = 0xD0 + (code - 0xD0 + 1) % 8
+                index = found + 2
+                # Entropy decoding restarts after each restart marker.
+                checkpoint = (pos + index, True)
+            elif code == 0xFF:
+                index = found + 1
+            elif code in JPEG_AFTER_SCAN:
+                in_scan = False
+                break
+            else:
+                return None, checkpoint, pos + found
+        if in_scan and found == -1 and zero_run != -1:
+            return None, checkpoint, pos + zero_run
+        # Continue at the marker that ends the scan, or re-read a 0xFF split from its following byte.
+        index = end if found == -1 else found
+        if index == 0 and in_scan:
+            break
+        pos += index
+    if in_scan and pos >= limit:
+        # Everything up to limit is valid scan data, so validation can continue from there.
+        checkpoint = (pos, True)
+    return None, checkpoint, min(pos, limit)
+
+
+STRUCTURE_VALIDATORS = {
+    "jpg": jpeg_check,
+    "png": png_check,
+    "zip": zip_check,
+}
+
+# A marker walk accepts random bytes that hold 0xFF 0xD9 before any invalid marker (about one
+# wrong reassembly in 256), which happens within a few hundred bytes; one cluster of valid scan
+# data past the split rules that out. CRC-checked formats need no margin.
+MIN_TAIL = {
+    "jpg": 4096,
+}
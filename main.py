@@ -1,18 +1,48 @@
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
 import threading
-import json
-import file_carver
+import queue
+from file_carver import FILE_CARVER
+from lib.scan_db import ScanDatabase
 
 
 class FileCarverApp:
+    # Rows rendered by the results view; only this window of the result set exists as Treeview items.
+    VISIBLE_ROWS = 30
+    # How often the scan result queue is polled, and the most results moved to the view per poll.
+    POLL_INTERVAL_MS = 100
+    POLL_BATCH = 5000
+    # Quiet time after the last scrollbar drag event before the view jumps there (a jump may take a few index steps).
+    JUMP_DELAY_MS = 150
+    # Treeview column -> ScanDatabase column used when sorting by that heading.
+    SORT_COLUMNS = {"ID": "id", "Type": "extension", "Offset": "offset", "Size": "size", "Entropy": "entropy"}
+
     def __init__(self, master):
         self.master = master
         master.title("File Carver")
 
         self.drive_path = ""
         self.destination_path = ""
-        self.found_files = []  # List to store found file fragments.
+        self.carver = FILE_CARVER()
+        self.db = ScanDatabase()  # Indexed store of found file fragments.
+        self.scan_queue = queue.Queue()  # Found files handed from the scan thread to the Tk thread.
+        self.scanning = False
+        self.recovery_thread = None
+        self.recovery_progress = None  # Latest (files_done, files_total, bytes_done, bytes_total, bytes_per_second).
+        self.recovery_error = None  # Exception that ended the recovery thread, shown by poll_recovery.
+
+        # State of the virtualized results view. view_rows are the rows shown, fetched by sort key
+        # (ScanDatabase.page_after); view_start is their position and total_rows the filtered row count,
+        # both kept up to date from the rows added, so neither is re-queried while a scan runs.
+        self.view_rows = []
+        self.view_start = 0
+        self.total_rows = 0
+        self.order_by = "id"
+        self.descending = False
+        self.filters = {}
+        self.selected_ids = set()
+        self.visible_ids = []
+        self.pending_jump = None
 
         self.create_widgets()
 
@@ -40,15 +70,47 @@ class FileCarverApp:
         ttk.Button(btn_frame, text="Recover Selected", command=self.recover_selected).pack(side="left", padx=5)
         ttk.Button(btn_frame, text="Save DB", command=self.save_db).pack(side="left", padx=5)
         ttk.Button(btn_frame, text="Load DB", command=self.load_db).pack(side="left", padx=5)
+        self.recovery_label = ttk.Label(btn_frame, text="")
+        self.recovery_label.pack(side="right")
 
-        # --- Treeview for displaying found files ---
-        self.tree = ttk.Treeview(self.master, columns=("ID", "Type", "Offset", "Size", "Entropy"), show="headings", selectmode="extended")
-        self.tree.heading("ID", text="ID")
-        self.tree.heading("Type", text="Type")
-        self.tree.heading("Offset", text="Offset")
-        self.tree.heading("Size", text="Size")
-        self.tree.heading("Entropy", text="Entropy")
-        self.tree.pack(padx=10, pady=10, fill="both", expand=True)
+        # --- Result filters ---
+        filter_frame = ttk.Frame(self.master)
+        filter_frame.pack(padx=10, pady=5, fill="x")
+        ttk.Label(filter_frame, text="Type:").pack(side="left")
+        self.type_filter = ttk.Combobox(filter_frame, width=8, values=["All"], postcommand=self.refresh_type_filter)
+        self.type_filter.set("All")
+        self.type_filter.pack(side="left", padx=5)
+        ttk.Label(filter_frame, text="Min size:").pack(side="left")
+        self.min_size_entry = ttk.Entry(filter_frame, width=10)
+        self.min_size_entry.pack(side="left", padx=5)
+        ttk.Label(filter_frame, text="Entropy:").pack(side="left")
+        self.min_entropy_entry = ttk.Entry(filter_frame, width=5)
+        self.min_entropy_entry.pack(side="left")
+        ttk.Label(filter_frame, text="to").pack(side="left", padx=2)
+        self.max_entropy_entry = ttk.Entry(filter_frame, width=5)
+        self.max_entropy_entry.pack(side="left")
+        ttk.Button(filter_frame, text="Apply Filter", command=self.apply_filter).pack(side="left", padx=5)
+        self.status_label = ttk.Label(filter_frame, text="0 files")
+        self.status_label.pack(side="right")
+
+        # --- Virtualized Treeview for displaying found files ---
+        # A fixed pool of VISIBLE_ROWS items is reused for whichever window of the
+        # (sorted, filtered) results is scrolled into view.
+        tree_frame = ttk.Frame(self.master)
+        tree_frame.pack(padx=10, pady=10, fill="both", expand=True)
+        self.tree = ttk.Treeview(tree_frame, columns=("ID", "Type", "Offset", "Size", "Entropy"), show="headings", selectmode="extended", height=self.VISIBLE_ROWS)
+        for column in ("ID", "Type", "Offset", "Size", "Entropy"):
+            self.tree.heading(column, text=column, command=lambda c=column: self.sort_by(c))
+        self.row_items = [self.tree.insert("", tk.END, iid=f"row{i}") for i in range(self.VISIBLE_ROWS)]
+        for item in self.row_items:
+            self.tree.detach(item)
+        self.scrollbar = ttk.Scrollbar(tree_frame, orient="vertical", command=self.on_scroll)
+        self.scrollbar.pack(side="right", fill="y")
+        self.tree.pack(side="left", fill="both", expand=True)
+        self.tree.bind("<<TreeviewSelect>>", self.on_select)
+        self.tree.bind("<MouseWheel>", self.on_mousewheel)
+        self.tree.bind("<Button-4>", self.on_mousewheel)
+        self.tree.bind("<Button-5>", self.on_mousewheel)
 
     def select_drive(self):
         path = filedialog.askopenfilename(title="Select Drive or Disk Image")
@@ -68,52 +130,280 @@ class FileCarverApp:
         if not self.drive_path:
             messagebox.showerror("Error", "Please select a drive/image file.")
             return
-        # Start scanning in a separate thread.
+        if self.scanning:
+            messagebox.showerror("Error", "A scan is already running.")
+            return
+        self.db.clear()
+        self.selected_ids.clear()
+        self.scanning = True
+        self.reset_view()
+        # Start scanning in a separate thread; results come back through scan_queue.
         threading.Thread(target=self.scan_thread, daemon=True).start()
+        self.master.after(self.POLL_INTERVAL_MS, self.poll_scan_queue)
 
     def scan_thread(self):
-        self.found_files = file_carver.scan_drive(self.drive_path)
-        self.update_treeview()
+        # Runs off the Tk thread, so it must not touch widgets or the database directly.
+        try:
+            self.carver.scan_drive(self.drive_path, on_found=self.scan_queue.put)
+        except Exception as e:
+            self.scan_queue.put(e)  # Shown by poll_scan_queue on the Tk thread.
+        finally:
+            self.scan_queue.put(None)  # End-of-scan marker.
+
+    def poll_scan_queue(self):
+        """
+        Moves queued scan results into the database. The database is only queried again when a new
+        row sorts inside the visible window (or the window is not full yet); rows sorting before it
+        just move its position.
+        """
+        window_changed = False
+        error = None
+        for _ in range(self.POLL_BATCH):
+            try:
+                file_info = self.scan_queue.get_nowait()
+            except queue.Empty:
+                break
+            if file_info is None:
+                self.scanning = False
+                break
+            if isinstance(file_info, Exception):
+                error = file_info
+                continue
+            self.db.add(file_info)
+            if not ScanDatabase.matches(file_info, **self.filters):
+                continue
+            self.total_rows += 1
+            key = ScanDatabase.sort_key(file_info, self.order_by)
+            if self.view_rows and self.sorts_before(key, ScanDatabase.sort_key(self.view_rows[0], self.order_by)):
+                self.view_start += 1
+            elif len(self.view_rows) < self.VISIBLE_ROWS or not self.sorts_before(ScanDatabase.sort_key(self.view_rows[-1], self.order_by), key):
+                window_changed = True
+        self.db.flush()
+        if window_changed:
+            self.reload_window()
+        self.render_view()
+        if error is not None:
+            messagebox.showerror("Error", f"Scan failed: {error}")
+        if self.scanning:
+            self.master.after(self.POLL_INTERVAL_MS, self.poll_scan_queue)
+
+    def sorts_before(self, key, other):
+        """Whether sort key key comes before other in the current order."""
+        return key > other if self.descending else key < other
+
+    def page_after(self, key, limit, backward=False):
+        return self.db.page_after(key, limit, self.order_by, self.descending, backward, **self.filters)
+
+    def reset_view(self):
+        """Counts the rows matching the filters and shows the first ones (after a filter, sort or database change)."""
+        self.cancel_jump()
+        self.total_rows = self.db.count(**self.filters)
+        self.view_start = 0
+        self.view_rows = self.page_after(None, self.VISIBLE_ROWS)
+        self.render_view()
+
+    def reload_window(self):
+        """Re-reads the rows from the first visible one on, e.g. after new rows were added among them."""
+        if not self.view_rows:
+            self.view_rows = self.page_after(None, self.VISIBLE_ROWS)
+            return
+        first = self.view_rows[0]
+        self.view_rows = [first] + self.page_after(ScanDatabase.sort_key(first, self.order_by), self.VISIBLE_ROWS - 1)
+
+    def render_view(self):
+        """Renders view_rows into the fixed pool of rows and updates the scrollbar and status line."""
+        rows = self.view_rows
+        self.visible_ids = [file_info["id"] for file_info in rows]
+        selected = []
+        for index, item in enumerate(self.row_items):
+            if index < len(rows):
+                file_info = rows[index]
+                self.tree.item(item, values=(file_info["id"], file_info["extension"], file_info["offset"], file_info["size"], f"{file_info['entropy']:.2f}"))
+                self.tree.move(item, "", index)
+                if file_info["id"] in self.selected_ids:
+                    selected.append(item)
+            else:
+                self.tree.detach(item)
+        if selected:
+            self.tree.selection_set(selected)
+        else:
+            self.tree.selection_remove(self.tree.selection())
+        self.render_scrollbar(len(rows))
+        status = f"{self.total_rows} files"
+        if self.selected_ids:
+            status += f", {len(self.selected_ids)} selected"
+        if self.scanning:
+            status += " (scanning...)"
+        self.status_label.config(text=status)
+
+    def on_scroll(self, *args):
+        if args[0] == "moveto":
+            # Dragging only moves the scrollbar; the rows are fetched once the drag pauses.
+            self.view_start = max(0, min(int(float(args[1]) * self.total_rows), self.total_rows - self.VISIBLE_ROWS))
+            self.cancel_jump()
+            self.pending_jump = self.master.after(self.JUMP_DELAY_MS, self.jump)
+            self.render_scrollbar(len(self.view_rows))
+        elif args[0] == "scroll":
+            step = self.VISIBLE_ROWS if args[2] == "pages" else 1
+            self.scroll_rows(int(args[1]) * step)
+
+    def scroll_rows(self, count):
+        """Moves the view count rows down (up if negative), fetching only the rows scrolled in."""
+        self.cancel_jump()
+        if not self.view_rows or len(self.view_rows) < self.VISIBLE_ROWS and count > 0:
+            return
+        count = max(-self.VISIBLE_ROWS, min(count, self.VISIBLE_ROWS))
+        if count > 0:
+            new_rows = self.page_after(ScanDatabase.sort_key(self.view_rows[-1], self.order_by), count)
+            self.view_rows = self.view_rows[len(new_rows):] + new_rows
+            self.view_start += len(new_rows)
+        elif count < 0:
+            new_rows = self.page_after(ScanDatabase.sort_key(self.view_rows[0], self.order_by), -count, backward=True)
+            self.view_rows = new_rows + self.view_rows[:self.VISIBLE_ROWS - len(new_rows)]
+            self.view_start = max(0, self.view_start - len(new_rows))
+        self.render_view()
+
+    def jump(self):
+        """Shows the rows from view_start on (after a scrollbar drag)."""
+        self.pending_jump = None
+        if self.view_start <= 0:
+            self.view_start = 0
+            self.view_rows = self.page_after(None, self.VISIBLE_ROWS)
+        elif self.view_start >= self.total_rows - self.VISIBLE_ROWS:
+            self.view_rows = self.page_after(None, self.VISIBLE_ROWS, backward=True)
+            self.view_start = max(0, self.total_rows - len(self.view_rows))
+        else:
+            key = self.db.key_at(self.view_start - 1, self.order_by, self.descending, **self.filters)
+            self.view_rows = self.page_after(key, self.VISIBLE_ROWS)
+        self.render_view()
+
+    def cancel_jump(self):
+        if self.pending_jump is not None:
+            self.master.after_cancel(self.pending_jump)
+            self.pending_jump = None
+
+    def render_scrollbar(self, shown):
+        if self.total_rows:
+            self.scrollbar.set(self.view_start / self.total_rows, min(self.view_start + shown, self.total_rows) / self.total_rows)
+        else:
+            self.scrollbar.set(0, 1)
+
+    def on_mousewheel(self, event):
+        if getattr(event, "num", None) == 4 or getattr(event, "delta", 0) > 0:
+            self.on_scroll("scroll", -3, "units")
+        else:
+            self.on_scroll("scroll", 3, "units")
+        return "break"
+
+    def on_select(self, event):
+        # Selection is tracked by file id so it survives scrolling, sorting and filtering.
+        selected_items = set(self.tree.selection())
+        for item, file_id in zip(self.row_items, self.visible_ids):
+            if item in selected_items:
+                self.selected_ids.add(file_id)
+            else:
+                self.selected_ids.discard(file_id)
+
+    def sort_by(self, column):
+        order_by = self.SORT_COLUMNS[column]
+        self.descending = not self.descending if order_by == self.order_by else False
+        self.order_by = order_by
+        self.reset_view()
 
-    def update_treeview(self):
-        # Clear the treeview.
-        for item in self.tree.get_children():
-            self.tree.delete(item)
-        # Insert each found file's details.
-        for file_info in self.found_files:
-            self.tree.insert("", tk.END, values=(file_info["id"], file_info["extension"], file_info["offset"], file_info["size"], f"{file_info['entropy']:.2f}"))
+    def refresh_type_filter(self):
+        self.type_filter["values"] = ["All"] + self.db.extensions()
+
+    def apply_filter(self):
+        filters = {}
+        extension = self.type_filter.get().strip()
+        if extension and extension != "All":
+            filters["extension"] = extension
+        try:
+            for key, entry, convert in (("min_size", self.min_size_entry, int), ("min_entropy", self.min_entropy_entry, float), ("max_entropy", self.max_entropy_entry, float)):
+                value = entry.get().strip()
+                if value:
+                    filters[key] = convert(value)
+        except ValueError:
+            messagebox.showerror("Error", "Filter values must be numbers.")
+            return
+        self.filters = filters
+        self.reset_view()
 
     def recover_selected(self):
         if not self.destination_path:
             messagebox.showerror("Error", "Please select a destination folder.")
             return
-        selected_items = self.tree.selection()
-        if not selected_items:
+        if not self.selected_ids:
             messagebox.showerror("Error", "Please select files to recover.")
             return
-        for item in selected_items:
-            file_info = self.tree.item(item, "values")
-            fragment = {"id": int(file_info[0]), "extension": file_info[1], "offset": int(file_info[2]), "size": int(file_info[3])}
-            recovered_path = file_carver.recover_fragment(self.drive_path, fragment, self.destination_path)
-            print(f"Recovered: {recovered_path}")
+        if self.recovery_thread is not None:
+            messagebox.showerror("Error", "A recovery is already running.")
+            return
+        fragments = [self.db.get(file_id) for file_id in sorted(self.selected_ids)]
+        self.recovery_progress = (0, len(fragments), 0, sum(fragment["size"] for fragment in fragments), 0.0)
+        self.recovery_error = None
+        # Recover in the background; progress is read back on the Tk thread by poll_recovery.
+        self.recovery_thread = threading.Thread(target=self.recovery_worker, args=(fragments,), daemon=True)
+        self.recovery_thread.start()
+        self.master.after(self.POLL_INTERVAL_MS, self.poll_recovery)
         messagebox.showinfo("Info", "Recovery process initiated for selected files.")
 
+    def recovery_worker(self, fragments):
+        # Errors cannot be shown from this thread; poll_recovery reports them once it has ended.
+        try:
+            self.carver.recover_fragments(self.drive_path, fragments, self.destination_path, progress=self.set_recovery_progress)
+        except Exception as e:
+            self.recovery_error = e
+
+    def set_recovery_progress(self, *progress):
+        # Called from recovery threads; a single attribute assignment is safe to hand over.
+        self.recovery_progress = progress
+
+    def poll_recovery(self):
+        files_done, files_total, bytes_done, bytes_total, bytes_per_second = self.recovery_progress
+        self.recovery_label.config(text=f"Recovered {files_done}/{files_total} files ({bytes_per_second / (1024 * 1024):.1f} MB/s)")
+        if self.recovery_thread.is_alive():
+            self.master.after(self.POLL_INTERVAL_MS, self.poll_recovery)
+        else:
+            self.recovery_thread = None
+            if self.recovery_error is not None:
+                messagebox.showerror("Error", f"Recovery failed: {self.recovery_error}")
+                self.recovery_error = None
+
     def save_db(self):
-        if not self.found_files:
+        if not len(self.db):
             messagebox.showerror("Error", "No files found to save.")
             return
-        path = filedialog.asksaveasfilename(title="Save DB", defaultextension=".json", filetypes=[("JSON Files", "*.json")])
+        path = filedialog.asksaveasfilename(title="Save DB", defaultextension=".db", filetypes=[("Scan Database", "*.db"), ("JSON Files", "*.json")])
         if path:
-            with open(path, "w") as f:
-                json.dump(self.found_files, f, indent=4)
+            if path.lower().endswith(".json"):
+                self.db.export_json(path)
+            else:
+                self.db.save(path)
             messagebox.showinfo("Info", f"Database saved to {path}")
 
     def load_db(self):
-        path = filedialog.askopenfilename(title="Load DB", filetypes=[("JSON Files", "*.json")])
+        path = filedialog.askopenfilename(title="Load DB", filetypes=[("Scan Database", "*.db"), ("JSON Files", "*.json")])
         if path:
-            with open(path, "r") as f:
-                self.found_files = json.load(f)
-            self.update_treeview()
+            try:
+                if path.lower().endswith(".json"):
+                    # Imported into a new database, so a bad file leaves the current results untouched.
+                    db = ScanDatabase()
+                    try:
+                        db.import_json(path)
+                    except BaseException:
+                        db.close()
+                        raise
+                    self.db.close()
+                    self.db = db
+                else:
+                    self.db.load(path)
+            except (OSError, ValueError) as e:
+                messagebox.showerror("Error", f"Could not load database: {e}")
+                return
+            finally:
+                self.selected_ids.clear()
+                self.reset_view()
             messagebox.showinfo("Info", f"Loaded database from {path}")
 
 
@@ -0,0 +1,189 @@
+# test_carver.py
+
+"""
+Consistency tests of the carving engine on a small synthetic image (see
+benchmarks/synthetic_image): the scan modes find the same files, the
+incremental FragmentAssembler matches get_fragments, an interrupted journaled
+scan resumes to the same result, and scan databases survive a JSON round trip.
+
+Run from the repository root with python -m unittest (or pytest).
+"""
+
+import mmap
+import os
+import random
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from benchmarks.synthetic_image import generate_image
+from file_carver import FILE_CARVER
+from lib.fragment_assembler import FragmentAssembler
+from lib.scan_db import ScanDatabase
+
+IMAGE_SIZE = 4 * 1024 * 1024
+SHARD_SIZE = 1024 * 1024
+
+
+def comparable(found_files):
+    """Found files as sorted tuples, independent of the order (and so the ids) a mode reports them in."""
+    return sorted((f["extension"], f["offset"], f["size"], round(f["entropy"], 6), str(f.get("fragments"))) for f in found_files)
+
+
+class CarverTestCase(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.mkdtemp()
+        cls.image_path = os.path.join(cls.directory, "image.img")
+        cls.truth = generate_image(cls.image_path, IMAGE_SIZE, seed=1)
+        cls.expected = FILE_CARVER().scan_drive(cls.image_path)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.directory)
+
+
+class ScanModeTest(CarverTestCase):
+
+    def test_image_has_files(self):
+        intact = {(t["extension"], t["offset"]) for t in self.truth if t["kind"] == "intact"}
+        found = {(f["extension"], f["offset"]) for f in self.expected}
+        self.assertTrue(intact)
+        self.assertTrue(intact & found)
+
+    def test_streaming_matches_mmap(self):
+        found = FILE_CARVER().scan_drive(self.image_path, streaming=True, chunk_size=256 * 1024)
+        self.assertEqual(comparable(found), comparable(self.expected))
+
+    def test_parallel_matches_mmap(self):
+        found = FILE_CARVER().scan_drive_parallel(self.image_path, workers=2, shard_size=SHARD_SIZE)
+        self.assertEqual(comparable(found), comparable(self.expected))
+
+    def test_pipeline_matches_mmap(self):
+        carver = FILE_CARVER()
+        carver.MIN_SHARD_SIZE = SHARD_SIZE
+        found = carver.carve_pipeline(self.image_path, workers=2)
+        self.assertEqual(comparable(found), comparable(self.expected))
+        self.assertEqual([f["id"] for f in found], list(range(1, len(found) + 1)))
+
+
+class FragmentAssemblerTest(CarverTestCase):
+
+    def assemble(self, assembler, headers, footers, cuts):
+        fragments = []
+        previous = 0
+        for cut in cuts:
+            fed_footers = [offset for offset in footers if previous <= offset < cut] if footers is not None else None
+            fragments += assembler.feed([offset for offset in headers if previous <= offset < cut], fed_footers, cut)
+            previous = cut
+        return fragments + assembler.finish()
+
+    def test_matches_get_fragments_on_image(self):
+        carver = FILE_CARVER()
+        signatures = carver.signature_set(None)
+        with open(self.image_path, "rb") as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                read = lambda position, length: mm[position:position + length]
+                occurrences = carver.find_signature_occurrences(mm, signatures)
+                cuts = list(range(SHARD_SIZE, IMAGE_SIZE, SHARD_SIZE)) + [IMAGE_SIZE]
+                for sig in signatures:
+                    headers = occurrences[sig["header"]]
+                    footers = occurrences[sig["footer"]] if sig["footer"] else None
+                    max_length = carver.max_carve_length(sig)
+                    size_parser = carver.get_size_parser(sig)
+                    expected = carver.get_fragments(mm, sig["header"], sig["footer"], 64 * 1024, headers=headers, footers=footers, max_length=max_length, size_parser=size_parser)
+                    assembler = FragmentAssembler(sig["header"], sig["footer"], 64 * 1024, IMAGE_SIZE, max_length, size_parser, read)
+                    self.assertEqual(sorted(self.assemble(assembler, headers, footers, cuts)), sorted(expected), sig["extension"])
+            finally:
+                mm.close()
+
+    def test_matches_get_fragments_on_random_offsets(self):
+        carver = FILE_CARVER()
+        rng = random.Random(5)
+        for _ in range(300):
+            size = rng.randint(100, 5000)
+            data = bytes(rng.randrange(256) for _ in range(size))
+            read = lambda position, length: data[position:position + length]
+            headers = sorted(rng.sample(range(size - 2), rng.randint(0, 12)))
+            footers = sorted(rng.sample(range(size - 2), rng.randint(0, 12))) if rng.random() < 0.7 else None
+            footer = b"ZZ" if footers is not None else None
+            gap_threshold = rng.randint(1, 600)
+            max_length = rng.randint(10, 3000)
+            empty_starts = sorted(rng.sample(range(size), rng.randint(0, 4))) if rng.random() < 0.5 else None
+            expected = carver.get_fragments(None, b"AB", footer, gap_threshold, headers=headers, footers=footers, image_size=size, max_length=max_length, read=read, empty_starts=empty_starts)
+            assembler = FragmentAssembler(b"AB", footer, gap_threshold, size, max_length, None, read, empty_starts)
+            cuts = sorted(rng.sample(range(size), rng.randint(0, 6))) + [size]
+            self.assertEqual(sorted(self.assemble(assembler, headers, footers, cuts)), sorted(expected))
+
+
+class JournalTest(CarverTestCase):
+
+    def setUp(self):
+        self.journal_path = os.path.join(self.directory, "scan.journal")
+        if os.path.exists(self.journal_path):
+            os.remove(self.journal_path)
+
+    def interrupted(self, carver, method, calls):
+        """Runs a journaled scan that raises KeyboardInterrupt on the given call of FILE_CARVER.method."""
+        original = getattr(FILE_CARVER, method)
+        counter = [0]
+
+        def interrupt(self, *args, **kwargs):
+            counter[0] += 1
+            if counter[0] == calls:
+                raise KeyboardInterrupt
+            return original(self, *args, **kwargs)
+
+        with mock.patch.object(FILE_CARVER, method, interrupt), self.assertRaises(KeyboardInterrupt):
+            carver.scan_drive_journaled(self.image_path, self.journal_path, checkpoint_interval=SHARD_SIZE)
+
+    def test_resume_after_interrupted_search(self):
+        carver = FILE_CARVER()
+        self.interrupted(carver, "find_signature_occurrences", 3)
+        self.assertEqual(comparable(carver.scan_drive_journaled(self.image_path, self.journal_path, checkpoint_interval=SHARD_SIZE)), comparable(self.expected))
+
+    def test_resume_after_interrupted_verification(self):
+        carver = FILE_CARVER()
+        carver.CHECKPOINT_CANDIDATES = 5
+        self.interrupted(carver, "verify_range", 12)
+        with mock.patch.object(FILE_CARVER, "find_signature_occurrences", side_effect=AssertionError("searched again")):
+            found = carver.scan_drive_journaled(self.image_path, self.journal_path, checkpoint_interval=SHARD_SIZE)
+        self.assertEqual(comparable(found), comparable(self.expected))
+
+    def test_torn_journal_tail(self):
+        carver = FILE_CARVER()
+        carver.scan_drive_journaled(self.image_path, self.journal_path, checkpoint_interval=SHARD_SIZE)
+        with open(self.journal_path, "a") as f:
+            f.write('{"type": "verify", "ne')
+        self.assertEqual(comparable(carver.scan_drive(self.image_path, journal_path=self.journal_path)), comparable(self.expected))
+
+
+class ScanDatabaseJsonTest(CarverTestCase):
+
+    def test_round_trip(self):
+        found_files = [dict(file_info) for file_info in self.expected]
+        found_files[-1]["duplicate_of"] = found_files[0]["id"]
+        found_files[0]["fragments"] = [[found_files[0]["offset"], found_files[0]["offset"] + 4096], [8192, 8192 + found_files[0]["size"] - 4096]]
+        db = ScanDatabase()
+        db.add_many(found_files)
+        path = os.path.join(self.directory, "scan.json")
+        db.export_json(path)
+        imported = ScanDatabase()
+        imported.import_json(path)
+        self.assertEqual(list(imported), list(db))
+        self.assertEqual(imported.get(found_files[0]["id"])["fragments"], found_files[0]["fragments"])
+        self.assertEqual(imported.get(found_files[-1]["id"])["duplicate_of"], found_files[0]["id"])
+
+    def test_invalid_row(self):
+        path = os.path.join(self.directory, "bad.json")
+        with open(path, "w") as f:
+            f.write('[{"id": 1, "extension": "jpg", "offset": 0, "size": 10, "entropy": 7.5}, {"id": 2}]')
+        with self.assertRaises(ValueError):
+            ScanDatabase().import_json(path)
+
+
+if __name__ == "__main__":
+    unittest.main()